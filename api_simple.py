@@ -1,25 +1,103 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import BackgroundTasks, FastAPI, File, UploadFile, Form, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-import shutil
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
 import os
 import json
+import re
+import time
+import uuid
 from datetime import datetime
 from pathlib import Path
 
 # Import des modules existants
-from parser_cv import extract_cv_content
-from generateur_lettre_pdf import generer_lettre
-from langdetect import detect
-
-app = FastAPI(title="Générateur de Lettre de Motivation", version="1.0.0")
+from batch import (BATCH_MAX_CONCURRENT, BATCH_MAX_OFFERS, BATCH_MAX_PARALLELISM, BATCH_PARALLELISM, get_batch_pool,
+                   normalize_offers, stream_batch_zip)
+from cv_cache import cached_sha256, get_cv_content
+from cv_db import CVDatabase
+from cv_profile import cv_for_prompt, get_cv_profile, load_profile
+from cv_store import CV_MAX_BYTES, CVTooLargeError, NotAPDFError, blob_path, make_cv_id, read_cv_upload, store_cv_bytes
+from generateur_lettre_pdf import (compter_tokens, generer_texte_lettre, generer_texte_lettre_flux, generer_pdf_lettre,
+                                   stats_arrets)
+from jobs import JobQueue, JobWorkerPool
+from language_id import identify_language, language_of, stats as language_stats
+from letter_cache import LetterCache, find_similar_letter, find_similar_letters, letter_key, remember_offer
+from llm_limits import llm_limiter
+from llm_router import stats as llm_router_stats
+from metrics import instrument_app, register_gauge, render_metrics
+from near_duplicates import NEAR_DUP_REUSE, get_offer_index
+from offer_cleaner import clean_offer, stats as offer_cleaner_stats
+from offer_fetcher import (
+    OFFER_FETCH_PARALLELISM, InvalidOfferURLError, OfferFetchError, browser_pool,
+    fetch_offer_page, fetch_offers, stats as offer_fetcher_stats
+)
+from prefix_cache import prefix_cache
+from prompt_builder import stats as prompt_stats
+from warmup import is_ready, keep_warm, status as warmup_status, warm_up
+from worker_pool import QueueFullError, SingleFlight, call_cpu, iterate_blocking, run_blocking, run_cpu
 
 # Dossier de stockage des CV
 CV_STORAGE_DIR = Path("cv_storage")
 CV_STORAGE_DIR.mkdir(exist_ok=True)
 
-# Fichier de métadonnées des CV
+# Métadonnées des CV (SQLite) ; l'ancien fichier JSON est migré au premier démarrage
 CV_METADATA_FILE = CV_STORAGE_DIR / "cv_metadata.json"
+CV_DATABASE_FILE = CV_STORAGE_DIR / "cv_metadata.db"
+cv_db = CVDatabase(CV_DATABASE_FILE, legacy_json=CV_METADATA_FILE)
+
+# Taille maximale d'une requête : le CV plus une marge pour les champs texte (offres d'un lot)
+MAX_REQUEST_BYTES = CV_MAX_BYTES + 5 * 1024 * 1024
+
+# Lettres générées en streaming, téléchargeables pendant LETTERS_TTL secondes
+LETTERS_DIR = Path("generated_letters")
+LETTERS_DIR.mkdir(exist_ok=True)
+LETTERS_TTL = int(os.environ.get("LETTERS_TTL", "3600"))
+
+# Mesures des dernières générations en streaming (time-to-first-token, tokens/s)
+STREAM_STATS = deque(maxlen=200)
+
+# Cache des lettres déjà générées (texte + PDF) et regroupement des demandes identiques
+letter_cache = LetterCache()
+letter_generations = SingleFlight()
+
+# Lots en cours d'envoi (au plus BATCH_MAX_CONCURRENT, chacun sur un thread de get_batch_pool)
+running_batches = 0
+
+# File de jobs persistante et workers du processus (JOB_WORKERS=0 pour les lancer à part)
+job_queue = JobQueue()
+job_workers = JobWorkerPool(job_queue, letter_cache=letter_cache)
+register_gauge("jobs", "Jobs par état", job_queue.counts, label="status")
+register_gauge("job_workers_busy", "Workers de jobs occupés", lambda: job_workers.busy)
+register_gauge("browsers_open", "Navigateurs headless ouverts", lambda: browser_pool.stats()["open"])
+
+@asynccontextmanager
+async def lifespan(app):
+    # Préchauffage en tâche de fond (profils de langue, PDF, modèle) : /health répond
+    # tout de suite, /ready quand la première lettre sera servie à pleine vitesse
+    warming = asyncio.create_task(warm_up())
+    keeping = asyncio.create_task(keep_warm())
+    job_workers.start()
+    yield
+    warming.cancel()
+    keeping.cancel()
+    job_workers.stop()
+    await run_blocking(browser_pool.close)
+
+app = FastAPI(title="Générateur de Lettre de Motivation", version="1.0.0", lifespan=lifespan)
+
+@app.middleware("http")
+async def limit_request_size(request, call_next):
+    """Refuse un upload trop gros d'après Content-Length, avant de lire le corps"""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > MAX_REQUEST_BYTES:
+        return JSONResponse(status_code=413, content={"detail": f"Requête trop volumineuse (CV limité à "
+                                                                f"{CV_MAX_BYTES / (1024 * 1024):g} Mo)"})
+    return await call_next(request)
+
+# Histogramme par route et en-tête Server-Timing (durée de chaque étape de la requête)
+instrument_app(app)
 
 # Configuration CORS pour permettre les requêtes depuis l'extension
 app.add_middleware(
@@ -30,6 +108,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request, exc):
+    """Refus rapide quand la file d'attente des générations est pleine"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.get("/")
 async def root():
     return {"message": "API Générateur de Lettre de Motivation"}
@@ -39,166 +126,600 @@ async def generate_letter(
     offre_content: str = Form(...),
     langue: str = Form(...),
     cv_file: UploadFile = File(None),
-    cv_id: str = Form(None)
+    cv_id: str = Form(None),
+    force_regenerate: bool = Form(False),
+    offre_url: str = Form(None)
 ):
     """
     Génère une lettre de motivation à partir d'une offre d'emploi et d'un CV
     Peut utiliser un nouveau CV (cv_file) ou un CV existant (cv_id)
+    Une lettre déjà générée pour le même CV et la même offre est resservie depuis
+    le cache, sauf si force_regenerate est vrai ; de même pour une offre quasi identique
+    (offre republiée, X-Cache: NEAR et X-Similarity)
     """
     try:
-        cv_content = None
-        used_cv_id = None
-        
-        if cv_id:
-            # Utiliser un CV existant
-            metadata = load_cv_metadata()
-            if cv_id not in metadata:
-                raise HTTPException(status_code=404, detail="CV non trouvé")
-            
-            cv_path = metadata[cv_id]["path"]
-            if not os.path.exists(cv_path):
-                raise HTTPException(status_code=404, detail="Fichier CV non trouvé")
-            
-            # Parser le CV existant
-            cv_content = extract_cv_content(cv_path)
-            used_cv_id = cv_id
-            
-            # Mettre à jour la date d'utilisation
-            metadata[cv_id]["last_used"] = datetime.now().isoformat()
-            save_cv_metadata(metadata)
-            
-        elif cv_file:
-            # Utiliser un nouveau CV
-            if not cv_file.filename.endswith('.pdf'):
-                raise HTTPException(status_code=400, detail="Le CV doit être un fichier PDF")
-            
-            # Générer un ID pour le nouveau CV
-            used_cv_id = get_or_create_cv_id(cv_file)
-            
-            # Sauvegarder le nouveau CV
-            cv_path = save_cv_file(cv_file, used_cv_id)
-            
-            # Parser le nouveau CV
-            cv_content = extract_cv_content(cv_path)
-            
-            # Ajouter aux métadonnées
-            metadata = load_cv_metadata()
-            metadata[used_cv_id] = {
-                "id": used_cv_id,
-                "original_filename": cv_file.filename,
-                "upload_date": datetime.now().isoformat(),
-                "last_used": datetime.now().isoformat(),
-                "path": cv_path
-            }
-            save_cv_metadata(metadata)
-            
-        else:
-            raise HTTPException(status_code=400, detail="Aucun CV fourni (cv_file ou cv_id requis)")
+        cv, used_cv_id = await resolve_cv(cv_file, cv_id)
+        offre_content = await run_blocking(clean_offer, offre_content, offre_url)
         
-        # Détecter la langue si pas fournie ou invalide
+        # Détecter la langue si pas fournie ou invalide (anglais par défaut)
         if not langue or langue == "auto":
-            try:
-                langue = detect(offre_content)
-            except Exception:
-                langue = "en"  # Défaut anglais
+            langue = await run_blocking(language_of, offre_content)
         
-        # Générer la lettre de motivation (PDF)
-        pdf_content = generer_lettre(cv_content, offre_content, langue)
+        cache_key = letter_key(cv["sha256"], offre_content, langue)
+        if not force_regenerate:
+            cached = await run_blocking(get_cached_letter, cache_key, cv["profile"])
+            if cached is not None:
+                return pdf_response(cached["pdf"], cache_status="HIT")
+            if NEAR_DUP_REUSE:
+                similar = await run_blocking(get_similar_letter, cv, offre_content, langue)
+                if similar is not None:
+                    return pdf_response(similar["pdf"], cache_status="NEAR", similarity=similar["similarity"])
         
-        # Retourner le PDF en tant que fichier téléchargeable
-        return Response(
-            content=pdf_content,
-            media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=lettre_motivation.pdf"}
+        # Refuser tout de suite si la file des générations est pleine
+        llm_limiter.check()
+        
+        # Deux demandes identiques simultanées (double clic) partagent la même génération
+        entry = await letter_generations.run(
+            cache_key, lambda: produce_letter(cache_key, cv, offre_content, langue, offre_url)
         )
+        return pdf_response(entry["pdf"], cache_status="MISS")
         
+    except (HTTPException, QueueFullError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la génération: {str(e)}")
+
+@app.post("/generate-letter/stream")
+async def generate_letter_stream(
+    offre_content: str = Form(...),
+    langue: str = Form(...),
+    cv_file: UploadFile = File(None),
+    cv_id: str = Form(None),
+    force_regenerate: bool = Form(False),
+    offre_url: str = Form(None)
+):
+    """
+    Génère la lettre en streaming (Server-Sent Events) :
+    - événements "token" avec le texte au fil de la génération
+    - événement final "done" avec l'URL de téléchargement du PDF et les mesures
+    """
+    started = time.perf_counter()
+    try:
+        cv, used_cv_id = await resolve_cv(cv_file, cv_id)
+        offre_content = await run_blocking(clean_offer, offre_content, offre_url)
+        if not langue or langue == "auto":
+            langue = await run_blocking(language_of, offre_content)
+        cache_key = letter_key(cv["sha256"], offre_content, langue)
+        cached = None if force_regenerate else await run_blocking(get_cached_letter, cache_key, cv["profile"])
+        if cached is None and not force_regenerate and NEAR_DUP_REUSE:
+            cached = await run_blocking(get_similar_letter, cv, offre_content, langue)
+        if cached is None:
+            llm_limiter.check()
+    except (HTTPException, QueueFullError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération: {str(e)}")
+    
+    async def events():
+        chunks = []
+        first_token_at = None
+        try:
+            if cached is not None:
+                # Lettre déjà générée : tout le texte est envoyé d'un coup
+                letter_id = await run_blocking(save_generated_letter, cached["pdf"])
+                yield sse_event("token", {"text": cached["text"]})
+                yield sse_event("done", {
+                    "letter_id": letter_id,
+                    "download_url": f"/letters/{letter_id}",
+                    "cv_id": used_cv_id,
+                    "langue": langue,
+                    "cached": True,
+                    "similarity": cached.get("similarity"),
+                    "total": round(time.perf_counter() - started, 3)
+                })
+                return
+            
+            async with llm_limiter.slot():
+                async for chunk in iterate_blocking(generer_texte_lettre_flux, cv_for_prompt(cv), offre_content, langue):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    chunks.append(chunk)
+                    yield sse_event("token", {"text": chunk})
+            finished_at = time.perf_counter()
+            
+            lettre_content = ''.join(chunks).strip()
+            pdf_content = await run_cpu(generer_pdf_lettre, lettre_content, langue, cv["profile"])
+            await run_blocking(letter_cache.put, cache_key, lettre_content, langue, pdf_content)
+            await run_blocking(remember_offer, cv["sha256"], offre_content, langue, cache_key, offre_url)
+            letter_id = await run_blocking(save_generated_letter, pdf_content)
+            
+            # Les morceaux relayés sont des phrases, pas des tokens : estimation sur le texte
+            tokens = compter_tokens(lettre_content, langue)
+            stats = {
+                "ttft": round((first_token_at or finished_at) - started, 3),
+                "tokens": tokens,
+                "tokens_per_sec": round(tokens / (finished_at - first_token_at), 2)
+                if first_token_at and finished_at > first_token_at else None,
+                "total": round(time.perf_counter() - started, 3),
+            }
+            STREAM_STATS.append(stats)
+            yield sse_event("done", {
+                "letter_id": letter_id,
+                "download_url": f"/letters/{letter_id}",
+                "cv_id": used_cv_id,
+                "langue": langue,
+                "cached": False,
+                **stats
+            })
+        except QueueFullError as e:
+            yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Erreur lors de la génération: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/generate-letter/stream/stats")
+async def stream_stats():
+    """Statistiques des dernières générations en streaming"""
+    stats = list(STREAM_STATS)
+    ttfts = sorted(s["ttft"] for s in stats)
+    rates = [s["tokens_per_sec"] for s in stats if s["tokens_per_sec"]]
+    return {
+        "count": len(stats),
+        "ttft_p50": ttfts[len(ttfts) // 2] if ttfts else None,
+        "ttft_p95": ttfts[int(len(ttfts) * 0.95)] if ttfts else None,
+        "tokens_per_sec_avg": round(sum(rates) / len(rates), 2) if rates else None,
+        "stop_reasons": stats_arrets(),
+        "recent": stats[-20:]
+    }
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Compteurs de succès / échecs des caches et de l'index des offres quasi identiques"""
+    return {"letters": letter_cache.stats(), "offers": await run_blocking(get_offer_index().stats)}
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """
+    Générations par serveur LLM (en cours, réussies, en échec, état de santé) quand
+    LLM_URLS répartit la charge, et file d'attente des générations de l'API
+    """
+    return {**llm_router_stats(), "queue": llm_limiter.stats()}
+
+@app.get("/prompt/stats")
+async def prompt_builder_stats():
+    """
+    Tokens économisés par la réduction du CV et de l'offre, par le nettoyage des offres
+    et par la réutilisation du contexte du préfixe (instructions + CV) côté serveur
+    """
+    return {**prompt_stats(), "offers": offer_cleaner_stats(), "prefix_cache": prefix_cache.stats()}
+
+@app.get("/letters/{letter_id}")
+async def download_letter(letter_id: str):
+    """Télécharge une lettre générée par /generate-letter/stream"""
+    if not re.fullmatch(r"[0-9a-f]{32}", letter_id):
+        raise HTTPException(status_code=404, detail="Lettre non trouvée")
+    letter_path = LETTERS_DIR / f"{letter_id}.pdf"
+    if not letter_path.exists():
+        raise HTTPException(status_code=404, detail="Lettre non trouvée ou expirée")
+    return FileResponse(letter_path, media_type="application/pdf", filename="lettre_motivation.pdf")
+
+@app.post("/batch/generate-letters")
+async def batch_generate_letters(
+    offers: str = Form(...),
+    cv_file: UploadFile = File(None),
+    cv_id: str = Form(None),
+    parallelism: int = Form(BATCH_PARALLELISM),
+    force_regenerate: bool = Form(False)
+):
+    """
+    Génère une lettre par offre avec le même CV et renvoie une archive ZIP
+    (un PDF par offre + manifest.json avec l'état de chaque offre).
+    offers : liste JSON de textes ou d'objets {"content", "title", "langue", "url"}
+    """
+    try:
+        offers_list = json.loads(offers)
+        if not isinstance(offers_list, list) or not offers_list:
+            raise ValueError("offers doit être une liste JSON non vide")
+        if len(offers_list) > BATCH_MAX_OFFERS:
+            raise ValueError(f"{BATCH_MAX_OFFERS} offres maximum par lot")
+        normalize_offers(offers_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Offres invalides: {str(e)}")
+    
+    try:
+        cv, used_cv_id = await resolve_cv(cv_file, cv_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la lecture du CV: {str(e)}")
+    
+    parallelism = min(max(1, parallelism), BATCH_MAX_PARALLELISM)
+    # Les lettres du lot prennent les mêmes places du LLM que les autres requêtes : refus
+    # immédiat (503) si la file est déjà pleine, ou si trop de lots sont déjà en cours
+    llm_limiter.check()
+    if running_batches >= BATCH_MAX_CONCURRENT:
+        raise QueueFullError(llm_limiter.retry_after())
+    return StreamingResponse(
+        stream_batch(cv, offers_list, parallelism, force_regenerate),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=lettres_motivation.zip"}
+    )
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    offre_content: str = Form(...),
+    langue: str = Form("auto"),
+    cv_file: UploadFile = File(None),
+    cv_id: str = Form(None),
+    force_regenerate: bool = Form(False),
+    offre_url: str = Form(None)
+):
+    """
+    Enregistre une demande de génération et répond immédiatement avec l'identifiant du job
+    """
+    try:
+        cv, used_cv_id = await resolve_cv(cv_file, cv_id)
+        offre_content = await run_blocking(clean_offer, offre_content, offre_url)
+        job_id = await run_blocking(
+            job_queue.submit, cv["path"], offre_content, langue,
+            cv_id=used_cv_id, cv_sha256=cv["sha256"], force_regenerate=force_regenerate
+        )
+        return {
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+            "result_url": f"/jobs/{job_id}/result"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la création du job: {str(e)}")
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """État et progression d'un job"""
+    job = await run_blocking(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job non trouvé ou expiré")
+    return job_queue.public(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """PDF généré par un job terminé"""
+    job = await run_blocking(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job non trouvé ou expiré")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la génération: {job['error']}")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job pas encore terminé ({job['progress']})")
+    return FileResponse(job["result_path"], media_type="application/pdf", filename="lettre_motivation.pdf")
 
 @app.post("/detect-language")
-async def detect_language(content: str = Form(...)):
+async def detect_language(content: str = Form(...), url: str = Form(None)):
     """
-    Détecte la langue d'un texte
+    Détecte la langue d'un texte (nettoyé comme une offre)
     """
     try:
-        langue = detect(content)
-        return {"langue": langue}
+        # Simple détection : l'offre n'enrichit pas les statistiques du domaine
+        content = await run_blocking(clean_offer, content, url, False)
+        result = await run_blocking(identify_language, content)
+        return {"langue": result["langue"], "confidence": result["confidence"]}
     except Exception as e:
         return {"langue": "en", "error": str(e)}
 
+@app.post("/detect-language/batch")
+async def detect_language_batch(texts: str = Form(...)):
+    """
+    Détecte la langue de plusieurs textes en une requête.
+    texts : liste JSON de textes ou d'objets {"content", "url"} (nettoyés comme des offres)
+    """
+    try:
+        items = json.loads(texts)
+        if not isinstance(items, list) or not items:
+            raise ValueError("texts doit être une liste JSON non vide")
+        if len(items) > BATCH_MAX_OFFERS:
+            raise ValueError(f"{BATCH_MAX_OFFERS} textes maximum par lot")
+        items = [item if isinstance(item, dict) else {"content": item} for item in items]
+        if not all(isinstance(item.get("content"), str) for item in items):
+            raise ValueError("chaque texte doit être une chaîne ou un objet avec 'content'")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Textes invalides: {str(e)}")
+
+    def detect_all():
+        results = []
+        for item in items:
+            result = identify_language(clean_offer(item["content"], item.get("url"), learn=False))
+            results.append({"langue": result["langue"], "confidence": result["confidence"]})
+        return results
+
+    return {"results": await run_blocking(detect_all)}
+
+@app.get("/detect-language/stats")
+async def detect_language_stats():
+    """Détections, hits du cache et temps passé depuis le démarrage"""
+    return language_stats()
+
+@app.post("/offers/fetch")
+async def fetch_offer_text(url: str = Form(...)):
+    """
+    Récupère le texte nettoyé et la langue d'une offre à partir de son URL
+    (requests, puis navigateur headless si la page est rendue en JavaScript)
+    """
+    try:
+        return await run_blocking(fetch_offer_page, url)
+    except InvalidOfferURLError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OfferFetchError as e:
+        raise HTTPException(status_code=502, detail=f"Offre non récupérée: {str(e)}")
+
+@app.post("/offers/fetch/bulk")
+async def fetch_offer_texts(urls: str = Form(...), parallelism: int = Form(OFFER_FETCH_PARALLELISM)):
+    """
+    Récupère plusieurs offres en parallèle (requêtes limitées par site, pages en cache).
+    urls : liste JSON d'URL. Chaque résultat a "status" ("ok" ou "error") ; les offres
+    récupérées peuvent être envoyées telles quelles à /batch/generate-letters.
+    """
+    try:
+        urls_list = json.loads(urls)
+        if not isinstance(urls_list, list) or not urls_list or not all(isinstance(u, str) for u in urls_list):
+            raise ValueError("urls doit être une liste JSON non vide d'URL")
+        if len(urls_list) > BATCH_MAX_OFFERS:
+            raise ValueError(f"{BATCH_MAX_OFFERS} URL maximum par lot")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"URL invalides: {str(e)}")
+
+    parallelism = min(max(1, parallelism), OFFER_FETCH_PARALLELISM)
+    # Les URL sont vérifiées (résolution DNS comprise) dans le pool, avant la première requête
+    try:
+        results = await run_blocking(fetch_offers, urls_list, parallelism)
+    except InvalidOfferURLError as e:
+        raise HTTPException(status_code=400, detail=f"URL invalides: {str(e)}")
+    return {
+        "total": len(results),
+        "succeeded": sum(1 for r in results if r["status"] == "ok"),
+        "results": results,
+    }
+
+@app.post("/offers/similar")
+async def similar_offers(
+    offre_content: str = Form(...),
+    langue: str = Form("auto"),
+    cv_file: UploadFile = File(None),
+    cv_id: str = Form(None),
+    offre_url: str = Form(None),
+    threshold: float = Form(None, ge=0, le=1)
+):
+    """
+    Lettres déjà générées avec ce CV pour des offres quasi identiques (offre republiée sur
+    un autre site...), les plus proches d'abord, à reprendre comme point de départ.
+    threshold : similarité minimale (NEAR_DUP_THRESHOLD par défaut)
+    """
+    try:
+        cv, used_cv_id = await resolve_cv(cv_file, cv_id)
+        offre_content = await run_blocking(clean_offer, offre_content, offre_url)
+        if not langue or langue == "auto":
+            langue = await run_blocking(language_of, offre_content)
+        matches = await run_blocking(find_similar_letters, letter_cache, cv["sha256"], offre_content, langue, threshold)
+        return {"cv_id": used_cv_id, "langue": langue, "matches": matches}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la recherche: {str(e)}")
+
+@app.get("/offers/fetch/stats")
+async def fetch_offer_stats():
+    """Offres récupérées par méthode et état du pool de navigateurs"""
+    return offer_fetcher_stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Mesures au format texte Prometheus (durées par étape, erreurs, tailles, files d'attente)"""
+    return Response(await run_blocking(render_metrics), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     """
-    Vérification de l'état de l'API
+    Vérification de l'état de l'API (répond dès le démarrage, "ready" une fois préchauffée)
     """
-    return {"status": "healthy", "message": "API fonctionnelle"}
+    if not is_ready():
+        return {"status": "warming_up", "ready": False, "message": "API démarrée, préchauffage en cours"}
+    return {"status": "healthy", "ready": True, "message": "API fonctionnelle"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Prête à servir une lettre à pleine vitesse : 503 tant que le préchauffage n'est pas terminé"""
+    state = warmup_status()
+    if not state["ready"]:
+        return JSONResponse(status_code=503, content=state, headers={"Retry-After": "1"})
+    return state
 
 # Fonctions utilitaires pour la gestion des CV
-def load_cv_metadata():
-    """Charge les métadonnées des CV"""
-    if CV_METADATA_FILE.exists():
-        with open(CV_METADATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
-
-def save_cv_metadata(metadata):
-    """Sauvegarde les métadonnées des CV"""
-    with open(CV_METADATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
-
-def save_cv_file(cv_file: UploadFile, cv_id: str):
-    """Sauvegarde un fichier CV et retourne le chemin"""
-    cv_path = CV_STORAGE_DIR / f"{cv_id}.pdf"
-    with open(cv_path, 'wb') as f:
-        shutil.copyfileobj(cv_file.file, f)
-    return str(cv_path)
-
-def get_or_create_cv_id(cv_file: UploadFile):
-    """Génère un ID unique pour le CV ou utilise un existant"""
-    # Pour simplifier, on utilise le nom du fichier + timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = cv_file.filename.replace('.pdf', '').replace(' ', '_')
-    return f"{filename}_{timestamp}"
+async def resolve_cv(cv_file, cv_id):
+    """
+    Retourne (extraction du CV, cv_id) à partir d'un CV existant (cv_id)
+    ou d'un nouveau fichier uploadé (cv_file). L'extraction contient
+    le texte ("text"), l'empreinte ("sha256"), le chemin du PDF ("path")
+    et le profil structuré ("profile").
+    """
+    extracted, used_cv_id = await _resolve_cv_document(cv_file, cv_id)
+    # Profil déjà construit à l'upload ; sinon construit maintenant (et enregistré)
+    profile = await run_blocking(get_cv_profile, extracted["path"], extracted["sha256"], extracted["text"])
+    return {**extracted, "profile": profile}, used_cv_id
+
+async def _resolve_cv_document(cv_file, cv_id):
+    """Extraction du CV (texte, empreinte, chemin) et son cv_id"""
+    if cv_id:
+        # Utiliser un CV existant
+        entry = await run_blocking(cv_db.get, cv_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="CV non trouvé")
+        
+        cv_path = entry["path"]
+        if not os.path.exists(cv_path):
+            raise HTTPException(status_code=404, detail="Fichier CV non trouvé")
+        
+        # Texte extrait mis en cache (le PDF n'est parsé qu'une fois)
+        extracted = await run_blocking(get_cv_content, cv_path, entry.get("sha256"))
+        extracted = {**extracted, "path": cv_path}
+        
+        # Mettre à jour la date d'utilisation
+        await run_blocking(cv_db.touch, cv_id, datetime.now().isoformat())
+        return extracted, cv_id
+    
+    if cv_file:
+        # Utiliser un nouveau CV
+        if not cv_file.filename.endswith('.pdf'):
+            raise HTTPException(status_code=400, detail="Le CV doit être un fichier PDF")
+        
+        new_cv_id, extracted = await ingest_cv_upload(cv_file)
+        return extracted, new_cv_id
+    
+    raise HTTPException(status_code=400, detail="Aucun CV fourni (cv_file ou cv_id requis)")
+
+async def ingest_cv_upload(cv_file: UploadFile):
+    """
+    Stocke un CV uploadé (dédupliqué par contenu), extrait son texte si besoin
+    et enregistre son alias dans les métadonnées. Retourne (cv_id, extraction).
+    """
+    # Lire l'upload une seule fois : taille limitée, signature PDF, empreinte au fil de la lecture
+    try:
+        content, sha256 = await read_cv_upload(cv_file)
+    except CVTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except NotAPDFError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cv_path = str(blob_path(CV_STORAGE_DIR, sha256))
+    
+    # Écriture dans le stockage (sauf contenu déjà connu) pendant le parsing depuis la mémoire ;
+    # le texte d'un contenu déjà parsé est réutilisé tel quel
+    _, extracted = await asyncio.gather(
+        run_blocking(store_cv_bytes, content, sha256, CV_STORAGE_DIR),
+        run_blocking(get_cv_content, cv_path, sha256, content)
+    )
+    
+    # Même fichier, même nom : on réutilise l'entrée existante
+    cv_id = get_or_create_cv_id(cv_file, sha256)
+    now = datetime.now().isoformat()
+    await run_blocking(cv_db.upsert, {
+        "id": cv_id,
+        "original_filename": cv_file.filename,
+        "upload_date": now,
+        "last_used": now,
+        "path": cv_path,
+        "sha256": sha256,
+        "pages": extracted["pages"]
+    })
+    return cv_id, {**extracted, "path": cv_path}
+
+def get_cached_letter(cache_key, profile=None):
+    """Lettre en cache ; le PDF est rendu à nouveau si sa date n'est plus celle du jour"""
+    return letter_cache.get_current(cache_key, lambda text, langue: call_cpu(generer_pdf_lettre, text, langue, profile))
+
+def get_similar_letter(cv, offre_content, langue):
+    """Lettre d'une offre quasi identique déjà traitée avec le même CV, ou None"""
+    profile = cv["profile"]
+    return find_similar_letter(letter_cache, cv["sha256"], offre_content, langue,
+                               lambda text, langue: call_cpu(generer_pdf_lettre, text, langue, profile))
+
+async def produce_letter(cache_key, cv, offre_content, langue, offre_url=None):
+    """
+    Génère le texte (à partir du profil du CV) puis le PDF d'une lettre, les met en cache
+    et indexe l'offre pour ses futures republications
+    """
+    # Générer le texte de la lettre (nombre d'appels LLM simultanés limité)
+    async with llm_limiter.slot():
+        lettre_content = await run_blocking(generer_texte_lettre, cv_for_prompt(cv), offre_content, langue)
+    
+    # Générer le PDF
+    pdf_content = await run_cpu(generer_pdf_lettre, lettre_content, langue, cv["profile"])
+    entry = await run_blocking(letter_cache.put, cache_key, lettre_content, langue, pdf_content)
+    await run_blocking(remember_offer, cv["sha256"], offre_content, langue, cache_key, offre_url)
+    return entry
+
+async def stream_batch(cv, offers_list, parallelism, force_regenerate):
+    """Morceaux de l'archive d'un lot, produits sur le pool des lots"""
+    global running_batches
+    running_batches += 1
+    try:
+        async for chunk in iterate_blocking(stream_batch_zip, cv, offers_list, letter_cache, parallelism,
+                                            force_regenerate, executor=get_batch_pool()):
+            yield chunk
+    finally:
+        running_batches -= 1
+
+def pdf_response(pdf_content, cache_status=None, similarity=None):
+    """Retourne le PDF en tant que fichier téléchargeable"""
+    headers = {"Content-Disposition": "attachment; filename=lettre_motivation.pdf"}
+    if cache_status:
+        headers["X-Cache"] = cache_status
+    if similarity is not None:
+        headers["X-Similarity"] = str(similarity)
+    return Response(content=pdf_content, media_type="application/pdf", headers=headers)
+
+def sse_event(event, data):
+    """Formate un événement Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def save_generated_letter(pdf_content):
+    """Enregistre un PDF généré, purge les lettres expirées et retourne son identifiant"""
+    now = time.time()
+    for old_letter in LETTERS_DIR.glob("*.pdf"):
+        try:
+            if now - old_letter.stat().st_mtime > LETTERS_TTL:
+                old_letter.unlink()
+        except OSError:
+            pass
+    letter_id = uuid.uuid4().hex
+    (LETTERS_DIR / f"{letter_id}.pdf").write_bytes(pdf_content)
+    return letter_id
+
+def get_or_create_cv_id(cv_file: UploadFile, sha256: str):
+    """ID du CV : alias stable nom du fichier + empreinte du contenu"""
+    return make_cv_id(cv_file.filename, sha256)
 
 @app.get("/cv/list")
-async def list_cvs():
-    """Liste tous les CV stockés"""
+async def list_cvs(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0)
+):
+    """Liste les CV stockés, paginés, du plus récemment utilisé au plus ancien"""
     try:
-        metadata = load_cv_metadata()
-        # Trier par date d'utilisation (plus récent en premier)
-        sorted_cvs = sorted(
-            metadata.values(), 
-            key=lambda x: x.get('last_used', ''), 
-            reverse=True
+        # L'ETag change à chaque écriture : un client à jour reçoit un 304 sans relecture
+        version = await run_blocking(cv_db.version)
+        etag = f'W/"{version}-{limit}-{offset}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        cvs = await run_blocking(cv_db.list, limit, offset)
+        total = await run_blocking(cv_db.count)
+        next_offset = offset + len(cvs) if offset + len(cvs) < total else None
+        return JSONResponse(
+            content={"cvs": cvs, "total": total, "limit": limit, "offset": offset, "next_offset": next_offset},
+            headers={"ETag": etag}
         )
-        return {"cvs": sorted_cvs}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des CV: {str(e)}")
 
 @app.post("/cv/upload")
-async def upload_cv(cv_file: UploadFile = File(...)):
-    """Upload un nouveau CV sans générer de lettre"""
+async def upload_cv(background_tasks: BackgroundTasks, cv_file: UploadFile = File(...)):
+    """Upload un nouveau CV sans générer de lettre ; son profil est construit en tâche de fond"""
     try:
         # Vérifier que le fichier CV est un PDF
         if not cv_file.filename.endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Le CV doit être un fichier PDF")
         
-        # Générer un ID pour le CV
-        cv_id = get_or_create_cv_id(cv_file)
-        
-        # Sauvegarder le fichier CV
-        cv_path = save_cv_file(cv_file, cv_id)
+        # Stocker le CV et extraire son texte dès l'upload
+        cv_id, extracted = await ingest_cv_upload(cv_file)
         
-        # Mettre à jour les métadonnées
-        metadata = load_cv_metadata()
-        metadata[cv_id] = {
-            "id": cv_id,
-            "original_filename": cv_file.filename,
-            "upload_date": datetime.now().isoformat(),
-            "last_used": datetime.now().isoformat(),
-            "path": cv_path
-        }
-        save_cv_metadata(metadata)
+        # Profil structuré construit après la réponse, prêt pour les générations suivantes
+        background_tasks.add_task(get_cv_profile, extracted["path"], extracted["sha256"], extracted["text"])
         
         return {
             "success": True,
@@ -206,9 +727,23 @@ async def upload_cv(cv_file: UploadFile = File(...)):
             "message": "CV uploadé avec succès"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'upload: {str(e)}")
 
+@app.get("/cv/{cv_id}/profile")
+async def get_cv_profile_endpoint(cv_id: str):
+    """Profil structuré d'un CV (409 tant que la tâche de fond ne l'a pas construit)"""
+    entry = await run_blocking(cv_db.get, cv_id)
+    if entry is None or not os.path.exists(entry["path"]):
+        raise HTTPException(status_code=404, detail="CV non trouvé")
+    sha256 = entry.get("sha256") or await run_blocking(cached_sha256, entry["path"])
+    profile = await run_blocking(load_profile, entry["path"], sha256)
+    if profile is None:
+        raise HTTPException(status_code=409, detail="Profil pas encore disponible")
+    return {"cv_id": cv_id, "profile": profile}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
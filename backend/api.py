@@ -1,19 +1,39 @@
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
+import asyncio
 import sys
 import os
 
 # Ajouter le répertoire parent au path pour importer les modules existants
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from parser_cv import extract_cv_content
-from generateur_lettre_pdf import generer_lettre
-from langdetect import detect
-import tempfile
-import shutil
+from cv_store import CVTooLargeError, NotAPDFError, read_cv_upload
+from metrics import instrument_app, render_metrics
+from parser_cv import extract_cv_document
+from cv_profile import build_profile, profile_to_text
+from generateur_lettre_pdf import generer_texte_lettre, generer_pdf_lettre
+from language_id import identify_language, language_of
+from llm_limits import llm_limiter
+from llm_router import stats as llm_router_stats
+from offer_cleaner import clean_offer
+from warmup import is_ready, keep_warm, status as warmup_status, warm_up
+from worker_pool import QueueFullError, run_blocking, run_cpu
 
-app = FastAPI(title="Générateur de Lettre de Motivation", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app):
+    # Préchauffage en tâche de fond : /ready répond 503 jusqu'à la fin
+    warming = asyncio.create_task(warm_up())
+    keeping = asyncio.create_task(keep_warm())
+    yield
+    warming.cancel()
+    keeping.cancel()
+
+app = FastAPI(title="Générateur de Lettre de Motivation", version="1.0.0", lifespan=lifespan)
+
+# Histogramme par route et en-tête Server-Timing (durée de chaque étape de la requête)
+instrument_app(app)
 
 # Configuration CORS pour permettre les requêtes depuis l'extension
 app.add_middleware(
@@ -24,6 +44,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request, exc):
+    """Refus rapide quand la file d'attente des générations est pleine"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.get("/")
 async def root():
     return {"message": "API Générateur de Lettre de Motivation"}
@@ -32,7 +61,8 @@ async def root():
 async def generate_letter(
     offre_content: str = Form(...),
     langue: str = Form(...),
-    cv_file: UploadFile = File(...)
+    cv_file: UploadFile = File(...),
+    offre_url: str = Form(None)
 ):
     """
     Génère une lettre de motivation à partir d'une offre d'emploi et d'un CV
@@ -42,57 +72,85 @@ async def generate_letter(
         if not cv_file.filename.endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Le CV doit être un fichier PDF")
         
-        # Sauvegarder temporairement le fichier CV
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            shutil.copyfileobj(cv_file.file, temp_file)
-            temp_cv_path = temp_file.name
+        # Refuser tout de suite si la file des générations est pleine
+        llm_limiter.check()
         
+        # Lire le CV une seule fois (taille limitée, signature PDF vérifiée)
         try:
-            # Parser le CV
-            cv_content = extract_cv_content(temp_cv_path)
-            
-            # Détecter la langue si pas fournie ou invalide
-            if not langue or langue == "auto":
-                try:
-                    langue = detect(offre_content)
-                except Exception:
-                    langue = "en"  # Défaut anglais
-            
-            # Générer la lettre de motivation (PDF)
-            pdf_content = generer_lettre(cv_content, offre_content, langue)
-            
-            # Retourner le PDF en tant que fichier téléchargeable
-            return Response(
-                content=pdf_content,
-                media_type="application/pdf",
-                headers={"Content-Disposition": "attachment; filename=lettre_motivation.pdf"}
-            )
-            
-        finally:
-            # Nettoyer le fichier temporaire
-            if os.path.exists(temp_cv_path):
-                os.unlink(temp_cv_path)
-                
+            cv_bytes, _ = await read_cv_upload(cv_file)
+        except CVTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except NotAPDFError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # Parser le CV depuis la mémoire, sans fichier temporaire
+        cv_content = (await run_cpu(extract_cv_document, cv_bytes))["text"]
+        profile = await run_cpu(build_profile, cv_content)
+        
+        # Retirer le bruit de la page (menus, cookies, offres similaires...)
+        offre_content = await run_blocking(clean_offer, offre_content, offre_url)
+        
+        # Détecter la langue si pas fournie ou invalide
+        if not langue or langue == "auto":
+            langue = await run_blocking(language_of, offre_content)  # Anglais par défaut
+        
+        # Générer le texte de la lettre (nombre d'appels LLM simultanés limité)
+        async with llm_limiter.slot():
+            lettre_content = await run_blocking(generer_texte_lettre, profile_to_text(profile), offre_content, langue)
+        
+        # Générer le PDF
+        pdf_content = await run_cpu(generer_pdf_lettre, lettre_content, langue, profile)
+        
+        # Retourner le PDF en tant que fichier téléchargeable
+        return Response(
+            content=pdf_content,
+            media_type="application/pdf",
+            headers={"Content-Disposition": "attachment; filename=lettre_motivation.pdf"}
+        )
+        
+    except (HTTPException, QueueFullError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération: {str(e)}")
 
 @app.post("/detect-language")
-async def detect_language(content: str = Form(...)):
+async def detect_language(content: str = Form(...), url: str = Form(None)):
     """
-    Détecte la langue d'un texte
+    Détecte la langue d'un texte (nettoyé comme une offre)
     """
     try:
-        langue = detect(content)
-        return {"langue": langue}
+        content = await run_blocking(clean_offer, content, url)
+        result = await run_blocking(identify_language, content)
+        return {"langue": result["langue"], "confidence": result["confidence"]}
     except Exception as e:
         return {"langue": "en", "error": str(e)}
 
+@app.get("/llm/stats")
+async def llm_stats():
+    """Générations par serveur LLM (LLM_URLS) et file d'attente des générations"""
+    return {**llm_router_stats(), "queue": llm_limiter.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    """Mesures au format texte Prometheus"""
+    return Response(await run_blocking(render_metrics), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     """
-    Vérification de l'état de l'API
+    Vérification de l'état de l'API (répond dès le démarrage, "ready" une fois préchauffée)
     """
-    return {"status": "healthy", "message": "API fonctionnelle"}
+    if not is_ready():
+        return {"status": "warming_up", "ready": False, "message": "API démarrée, préchauffage en cours"}
+    return {"status": "healthy", "ready": True, "message": "API fonctionnelle"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Prête à servir une lettre à pleine vitesse : 503 tant que le préchauffage n'est pas terminé"""
+    state = warmup_status()
+    if not state["ready"]:
+        return JSONResponse(status_code=503, content=state, headers={"Retry-After": "1"})
+    return state
 
 if __name__ == "__main__":
     import uvicorn
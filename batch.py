@@ -0,0 +1,183 @@
+"""
+Génération de lettres en lot : un CV, plusieurs offres, une archive ZIP.
+
+Le CV n'est parsé qu'une fois, les langues de toutes les offres sont détectées en
+une passe, puis les lettres sont générées en parallèle (BATCH_PARALLELISM). Côté API,
+chaque lot occupe un thread de son propre pool (BATCH_MAX_CONCURRENT lots à la fois) :
+les lots ne prennent pas les threads des autres requêtes. Chaque PDF
+est ajouté à l'archive dès qu'il est prêt, et un manifest.json final donne l'état de
+chaque offre : une offre en échec n'interrompt pas le lot.
+
+En ligne de commande :
+    python batch.py mon_cv.pdf offres.json -o lettres.zip -j 4
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cv_cache import file_sha256
+from cv_profile import build_profile
+from language_id import language_of
+from letter_cache import LetterCache, generate_cached_letter
+from offer_cleaner import clean_offer
+from parser_cv import extract_cv_document
+
+BATCH_PARALLELISM = int(os.environ.get("BATCH_PARALLELISM", "2"))
+BATCH_MAX_PARALLELISM = int(os.environ.get("BATCH_MAX_PARALLELISM", "8"))
+BATCH_MAX_OFFERS = int(os.environ.get("BATCH_MAX_OFFERS", "100"))
+BATCH_MAX_CONCURRENT = int(os.environ.get("BATCH_MAX_CONCURRENT", "2"))
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+
+def get_batch_pool():
+    """Threads qui produisent les archives des lots de l'API"""
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ThreadPoolExecutor(max_workers=BATCH_MAX_CONCURRENT, thread_name_prefix="batch-zip")
+        return _batch_pool
+
+
+def normalize_offers(offers):
+    """Accepte des textes ou des objets {"content", "title", "langue", "url"}"""
+    normalized = []
+    for index, offer in enumerate(offers, start=1):
+        if isinstance(offer, str):
+            offer = {"content": offer}
+        if not isinstance(offer, dict) or not str(offer.get("content", "")).strip():
+            raise ValueError(f"Offre n°{index} invalide : le champ 'content' est requis")
+        normalized.append({
+            "index": index,
+            "title": offer.get("title") or f"offre_{index}",
+            "content": offer["content"],
+            "langue": offer.get("langue") or "auto",
+            "url": offer.get("url"),
+        })
+    return normalized
+
+
+def detect_languages(offers):
+    """Nettoie les offres puis détecte en une passe la langue de celles qui n'en précisent pas"""
+    for offer in offers:
+        offer["content"] = clean_offer(offer["content"], offer["url"])
+        if offer["langue"] == "auto":
+            offer["langue"] = language_of(offer["content"])
+    return offers
+
+
+def pdf_filename(offer):
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', offer["title"]).strip('_')[:60] or "offre"
+    return f"{offer['index']:03d}_{slug}.pdf"
+
+
+def generate_letters(cv, offers, letter_cache, parallelism=BATCH_PARALLELISM, force_regenerate=False):
+    """
+    Génère les lettres en parallèle et produit (offre, résultat) au fur et à mesure.
+    Le résultat contient "pdf" ou "error".
+    """
+    def generate_one(offer):
+        started = time.perf_counter()
+        try:
+            entry = generate_cached_letter(letter_cache, cv, offer["content"], offer["langue"], force_regenerate,
+                                           url=offer["url"])
+            return {"pdf": entry["pdf"], "cached": entry["cached"], "duration": time.perf_counter() - started}
+        except Exception as e:
+            return {"error": str(e), "duration": time.perf_counter() - started}
+
+    executor = ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix="batch")
+    try:
+        futures = {executor.submit(generate_one, offer): offer for offer in offers}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # Si le client abandonne, les offres pas encore commencées sont annulées
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class _ZipChunks:
+    """Flux non positionnable pour zipfile : accumule les octets écrits jusqu'à leur lecture"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_batch_zip(cv, offers, letter_cache, parallelism=BATCH_PARALLELISM, force_regenerate=False):
+    """Produit l'archive ZIP par morceaux : chaque PDF est envoyé dès qu'il est prêt"""
+    offers = detect_languages(normalize_offers(offers))
+    buffer = _ZipChunks()
+    manifest = []
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for offer, result in generate_letters(cv, offers, letter_cache, parallelism, force_regenerate):
+            item = {
+                "index": offer["index"],
+                "title": offer["title"],
+                "langue": offer["langue"],
+                "duration": round(result["duration"], 3),
+            }
+            if "pdf" in result:
+                item.update(status="ok", file=pdf_filename(offer), cached=result["cached"])
+                archive.writestr(item["file"], result["pdf"])
+            else:
+                item.update(status="error", error=result["error"])
+            manifest.append(item)
+            chunk = buffer.take()
+            if chunk:
+                yield chunk
+
+        manifest.sort(key=lambda item: item["index"])
+        archive.writestr("manifest.json", json.dumps({
+            "cv_sha256": cv["sha256"],
+            "total": len(manifest),
+            "succeeded": sum(1 for item in manifest if item["status"] == "ok"),
+            "offers": manifest,
+        }, ensure_ascii=False, indent=2))
+    yield buffer.take()
+
+
+def load_offers_file(path):
+    """Offres depuis un fichier JSON (liste) ou texte (offres séparées par une ligne '---')"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    if path.endswith('.json'):
+        return json.loads(content)
+    return [block.strip() for block in re.split(r'^\s*---\s*$', content, flags=re.MULTILINE) if block.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génère des lettres pour plusieurs offres avec le même CV")
+    parser.add_argument("cv", help="CV au format PDF")
+    parser.add_argument("offers", help="Offres : JSON (liste) ou texte séparé par des lignes '---'")
+    parser.add_argument("-o", "--output", default="lettres.zip")
+    parser.add_argument("-j", "--parallelism", type=int, default=BATCH_PARALLELISM)
+    parser.add_argument("--force-regenerate", action="store_true")
+    args = parser.parse_args()
+
+    cv = {**extract_cv_document(args.cv), "sha256": file_sha256(args.cv)}
+    cv["profile"] = build_profile(cv["text"])
+    offers = load_offers_file(args.offers)
+    print(f"📄 CV parsé ({cv['pages']} page(s)), {len(offers)} offre(s)")
+
+    started = time.perf_counter()
+    with open(args.output, 'wb') as f:
+        for chunk in stream_batch_zip(cv, offers, LetterCache(), args.parallelism, args.force_regenerate):
+            f.write(chunk)
+    print(f"✅ {args.output} écrit en {time.perf_counter() - started:.1f} s")
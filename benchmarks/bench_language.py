@@ -0,0 +1,131 @@
+"""
+Compare la détection de langue actuelle (langdetect.detect) et language_id :
+précision, stabilité (même réponse sur plusieurs passes) et latence, à froid et à chaud.
+
+    python benchmarks/bench_language.py --repeat 5
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Offres types (titre + description) et textes courts, où langdetect hésite le plus
+CORPUS = {
+    "fr": [
+        "Développeur Python H/F\nNous recherchons un développeur Python pour rejoindre notre équipe produit à Lyon. "
+        "Vous participerez à la conception des API, à la revue de code et à l'amélioration continue de la plateforme.",
+        "Chargé de recrutement\nAu sein de la direction des ressources humaines, vous pilotez les campagnes de recrutement, "
+        "animez les relations avec les écoles et accompagnez les managers dans leurs besoins.",
+        "Stage - Analyste financier\nVous contribuerez à la préparation des budgets et au suivi mensuel des résultats.",
+        "Ingénieur DevOps confirmé",
+        "Télétravail possible deux jours par semaine",
+    ],
+    "en": [
+        "Senior Backend Engineer\nWe are looking for an engineer to design and operate the services behind our payments "
+        "platform. You will work closely with product managers and mentor junior developers.",
+        "Marketing Manager\nYou will own the go-to-market strategy for new products, manage the campaign budget and report "
+        "on performance to the leadership team.",
+        "Data Analyst internship\nHelp us build dashboards and answer business questions with SQL and Python.",
+        "Customer Success Manager",
+        "Hybrid work, two days in the office",
+    ],
+    "es": [
+        "Desarrollador Java\nBuscamos un desarrollador para incorporarse a nuestro equipo de Madrid. Participarás en el diseño "
+        "de nuevas funcionalidades y en el mantenimiento de las aplicaciones existentes.",
+        "Responsable de ventas\nSerás responsable de la cartera de clientes de la zona norte y de alcanzar los objetivos "
+        "comerciales del equipo.",
+        "Prácticas en contabilidad\nApoyarás al departamento financiero en el cierre mensual.",
+        "Técnico de soporte informático",
+        "Jornada completa y horario flexible",
+    ],
+    "de": [
+        "Softwareentwickler (m/w/d)\nWir suchen einen Entwickler für unser Team in Berlin. Sie entwickeln neue Funktionen "
+        "für unsere Plattform und arbeiten eng mit dem Produktmanagement zusammen.",
+        "Personalreferent\nSie betreuen die Mitarbeitenden in allen personalrelevanten Fragen und unterstützen bei der "
+        "Rekrutierung.",
+        "Praktikum im Controlling\nSie unterstützen das Team bei der monatlichen Berichterstattung.",
+        "Vertriebsmitarbeiter im Außendienst",
+        "Flexible Arbeitszeiten und Homeoffice",
+    ],
+    "it": [
+        "Sviluppatore Frontend\nCerchiamo uno sviluppatore da inserire nel nostro team di Milano. Ti occuperai dello sviluppo "
+        "di nuove interfacce e della manutenzione delle applicazioni esistenti.",
+        "Responsabile amministrativo\nGestirai la contabilità generale, i rapporti con le banche e la redazione del bilancio.",
+        "Stage in marketing digitale\nSupporterai il team nella gestione delle campagne sui social.",
+        "Addetto alla logistica di magazzino",
+        "Orario flessibile e lavoro da remoto",
+    ],
+}
+
+
+def samples(long_factor):
+    """(langue attendue, texte) ; les offres complètes sont aussi répétées pour simuler une page entière"""
+    items = []
+    for langue, texts in CORPUS.items():
+        for text in texts:
+            items.append((langue, text))
+            if len(text) > 100 and long_factor > 1:
+                items.append((langue, "\n".join([text] * long_factor)))
+    return items
+
+
+def run(name, detect, items, repeat):
+    """Précision sur la première passe, stabilité sur toutes, latence par appel"""
+    answers = {index: [] for index in range(len(items))}
+    passes = []
+    first_call = None
+    for _ in range(repeat):
+        durations = []
+        for index, (_, text) in enumerate(items):
+            started = time.perf_counter()
+            try:
+                answer = detect(text)
+            except Exception:
+                answer = "en"
+            durations.append(time.perf_counter() - started)
+            if first_call is None:
+                first_call = durations[0]
+            answers[index].append(answer)
+        passes.append(durations)
+
+    correct = sum(1 for index, (langue, _) in enumerate(items) if answers[index][0] == langue)
+    stable = sum(1 for values in answers.values() if len(set(values)) == 1)
+    warm = [duration for durations in passes[1:] or passes for duration in durations]
+    return {
+        "name": name,
+        "accuracy": correct / len(items),
+        "stable": stable / len(items),
+        "first_call_ms": first_call * 1000,
+        "first_pass_ms": statistics.mean(passes[0]) * 1000,
+        "warm_ms": statistics.mean(warm) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la détection de langue")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes sur le corpus")
+    parser.add_argument("--long-factor", type=int, default=40, help="Répétitions d'une offre pour le texte long")
+    args = parser.parse_args()
+
+    from langdetect import detect
+    import language_id
+
+    items = samples(args.long_factor)
+    results = [
+        run("langdetect.detect", detect, items, args.repeat),
+        run("language_id", language_id.language_of, items, args.repeat),
+    ]
+
+    print(f"{len(items)} textes, {args.repeat} passes\n")
+    print(f"{'méthode':<20}{'précision':>10}{'stable':>8}{'1er appel':>12}{'1re passe':>12}{'à chaud':>10}")
+    for r in results:
+        print(f"{r['name']:<20}{r['accuracy']:>10.1%}{r['stable']:>8.1%}{r['first_call_ms']:>10.1f}ms"
+              f"{r['first_pass_ms']:>10.2f}ms{r['warm_ms']:>8.3f}ms")
+    print(f"\ncache language_id : {language_id.stats()}")
+
+
+if __name__ == "__main__":
+    main()
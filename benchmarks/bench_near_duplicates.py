@@ -0,0 +1,154 @@
+"""
+Benchmark de l'index des offres quasi identiques (near_duplicates.py) à grande échelle :
+- ajout incrémental de N offres synthétiques (défaut 100 000), réparties sur plusieurs CV,
+- recherche d'offres republiées (quelques mots changés, une ligne ajoutée, deux lignes
+  échangées) : rappel et durée de la recherche. Le rappel est aussi donné pour les seules
+  republications dont la similarité de Jaccard réelle atteint le seuil : en dessous,
+  l'offre n'a pas à être retrouvée,
+- recherche d'offres nouvelles : faux positifs et durée.
+
+La durée de recherche est donnée avec et sans le calcul de la signature (hachage du
+texte) : seule la requête dans l'index dépend du nombre d'offres.
+
+    python benchmarks/bench_near_duplicates.py --offers 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from near_duplicates import OfferIndex, shingles, signature
+
+# Phrases communes à beaucoup d'offres (avantages, processus) : des offres différentes
+# se ressemblent en partie, comme les vraies
+BOILERPLATE = (
+    "Télétravail possible deux jours par semaine.",
+    "Tickets restaurant, mutuelle prise en charge à 100 % et RTT.",
+    "Le processus de recrutement comprend un entretien RH puis un entretien technique.",
+    "Nous nous engageons en faveur de la diversité et de l'inclusion.",
+    "Poste en CDI à pourvoir dès que possible.",
+    "Rémunération selon profil et expérience.",
+)
+
+
+def vocabulary(rng, size=20000):
+    """Mots inventés : chaque offre a son vocabulaire propre"""
+    letters = "abcdefghijklmnopqrstuvwxyzéè"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def make_offer(rng, words):
+    """Offre d'environ 200 mots : titre, paragraphes propres à l'offre, phrases communes"""
+    lines = [" ".join(rng.choices(words, k=4))]
+    for _ in range(8):
+        lines.append(" ".join(rng.choices(words, k=rng.randint(15, 25))) + ".")
+    lines.extend(rng.sample(BOILERPLATE, 3))
+    return lines
+
+
+def repost(rng, lines, words):
+    """Même offre republiée : deux mots changés, une ligne ajoutée, deux lignes échangées"""
+    lines = list(lines)
+    for _ in range(2):
+        index = rng.randrange(1, len(lines))
+        tokens = lines[index].split()
+        tokens[rng.randrange(len(tokens))] = rng.choice(words)
+        lines[index] = " ".join(tokens)
+    first, second = rng.sample(range(1, len(lines)), 2)
+    lines[first], lines[second] = lines[second], lines[first]
+    lines.append("Postuler sur " + rng.choice(("Indeed", "LinkedIn", "Welcome to the Jungle", "JobTeaser")))
+    return lines
+
+
+def percentiles(durations):
+    ordered = sorted(durations)
+    return (statistics.mean(ordered) * 1000, ordered[len(ordered) // 2] * 1000,
+            ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'index des offres quasi identiques")
+    parser.add_argument("--offers", type=int, default=100000, help="Offres indexées")
+    parser.add_argument("--scopes", type=int, default=50, help="CV différents")
+    parser.add_argument("--queries", type=int, default=500, help="Recherches de chaque type")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="Base SQLite (fichier temporaire par défaut)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = vocabulary(rng)
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench_index_"), "offer_index.db")
+    index = OfferIndex(db_path, threshold=args.threshold, max_offers=args.offers)
+    print(f"📚 {args.offers} offres, {args.scopes} CV, index dans {db_path}")
+
+    # Offres gardées pour les recherches : (portée, lignes, clé)
+    sample_every = max(1, args.offers // args.queries)
+    samples = []
+    started = time.perf_counter()
+    add_durations = []
+    for number in range(args.offers):
+        scope = f"cv-{number % args.scopes}|fr|modele|1"
+        lines = make_offer(rng, words)
+        begin = time.perf_counter()
+        index.add(scope, "\n".join(lines), f"lettre-{number}")
+        add_durations.append(time.perf_counter() - begin)
+        if number % sample_every == 0:
+            samples.append((scope, lines, f"lettre-{number}"))
+        if (number + 1) % 10000 == 0:
+            print(f"   {number + 1} offres indexées ({time.perf_counter() - started:.0f} s)")
+    print(f"✅ Index construit en {time.perf_counter() - started:.1f} s ({index.count()} offres)")
+
+    found = 0
+    expected = 0
+    found_expected = 0
+    repost_durations = []
+    query_durations = []
+    for scope, lines, key in samples:
+        text = "\n".join(repost(rng, lines, words))
+        begin = time.perf_counter()
+        matches = index.find(scope, text)
+        repost_durations.append(time.perf_counter() - begin)
+        hit = bool(matches) and matches[0]["letter_key"] == key
+        found += hit
+        original, reposted = shingles("\n".join(lines)), shingles(text)
+        if len(original & reposted) / len(original | reposted) >= args.threshold:
+            expected += 1
+            found_expected += hit
+        # Même recherche sans le hachage du texte : coût propre à l'index
+        sig = signature(shingles(text))
+        begin = time.perf_counter()
+        index.find_signature(scope, sig)
+        query_durations.append(time.perf_counter() - begin)
+
+    false_positives = 0
+    fresh_durations = []
+    for number in range(len(samples)):
+        text = "\n".join(make_offer(rng, words))
+        begin = time.perf_counter()
+        false_positives += bool(index.find(f"cv-{number % args.scopes}|fr|modele|1", text))
+        fresh_durations.append(time.perf_counter() - begin)
+
+    print(f"\n{'mesure':<28}{'moyenne':>12}{'médiane':>12}{'p95':>12}")
+    for name, durations in (("ajout", add_durations), ("recherche (republiée)", repost_durations),
+                            ("requête index seule", query_durations), ("recherche (nouvelle)", fresh_durations)):
+        mean, p50, p95 = percentiles(durations)
+        print(f"{name:<28}{mean:>10.3f}ms{p50:>10.3f}ms{p95:>10.3f}ms")
+    print(f"\nRappel sur les offres republiées : {found}/{len(samples)} ({found / len(samples):.1%})")
+    if expected:
+        print(f"Rappel sur celles de Jaccard réel ≥ {args.threshold} : {found_expected}/{expected} "
+              f"({found_expected / expected:.1%})")
+    print(f"Faux positifs sur les offres nouvelles : {false_positives}/{len(samples)}")
+    print(f"Statistiques de l'index : {index.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Débit du rendu PDF des lettres (lettres/s) : ancien rendu (découpage des lignes
+quadratique, date et en-tête recalculés à chaque lettre) contre generer_pdf_lettre,
+en séquentiel puis en parallèle dans un pool de processus.
+
+    python benchmarks/bench_pdf.py --letters 200 --processes 4
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fpdf import FPDF
+
+from generateur_lettre_pdf import FORMULES_FERMETURE, FORMULES_OUVERTURE, generer_pdf_lettre
+
+PROFILE = {"name": "Camille Martin", "phone": "+33 6 12 34 56 78", "email": "camille.martin@example.com"}
+
+PARAGRAPHE = (
+    "Je me permets de vous adresser ma candidature pour le poste de développeur Python au sein de votre "
+    "équipe. Au cours de mes trois dernières années chez un éditeur de logiciels, j'ai conçu des API "
+    "REST, automatisé les déploiements et accompagné des développeurs juniors dans leur montée en "
+    "compétences. Votre projet de plateforme de données correspond à ce que je souhaite construire."
+)
+LETTRE = "\n\n".join([PARAGRAPHE] * 4)
+
+
+def generer_pdf_lettre_avant(contenu_lettre, langue, profile=None):
+    """Rendu tel qu'avant l'optimisation, gardé pour la comparaison"""
+    profile = profile or {}
+    paragraphes = [p.strip() for p in contenu_lettre.strip().split('\n\n') if p.strip()]
+    ouverture = FORMULES_OUVERTURE.get(langue, FORMULES_OUVERTURE['en'])
+    fermeture = FORMULES_FERMETURE.get(langue, FORMULES_FERMETURE['en'])
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font('helvetica', size=12)
+    if profile.get('name'):
+        pdf.set_font('helvetica', 'B', 14)
+        pdf.cell(0, 10, profile['name'], ln=True, align='R')
+    pdf.set_font('helvetica', size=10)
+    for coordonnee in (profile.get('phone'), profile.get('email')):
+        if coordonnee:
+            pdf.cell(0, 5, coordonnee, ln=True, align='R')
+    pdf.ln(10)
+
+    date_str = datetime.now().strftime('%B %d, %Y')
+    if langue == 'fr':
+        months_fr = {
+            'January': 'janvier', 'February': 'février', 'March': 'mars',
+            'April': 'avril', 'May': 'mai', 'June': 'juin',
+            'July': 'juillet', 'August': 'août', 'September': 'septembre',
+            'October': 'octobre', 'November': 'novembre', 'December': 'décembre'
+        }
+        date_str = datetime.now().strftime(f'%d {months_fr[datetime.now().strftime("%B")]} %Y')
+    pdf.cell(0, 5, date_str, ln=True, align='L')
+    pdf.ln(10)
+
+    pdf.set_font('helvetica', size=12)
+    pdf.cell(0, 8, ouverture, ln=True)
+    pdf.ln(5)
+    pdf.set_font('helvetica', size=11)
+    for paragraphe in paragraphes:
+        for line in paragraphe.split('\n'):
+            if line.strip():
+                current_line = ''
+                for word in line.strip().split(' '):
+                    if pdf.get_string_width(current_line + ' ' + word) < 180:
+                        current_line += (' ' + word if current_line else word)
+                    else:
+                        if current_line:
+                            pdf.cell(0, 6, current_line, ln=True)
+                        current_line = word
+                if current_line:
+                    pdf.cell(0, 6, current_line, ln=True)
+        pdf.ln(3)
+
+    pdf.ln(5)
+    pdf.cell(0, 8, fermeture, ln=True)
+    pdf.ln(15)
+    if profile.get('name'):
+        pdf.set_font('helvetica', 'B', 12)
+        pdf.cell(0, 8, profile['name'], ln=True)
+    return bytes(pdf.output())
+
+
+def rendre(fonction, count):
+    for _ in range(count):
+        fonction(LETTRE, "fr", PROFILE)
+    return count
+
+
+def sequentiel(fonction, letters):
+    fonction(LETTRE, "fr", PROFILE)  # Chauffe (polices, caches)
+    started = time.perf_counter()
+    rendre(fonction, letters)
+    return letters / (time.perf_counter() - started)
+
+
+def parallele(fonction, letters, processes):
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        list(pool.map(rendre, [fonction] * processes, [1] * processes))  # Chauffe des processus
+        per_worker = max(1, letters // processes)
+        started = time.perf_counter()
+        total = sum(pool.map(rendre, [fonction] * processes, [per_worker] * processes))
+        return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du rendu PDF des lettres")
+    parser.add_argument("--letters", type=int, default=200, help="Lettres rendues par mesure")
+    parser.add_argument("--processes", type=int, default=4, help="Processus pour la mesure parallèle (0 = aucune)")
+    args = parser.parse_args()
+
+    print(f"{'rendu':<12}{'séquentiel':>16}" + (f"{f'{args.processes} processus':>18}" if args.processes else ""))
+    for nom, fonction in (("avant", generer_pdf_lettre_avant), ("après", generer_pdf_lettre)):
+        ligne = f"{nom:<12}{sequentiel(fonction, args.letters):>10.1f} let/s"
+        if args.processes:
+            ligne += f"{parallele(fonction, args.letters, args.processes):>12.1f} let/s"
+        print(ligne)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Corpus synthétique et déterministe pour les benchmarks : CV PDF de 1 à 5 pages et offres
+en français, anglais, espagnol, allemand et italien, propres ou bruitées (bandeau cookies,
+menus, lignes répétées, liste d'offres similaires) comme le texte envoyé par l'extension.
+
+La même graine donne toujours les mêmes PDF et les mêmes offres.
+"""
+import random
+from datetime import datetime, timezone
+
+from fpdf import FPDF
+
+PRENOMS = ("Camille", "Lucas", "Léa", "Hugo", "Chloé", "Nathan", "Inès", "Louis", "Manon", "Jules")
+NOMS = ("Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand", "Leroy", "Moreau")
+METIERS = ("Développeur Python", "Data Engineer", "Chef de projet", "Ingénieur DevOps", "Analyste financier")
+ENTREPRISES = ("Nexity Data", "Alpha Conseil", "Orion Logiciels", "Helios Industrie", "Banque Azur", "Studio Lumen")
+COMPETENCES = (
+    "Python", "SQL", "Docker", "Kubernetes", "FastAPI", "Django", "PostgreSQL", "Git", "Linux", "Airflow",
+    "Spark", "Power BI", "Excel", "Scrum", "Terraform", "AWS", "Azure", "Java", "TypeScript", "React",
+)
+REALISATIONS = (
+    "Conception et développement d'API REST utilisées par plus de 200 clients",
+    "Migration de l'infrastructure vers des conteneurs et mise en place de l'intégration continue",
+    "Animation d'une équipe de quatre développeurs et revue de code quotidienne",
+    "Automatisation des rapports mensuels, réduisant de moitié le temps de clôture",
+    "Optimisation des requêtes SQL critiques et mise en place d'index adaptés",
+    "Rédaction des spécifications fonctionnelles avec les équipes métier",
+    "Mise en place d'une supervision et d'alertes sur les traitements de nuit",
+    "Accompagnement des utilisateurs lors du déploiement d'un nouvel outil interne",
+)
+ECOLES = ("Université de Lyon", "INSA Toulouse", "École Centrale de Nantes", "Université Paris-Saclay")
+
+# Description de base des offres par langue : titre, entreprise, missions, profil
+OFFRES = {
+    "fr": {
+        "titre": "Développeur Python H/F",
+        "intro": "Nous recherchons un développeur Python pour rejoindre notre équipe produit à Lyon.",
+        "missions": [
+            "Vous participerez à la conception des API et à la revue de code.",
+            "Vous contribuerez à l'amélioration continue de notre plateforme de données.",
+            "Vous travaillerez avec les équipes métier pour comprendre leurs besoins.",
+            "Vous rédigerez des tests automatisés et la documentation technique.",
+        ],
+        "profil": "Vous avez au moins trois ans d'expérience et maîtrisez SQL ainsi que Docker.",
+    },
+    "en": {
+        "titre": "Senior Backend Engineer",
+        "intro": "We are looking for a backend engineer to join our platform team in London.",
+        "missions": [
+            "You will design and build scalable services used by millions of customers.",
+            "You will take part in code reviews and mentor junior engineers.",
+            "You will work closely with product managers to shape the roadmap.",
+            "You will improve our monitoring and our deployment pipeline.",
+        ],
+        "profil": "You have solid experience with Python, cloud infrastructure and distributed systems.",
+    },
+    "es": {
+        "titre": "Desarrollador Backend",
+        "intro": "Buscamos un desarrollador backend para incorporarse a nuestro equipo en Madrid.",
+        "missions": [
+            "Participarás en el diseño de servicios y en la revisión de código.",
+            "Colaborarás con el equipo de producto para definir nuevas funcionalidades.",
+            "Mejorarás la calidad del código con pruebas automatizadas.",
+            "Documentarás las decisiones técnicas del equipo.",
+        ],
+        "profil": "Tienes experiencia con Python, bases de datos relacionales y trabajo en equipo.",
+    },
+    "de": {
+        "titre": "Softwareentwickler Python (m/w/d)",
+        "intro": "Wir suchen einen erfahrenen Softwareentwickler für unser Team in Berlin.",
+        "missions": [
+            "Sie entwickeln neue Funktionen für unsere Plattform und betreuen bestehende Dienste.",
+            "Sie arbeiten eng mit dem Produktteam zusammen und beteiligen sich an Code-Reviews.",
+            "Sie verbessern unsere Testabdeckung und unsere Deployment-Prozesse.",
+            "Sie dokumentieren technische Entscheidungen für das gesamte Team.",
+        ],
+        "profil": "Sie haben mehrjährige Erfahrung mit Python und relationalen Datenbanken.",
+    },
+    "it": {
+        "titre": "Sviluppatore Python",
+        "intro": "Cerchiamo uno sviluppatore Python da inserire nel nostro team di Milano.",
+        "missions": [
+            "Parteciperai alla progettazione dei servizi e alla revisione del codice.",
+            "Collaborerai con il team di prodotto per definire le nuove funzionalità.",
+            "Migliorerai la qualità del codice con test automatici.",
+            "Documenterai le scelte tecniche del team.",
+        ],
+        "profil": "Hai esperienza con Python, database relazionali e lavoro in team.",
+    },
+}
+
+# Bruit typique d'une page d'offre : bandeau cookies, menus, partage, offres similaires
+BRUIT_DEBUT = (
+    "Accueil",
+    "Se connecter",
+    "Nous utilisons des cookies pour améliorer votre expérience, accepter ou paramétrer",
+    "Tout accepter",
+    "Partager cette offre",
+)
+BRUIT_FIN = (
+    "Postuler",
+    "Signaler cette offre",
+    "Offres similaires",
+    "Data Analyst H/F - Paris",
+    "Chef de projet IT - Nantes",
+    "Développeur Java - Lille",
+    "© 2024 JobBoard - Tous droits réservés",
+)
+
+LANGUES = tuple(OFFRES)
+
+
+def cv_lines(rng, pages):
+    """Lignes d'un CV : en-tête, compétences, expériences (autant que de pages), formation, langues"""
+    prenom, nom = rng.choice(PRENOMS), rng.choice(NOMS)
+    lines = [
+        f"{prenom} {nom}",
+        rng.choice(METIERS),
+        f"{prenom.lower()}.{nom.lower()}@example.com",
+        f"+33 6 {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)}",
+        "",
+        "COMPÉTENCES",
+        ", ".join(rng.sample(COMPETENCES, 8)),
+        "",
+        "EXPÉRIENCE",
+    ]
+    # Environ 45 lignes par page
+    annee = 2024
+    while len(lines) < pages * 45 - 12:
+        debut = annee - rng.randint(1, 3)
+        lines.append(f"{rng.choice(METIERS)} - {rng.choice(ENTREPRISES)} ({debut}-{annee})")
+        lines.extend(f"- {realisation}" for realisation in rng.sample(REALISATIONS, 4))
+        lines.append("")
+        annee = debut
+    lines += [
+        "FORMATION",
+        f"Master Informatique - {rng.choice(ECOLES)} ({annee - 2})",
+        "",
+        "LANGUES",
+        "Français, Anglais, Espagnol",
+    ]
+    return lines
+
+
+def make_cv_pdf(pages=1, seed=0):
+    """PDF d'un CV d'environ `pages` pages"""
+    rng = random.Random(f"cv-{seed}-{pages}")
+    pdf = FPDF()
+    # Date fixe : le même CV donne les mêmes octets (et la même empreinte SHA-256)
+    pdf.set_creation_date(datetime(2024, 1, 1, tzinfo=timezone.utc))
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    pdf.set_font('helvetica', size=10)
+    for line in cv_lines(rng, pages):
+        if line:
+            pdf.multi_cell(0, 5.5, line, new_x="LMARGIN", new_y="NEXT")
+        else:
+            pdf.ln(3)
+    return bytes(pdf.output())
+
+
+def make_offer(langue, seed=0, noisy=False):
+    """Texte d'une offre ; bruitée, elle est entourée de menus et de lignes répétées"""
+    rng = random.Random(f"offre-{langue}-{seed}-{noisy}")
+    base = OFFRES[langue]
+    missions = rng.sample(base["missions"], len(base["missions"]))
+    lines = [base["titre"], rng.choice(ENTREPRISES), base["intro"], *missions, base["profil"]]
+    if noisy:
+        lines = [*BRUIT_DEBUT, *lines, base["titre"], *BRUIT_FIN, *BRUIT_DEBUT[:2]]
+    return "\n".join(lines)
+
+
+def build_corpus(seed=0, cv_pages=(1, 2, 3, 4, 5), offers_per_language=2):
+    """
+    {"cvs": [{"pages", "pdf"}], "offers": [{"langue", "noisy", "content", "url"}]}
+    La moitié des offres de chaque langue est bruitée
+    """
+    cvs = [{"pages": pages, "pdf": make_cv_pdf(pages, seed)} for pages in cv_pages]
+    offers = []
+    for langue in LANGUES:
+        for index in range(offers_per_language):
+            noisy = index % 2 == 1
+            offers.append({
+                "langue": langue,
+                "noisy": noisy,
+                "content": make_offer(langue, seed + index, noisy),
+                "url": f"https://jobs.example.com/{langue}/{seed + index}",
+            })
+    return {"cvs": cvs, "offers": offers}
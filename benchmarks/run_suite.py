@@ -0,0 +1,251 @@
+"""
+Suite de benchmarks hors ligne du pipeline, avec le serveur LLM factice (fake_llm_server.py) :
+- micro-benchmarks : extraction du CV, détection de langue, nettoyage de l'offre,
+  construction du prompt, rendu du PDF,
+- passe complète /generate-letter via TestClient (upload des CV puis une lettre par offre),
+sur le corpus synthétique de corpus.py (CV de 1 à 5 pages, offres en 5 langues, propres et bruitées).
+
+Les résultats sont écrits en JSON et comparés à une référence : une mesure plus lente que
+la référence au-delà du seuil est une régression (code de sortie 1).
+
+    python benchmarks/run_suite.py -o resultats.json
+    python benchmarks/run_suite.py --update-baseline      # enregistre la référence
+    python benchmarks/run_suite.py --threshold 0.5 --token-delay 0.005
+    python benchmarks/run_suite.py --keep-workdir                # garde les CV, caches et bases créés
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from corpus import build_corpus
+from fake_llm_server import start_fake_server
+
+BASELINE_FILE = Path(__file__).resolve().parent / "baseline.json"
+
+# Seuil de régression par défaut : +30 % sur la médiane
+DEFAULT_THRESHOLD = 0.3
+
+# Mesure comparée à la référence (les autres sont informatives)
+COMPARED_METRIC = "p50_ms"
+
+
+def summarize(durations, **extra):
+    """Statistiques d'une série de durées (secondes) en millisecondes"""
+    ordered = sorted(durations)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        **extra,
+    }
+
+
+def measure(fn, items, repeat, before_pass=None):
+    """Durée de fn(*item) pour chaque élément, sur `repeat` passes"""
+    durations = []
+    for _ in range(repeat):
+        if before_pass:
+            before_pass()
+        for item in items:
+            started = time.perf_counter()
+            fn(*item)
+            durations.append(time.perf_counter() - started)
+    return durations
+
+
+def micro_benchmarks(corpus, repeat):
+    import language_id
+    from cv_profile import build_profile
+    from generateur_lettre_pdf import construire_prompt_parties, generer_pdf_lettre, generer_texte_lettre
+    from offer_cleaner import clean_offer
+    from parser_cv import extract_cv_content
+
+    results = {}
+    cvs = [(cv["pdf"],) for cv in corpus["cvs"]]
+    results["cv_extract"] = summarize(measure(extract_cv_content, cvs, repeat),
+                                      pages=sum(cv["pages"] for cv in corpus["cvs"]))
+
+    # Détection sans le cache de language_id : chaque passe refait la classification
+    language_id.preload()
+    offers = [(offer["content"],) for offer in corpus["offers"]]
+    durations = measure(language_id.language_of, offers, repeat, before_pass=language_id._cache.clear)
+    correct = sum(1 for offer in corpus["offers"] if language_id.language_of(offer["content"]) == offer["langue"])
+    results["language_detect"] = summarize(durations, accuracy=round(correct / len(offers), 3))
+
+    # Sans apprentissage par domaine : chaque passe voit les offres comme la première fois
+    cleaned = [(offer["content"], offer["url"], False) for offer in corpus["offers"]]
+    results["offer_clean"] = summarize(measure(clean_offer, cleaned, repeat))
+
+    cv_texts = [extract_cv_content(cv["pdf"]) for cv in corpus["cvs"]]
+    prompts = [(cv_text, offer["content"], offer["langue"]) for cv_text in cv_texts for offer in corpus["offers"]]
+    results["prompt_build"] = summarize(measure(construire_prompt_parties, prompts, repeat))
+
+    profile = build_profile(cv_texts[0])
+    letters = [(generer_texte_lettre(cv_texts[0], offer["content"], offer["langue"]), offer["langue"], profile)
+               for offer in corpus["offers"]]
+    results["pdf_render"] = summarize(measure(generer_pdf_lettre, letters, repeat))
+    return results
+
+
+def end_to_end(corpus):
+    """Upload des CV puis /generate-letter pour chaque offre (génération forcée, sans cache)"""
+    from fastapi.testclient import TestClient
+    import api_simple
+
+    upload_durations = []
+    letter_durations = []
+    failures = 0
+    started = time.perf_counter()
+    with TestClient(api_simple.app) as client:
+        cv_ids = []
+        for index, cv in enumerate(corpus["cvs"]):
+            begin = time.perf_counter()
+            response = client.post("/cv/upload", files={"cv_file": (f"cv_{index}.pdf", cv["pdf"], "application/pdf")})
+            upload_durations.append(time.perf_counter() - begin)
+            response.raise_for_status()
+            cv_ids.append(response.json()["cv_id"])
+
+        for index, offer in enumerate(corpus["offers"]):
+            begin = time.perf_counter()
+            response = client.post("/generate-letter", data={
+                "offre_content": offer["content"],
+                "langue": "auto",
+                "offre_url": offer["url"],
+                "cv_id": cv_ids[index % len(cv_ids)],
+                "force_regenerate": "true",
+            })
+            letter_durations.append(time.perf_counter() - begin)
+            if response.status_code != 200 or not response.content.startswith(b"%PDF"):
+                failures += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "cv_upload": summarize(upload_durations),
+        "generate_letter": summarize(letter_durations, failures=failures,
+                                     letters_per_sec=round(len(letter_durations) / elapsed, 2)),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Liste des régressions : (nom, référence, mesure, seuil) pour chaque mesure trop lente"""
+    thresholds = baseline.get("thresholds", {})
+    regressions = []
+    for name, reference in baseline.get("benchmarks", {}).items():
+        current = results["benchmarks"].get(name)
+        if current is None or not reference.get(COMPARED_METRIC):
+            continue
+        limit = thresholds.get(name, threshold)
+        if current[COMPARED_METRIC] > reference[COMPARED_METRIC] * (1 + limit):
+            regressions.append((name, reference[COMPARED_METRIC], current[COMPARED_METRIC], limit))
+        # Une détection moins juste ou des lettres en échec sont des régressions quelle que soit la vitesse
+        if current.get("accuracy", 1) < reference.get("accuracy", 0):
+            regressions.append((f"{name}.accuracy", reference["accuracy"], current["accuracy"], 0))
+        if current.get("failures", 0) > reference.get("failures", 0):
+            regressions.append((f"{name}.failures", reference.get("failures", 0), current["failures"], 0))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks hors ligne du pipeline de lettres")
+    parser.add_argument("-o", "--output", help="Fichier JSON des résultats")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE), help="Référence à comparer")
+    parser.add_argument("--update-baseline", action="store_true", help="Enregistre les résultats comme référence")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Ralentissement toléré sur la médiane (0.3 = +30 %%)")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes des micro-benchmarks")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Délai par token du LLM factice (s)")
+    parser.add_argument("--offers-per-language", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-e2e", action="store_true", help="Micro-benchmarks seulement")
+    parser.add_argument("--keep-workdir", action="store_true",
+                        help="Garde le répertoire de travail (CV, caches, bases SQLite) au lieu de le supprimer")
+    args = parser.parse_args()
+    # Chemins donnés par rapport au répertoire de lancement (l'API travaille ensuite ailleurs)
+    output_path = Path(args.output).resolve() if args.output else None
+    baseline_path = Path(args.baseline).resolve()
+
+    # Le LLM factice doit être en place avant l'import des modules qui lisent LLM_URL
+    server = start_fake_server(port=0, token_delay=args.token_delay)
+    os.environ["LLM_URL"] = server.url
+    os.environ.setdefault("JOB_WORKERS", "0")
+    # L'API crée ses dossiers (CV, lettres, caches) dans le répertoire courant, supprimé à la fin
+    if args.keep_workdir:
+        workdir_context = contextlib.nullcontext(tempfile.mkdtemp(prefix="bench_"))
+    else:
+        workdir_context = tempfile.TemporaryDirectory(prefix="bench_", ignore_cleanup_errors=True)
+    launch_dir = os.getcwd()
+    with workdir_context as workdir:
+        os.chdir(workdir)
+        os.environ.setdefault("OFFER_STATS_DB", os.path.join(workdir, "offer_stats.db"))
+        try:
+            corpus = build_corpus(args.seed, offers_per_language=args.offers_per_language)
+            print(f"📚 Corpus : {len(corpus['cvs'])} CV, {len(corpus['offers'])} offres (travail dans {workdir})")
+
+            benchmarks = micro_benchmarks(corpus, args.repeat)
+            if not args.skip_e2e:
+                benchmarks.update(end_to_end(corpus))
+        finally:
+            server.shutdown()
+            # Sortir du répertoire avant sa suppression
+            os.chdir(launch_dir)
+    if args.keep_workdir:
+        print(f"📁 Répertoire de travail conservé : {workdir}")
+
+    results = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "token_delay": args.token_delay,
+        },
+        "benchmarks": benchmarks,
+    }
+
+    print(f"\n{'mesure':<18}{'n':>6}{'moyenne':>12}{'médiane':>12}{'p95':>12}")
+    for name, values in benchmarks.items():
+        print(f"{name:<18}{values['count']:>6}{values['mean_ms']:>10.2f}ms{values['p50_ms']:>10.2f}ms"
+              f"{values['p95_ms']:>10.2f}ms")
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Résultats écrits dans {output_path}")
+
+    if args.update_baseline:
+        previous = json.loads(baseline_path.read_text(encoding='utf-8')) if baseline_path.exists() else {}
+        results["thresholds"] = previous.get("thresholds", {})
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n", encoding='utf-8')
+        print(f"📌 Référence enregistrée dans {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print("ℹ️  Pas de référence : lancer avec --update-baseline pour en créer une")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding='utf-8'))
+    if baseline.get("meta", {}).get("token_delay") != args.token_delay:
+        print("⚠️  Délai par token différent de la référence : la passe complète n'est pas comparable")
+    regressions = compare(results, baseline, args.threshold)
+    if not regressions:
+        print(f"\n✅ Pas de régression par rapport à {baseline_path.name}")
+        return 0
+    print(f"\n❌ {len(regressions)} régression(s) par rapport à {baseline_path.name} :")
+    for name, reference, current, limit in regressions:
+        print(f"   {name} : {reference} → {current} (seuil +{limit:.0%})")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Cache du texte extrait des CV, indexé par le SHA-256 du fichier PDF.
+
+Le texte (avec le nombre de pages et la durée du parsing) est calculé une seule fois
+puis enregistré à côté du PDF (<sha256>.json) ; un cache LRU en mémoire évite même
+la relecture de ce fichier. Si le PDF change sur le disque, son empreinte change et
+le CV est parsé à nouveau.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from parser_cv import extract_cv_document
+
+CV_CACHE_SIZE = int(os.environ.get("CV_CACHE_SIZE", "128"))
+
+_memory_cache = OrderedDict()
+# chemin -> (mtime_ns, taille, sha256) pour ne pas re-hasher un fichier inchangé
+_file_hashes = {}
+_lock = threading.Lock()
+
+
+def file_sha256(pdf_path):
+    """Calcule le SHA-256 d'un fichier par blocs"""
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cached_sha256(pdf_path):
+    """SHA-256 du fichier, recalculé seulement si sa date ou sa taille a changé"""
+    path = str(Path(pdf_path).resolve())
+    stat = os.stat(path)
+    with _lock:
+        known = _file_hashes.get(path)
+    if known and known[:2] == (stat.st_mtime_ns, stat.st_size):
+        return known[2]
+
+    sha256 = file_sha256(path)
+    with _lock:
+        _file_hashes[path] = (stat.st_mtime_ns, stat.st_size, sha256)
+    if known and known[2] != sha256:
+        # Le fichier a changé : l'ancienne extraction n'est plus valable
+        invalidate(known[2], Path(path).parent)
+    return sha256
+
+
+def _sidecar_path(pdf_path, sha256):
+    return Path(pdf_path).parent / f"{sha256}.json"
+
+
+def _remember(entry):
+    with _lock:
+        _memory_cache[entry["sha256"]] = entry
+        _memory_cache.move_to_end(entry["sha256"])
+        while len(_memory_cache) > CV_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def get_cv_content(pdf_path, sha256=None, content=None):
+    """
+    Retourne le contenu extrait du CV :
+    {"sha256", "text", "pages", "parse_time"}
+    Le PDF n'est parsé que si aucune extraction n'existe pour son empreinte,
+    depuis content (bytes déjà lus, sans relire le fichier) s'il est fourni.
+    """
+    sha256 = sha256 or cached_sha256(pdf_path)
+
+    with _lock:
+        entry = _memory_cache.get(sha256)
+        if entry is not None:
+            _memory_cache.move_to_end(sha256)
+            return entry
+
+    sidecar = _sidecar_path(pdf_path, sha256)
+    if sidecar.exists():
+        try:
+            with open(sidecar, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if entry.get("sha256") == sha256:
+                _remember(entry)
+                return entry
+        except (OSError, ValueError):
+            pass
+
+    started = time.perf_counter()
+    document = extract_cv_document(content if content is not None else pdf_path)
+    entry = {
+        "sha256": sha256,
+        "text": document["text"],
+        "pages": document["pages"],
+        "parse_time": round(time.perf_counter() - started, 4),
+    }
+
+    # Écriture atomique pour ne jamais laisser un fichier à moitié écrit
+    tmp_path = sidecar.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, sidecar)
+
+    _remember(entry)
+    return entry
+
+
+def invalidate(sha256, storage_dir):
+    """Oublie l'extraction associée à une empreinte"""
+    with _lock:
+        _memory_cache.pop(sha256, None)
+    try:
+        (Path(storage_dir) / f"{sha256}.json").unlink()
+    except FileNotFoundError:
+        pass
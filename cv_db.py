@@ -0,0 +1,150 @@
+"""
+Métadonnées des CV dans une base SQLite (mode WAL).
+
+Remplace cv_metadata.json : chaque opération ne touche qu'une ligne, les lectures
+sont indexées (id, last_used) et plusieurs workers uvicorn peuvent écrire sans perdre
+de mises à jour. Le fichier JSON existant est migré une seule fois au démarrage.
+"""
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cvs (
+    id TEXT PRIMARY KEY,
+    original_filename TEXT,
+    upload_date TEXT,
+    last_used TEXT,
+    path TEXT NOT NULL,
+    sha256 TEXT,
+    pages INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_cvs_last_used ON cvs(last_used DESC);
+CREATE INDEX IF NOT EXISTS idx_cvs_sha256 ON cvs(sha256);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO state(key, value) VALUES ('version', 0);
+"""
+
+
+def open_connection(db_path):
+    """Connexion SQLite en mode WAL, transactions gérées explicitement"""
+    conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+COLUMNS = ("id", "original_filename", "upload_date", "last_used", "path", "sha256", "pages")
+
+
+class CVDatabase:
+    """Accès aux métadonnées des CV (une connexion SQLite par thread)"""
+
+    def __init__(self, db_path, legacy_json=None):
+        self.db_path = str(db_path)
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+        if legacy_json is not None:
+            self.migrate_json(legacy_json)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = open_connection(self.db_path)
+        return conn
+
+    def _connect(self, write=False):
+        return Transaction(self._connection(), immediate=write)
+
+    def migrate_json(self, json_path):
+        """Importe l'ancien cv_metadata.json puis le renomme pour ne pas le rejouer"""
+        json_path = Path(json_path)
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            # Rien à migrer (ou déjà migré par un autre worker)
+            return 0
+
+        with self._connect(write=True) as conn:
+            for entry in metadata.values():
+                conn.execute(
+                    f"INSERT OR IGNORE INTO cvs({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    [entry.get(column) for column in COLUMNS]
+                )
+            self._bump_version(conn)
+        try:
+            os.replace(json_path, json_path.with_suffix(".json.migrated"))
+        except FileNotFoundError:
+            pass
+        return len(metadata)
+
+    @staticmethod
+    def _bump_version(conn):
+        conn.execute("UPDATE state SET value = value + 1 WHERE key = 'version'")
+
+    def get(self, cv_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM cvs WHERE id = ?", (cv_id,)).fetchone()
+        return dict(row) if row else None
+
+    def upsert(self, entry):
+        """Crée ou met à jour un CV ; la date d'upload d'origine est conservée"""
+        with self._connect(write=True) as conn:
+            conn.execute(
+                f"""INSERT INTO cvs({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})
+                ON CONFLICT(id) DO UPDATE SET
+                    original_filename = excluded.original_filename,
+                    last_used = excluded.last_used,
+                    path = excluded.path,
+                    sha256 = excluded.sha256,
+                    pages = excluded.pages""",
+                [entry.get(column) for column in COLUMNS]
+            )
+            self._bump_version(conn)
+
+    def touch(self, cv_id, last_used):
+        """Met à jour la date d'utilisation d'un seul CV"""
+        with self._connect(write=True) as conn:
+            conn.execute("UPDATE cvs SET last_used = ? WHERE id = ?", (last_used, cv_id))
+            self._bump_version(conn)
+
+    def list(self, limit=50, offset=0):
+        """CV triés par date d'utilisation (plus récent en premier)"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM cvs ORDER BY last_used DESC, id LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM cvs").fetchone()[0]
+
+    def version(self):
+        """Compteur incrémenté à chaque écriture (sert d'ETag pour /cv/list)"""
+        with self._connect() as conn:
+            return conn.execute("SELECT value FROM state WHERE key = 'version'").fetchone()[0]
+
+
+class Transaction:
+    """Transaction courte ; BEGIN IMMEDIATE pour les écritures afin de les sérialiser entre processus"""
+
+    def __init__(self, conn, immediate=False):
+        self.conn = conn
+        self.immediate = immediate
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE" if self.immediate else "BEGIN")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,248 @@
+"""
+Profil structuré du CV (contact, compétences, expériences, formation, langues).
+
+Le profil est construit une seule fois par contenu de CV, en tâche de fond après
+/cv/upload, et enregistré à côté du PDF (<sha256>.profile.json). La génération
+envoie au modèle ce profil compact plutôt que le texte brut extrait par PyMuPDF,
+et l'en-tête du PDF (nom, téléphone, email) en est tiré.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from metrics import timed
+from prompt_builder import clean_lines, is_heading
+
+# À incrémenter à chaque changement du format ou de l'extraction (les profils sont reconstruits)
+PROFILE_VERSION = 1
+
+CV_PROFILE_CACHE_SIZE = int(os.environ.get("CV_PROFILE_CACHE_SIZE", "128"))
+
+# Limites pour garder le profil compact
+MAX_ITEMS = 30
+MAX_ENTRY_CHARS = 300
+MAX_OTHER_CHARS = 300
+
+SECTION_TYPES = {
+    "skills": ("compétence", "competence", "skill", "habilidades", "kenntnisse", "fähigkeiten", "competenze",
+               "outils", "tools", "technologies", "savoir-faire"),
+    "experiences": ("expérience", "experience", "experiencia", "erfahrung", "berufserfahrung", "esperienz",
+                    "parcours", "employment", "work history", "emplois"),
+    "education": ("formation", "education", "éducation", "formación", "ausbildung", "studium", "istruzione",
+                  "études", "etudes", "diplôme", "studies"),
+    "languages": ("langue", "language", "idioma", "sprache", "lingu"),
+}
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(\.[\w-]+)+")
+PHONE_RE = re.compile(r"(\+\d{1,3}[\s.-]?)?\(?\d{1,4}\)?([\s.-]?\d{2,4}){3,5}")
+LINK_RE = re.compile(r"(https?://\S+|(www\.)?(linkedin\.com|github\.com|gitlab\.com)/\S+)", re.IGNORECASE)
+YEAR_RE = re.compile(r"\b(19|20)\d{2}\b")
+ITEM_SEPARATORS = re.compile(r"\s*(?:[,;•|·]|\s[-–]\s)\s*")
+
+_memory_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def section_type(heading):
+    lower = heading.lower()
+    for kind, keywords in SECTION_TYPES.items():
+        if any(keyword in lower for keyword in keywords):
+            return kind
+    return None
+
+
+def split_sections(lines):
+    """(en-tête avant le premier titre, [(titre, lignes)])"""
+    header = []
+    sections = []
+    for line in lines:
+        # La première ligne est le nom, même écrit en majuscules
+        if line and is_heading(line) and (header or sections or section_type(line)):
+            sections.append((line.rstrip(':').strip(), []))
+        elif sections:
+            sections[-1][1].append(line)
+        else:
+            header.append(line)
+    return header, sections
+
+
+def split_items(lines):
+    """Éléments d'une liste (compétences, langues) séparés par virgules, puces ou lignes"""
+    items = []
+    seen = set()
+    for line in lines:
+        # "Langages : Python, Java" -> on garde la liste, le libellé sert de contexte
+        label, _, rest = line.partition(':')
+        parts = ITEM_SEPARATORS.split(rest if rest.strip() and len(label) < 30 else line)
+        for part in parts:
+            item = part.strip(" -–•*")
+            if item and len(item) <= 60 and item.lower() not in seen:
+                seen.add(item.lower())
+                items.append(item)
+    return items[:MAX_ITEMS]
+
+
+def split_entries(lines):
+    """
+    Entrées d'une section (un poste, un diplôme) : une nouvelle entrée commence après
+    une ligne vide ou sur une ligne contenant une année quand l'entrée en cours en a déjà une
+    """
+    entries = []
+    current = []
+    for line in lines:
+        if not line:
+            if current:
+                entries.append(current)
+                current = []
+            continue
+        if current and YEAR_RE.search(line) and any(YEAR_RE.search(part) for part in current):
+            # Format "poste / dates" : la ligne précédant les dates est le titre de l'entrée suivante
+            carried = []
+            if len(current) >= 3 and not YEAR_RE.search(current[0]) and not YEAR_RE.search(current[-1]):
+                carried = [current.pop()]
+            entries.append(current)
+            current = carried
+        current.append(line.strip(" -–•*"))
+    if current:
+        entries.append(current)
+
+    compact = []
+    for entry in entries:
+        text = " — ".join(part for part in entry if part)
+        if text:
+            compact.append(text[:MAX_ENTRY_CHARS])
+    return compact[:MAX_ITEMS]
+
+
+def extract_contact(lines):
+    contact = {"name": None, "headline": None, "email": None, "phone": None, "links": []}
+    for line in lines:
+        if not line:
+            continue
+        email = EMAIL_RE.search(line)
+        if email and not contact["email"]:
+            contact["email"] = email.group(0)
+        for link in LINK_RE.findall(line):
+            if link[0] not in contact["links"]:
+                contact["links"].append(link[0])
+        phone = PHONE_RE.search(EMAIL_RE.sub(" ", LINK_RE.sub(" ", line)))
+        if phone and not contact["phone"] and len(re.sub(r"\D", "", phone.group(0))) >= 9:
+            contact["phone"] = phone.group(0).strip()
+        if email or phone or LINK_RE.search(line):
+            continue
+        # Première ligne courte faite de lettres : le nom ; la suivante : le titre du profil
+        if contact["name"] is None and len(line.split()) <= 5 and re.fullmatch(r"[^\W\d_][\w' .-]*", line):
+            contact["name"] = line.title() if line.isupper() else line
+        elif contact["headline"] is None and contact["name"] is not None and len(line) <= 100:
+            contact["headline"] = line
+    return contact
+
+
+@timed("cv_profile")
+def build_profile(cv_text):
+    """Construit le profil structuré à partir du texte extrait du CV"""
+    lines = clean_lines(cv_text)
+    header, sections = split_sections(lines)
+
+    profile = {
+        "version": PROFILE_VERSION,
+        **extract_contact(header[:15] or lines[:15]),
+        "skills": [],
+        "experiences": [],
+        "education": [],
+        "languages": [],
+        "other": [],
+    }
+    for title, body in sections:
+        kind = section_type(title)
+        if kind in ("skills", "languages"):
+            profile[kind].extend(split_items([line for line in body if line]))
+        elif kind in ("experiences", "education"):
+            profile[kind].extend(split_entries(body))
+        else:
+            text = " ".join(line for line in body if line)
+            if text:
+                profile["other"].append({"title": title, "text": text[:MAX_OTHER_CHARS]})
+
+    # CV sans titres reconnaissables : on garde le texte nettoyé pour ne rien perdre
+    if not (profile["skills"] or profile["experiences"] or profile["education"]):
+        profile["text"] = "\n".join(line for line in lines if line)
+    return profile
+
+
+def profile_to_text(profile):
+    """Version texte compacte du profil, envoyée au modèle à la place du CV brut"""
+    parts = []
+    header = [profile.get("name"), profile.get("headline")]
+    parts.append("\n".join(value for value in header if value))
+    if profile.get("text"):
+        parts.append(profile["text"])
+    if profile.get("skills"):
+        parts.append("SKILLS\n" + ", ".join(profile["skills"]))
+    if profile.get("experiences"):
+        parts.append("EXPERIENCE\n" + "\n".join(f"- {entry}" for entry in profile["experiences"]))
+    if profile.get("education"):
+        parts.append("EDUCATION\n" + "\n".join(f"- {entry}" for entry in profile["education"]))
+    if profile.get("languages"):
+        parts.append("LANGUAGES\n" + ", ".join(profile["languages"]))
+    for other in profile.get("other", []):
+        parts.append(f"{other['title'].upper()}\n{other['text']}")
+    return "\n\n".join(part for part in parts if part)
+
+
+def cv_for_prompt(cv):
+    """Texte du CV pour le prompt : le profil s'il est disponible, sinon le texte brut"""
+    profile = cv.get("profile")
+    return profile_to_text(profile) if profile else cv["text"]
+
+
+def _profile_path(pdf_path, sha256):
+    return Path(pdf_path).parent / f"{sha256}.profile.json"
+
+
+def _remember(sha256, profile):
+    with _lock:
+        _memory_cache[sha256] = profile
+        _memory_cache.move_to_end(sha256)
+        while len(_memory_cache) > CV_PROFILE_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def load_profile(pdf_path, sha256):
+    """Profil déjà construit pour ce contenu, ou None"""
+    with _lock:
+        profile = _memory_cache.get(sha256)
+    if profile is not None:
+        return profile
+    try:
+        with open(_profile_path(pdf_path, sha256), 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if profile.get("version") != PROFILE_VERSION:
+        return None
+    _remember(sha256, profile)
+    return profile
+
+
+def get_cv_profile(pdf_path, sha256, cv_text):
+    """Retourne le profil du CV, construit et enregistré à côté du PDF s'il n'existe pas"""
+    profile = load_profile(pdf_path, sha256)
+    if profile is not None:
+        return profile
+
+    started = time.perf_counter()
+    profile = build_profile(cv_text)
+    path = _profile_path(pdf_path, sha256)
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    _remember(sha256, profile)
+    print(f"🧾 Profil du CV {sha256[:12]} construit en {time.perf_counter() - started:.3f} s "
+          f"({len(cv_text)} → {len(profile_to_text(profile))} caractères)")
+    return profile
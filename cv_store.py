@@ -0,0 +1,92 @@
+"""
+Stockage des CV adressé par contenu.
+
+Chaque PDF est enregistré une seule fois sous <sha256>.pdf (store_cv_bytes) : un fichier
+déjà présent n'est pas réécrit. Les identifiants montrés à l'utilisateur (cv_id) ne sont
+que des alias vers cette empreinte.
+
+Un upload est lu une seule fois (read_cv_upload) : la taille est limitée à CV_MAX_MB
+dès le premier bloc en trop, le début du fichier doit être celui d'un PDF et l'empreinte
+est calculée au fil de la lecture. Le contenu reste en mémoire pour le parsing.
+
+Configuration :
+- CV_MAX_MB : taille maximale d'un CV uploadé, défaut 10
+"""
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+CHUNK_SIZE = 64 * 1024
+CV_MAX_MB = float(os.environ.get("CV_MAX_MB", "10"))
+CV_MAX_BYTES = int(CV_MAX_MB * 1024 * 1024)
+
+# Un PDF commence par "%PDF-" (quelques lecteurs tolèrent des octets avant, dans le premier kilo-octet)
+PDF_MAGIC = b"%PDF-"
+PDF_MAGIC_WINDOW = 1024
+
+
+class CVTooLargeError(Exception):
+    """CV plus gros que CV_MAX_MB"""
+
+
+class NotAPDFError(Exception):
+    """Le contenu uploadé n'est pas un PDF"""
+
+
+def blob_path(storage_dir, sha256):
+    return Path(storage_dir) / f"{sha256}.pdf"
+
+
+async def read_cv_upload(upload, max_bytes=CV_MAX_BYTES):
+    """
+    Lit un UploadFile par blocs en une passe : retourne (contenu, sha256).
+    Lève CVTooLargeError dès que la limite est dépassée et NotAPDFError si le
+    début du fichier n'est pas celui d'un PDF.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise CVTooLargeError(f"Le CV dépasse {max_bytes / (1024 * 1024):g} Mo")
+    digest = hashlib.sha256()
+    content = bytearray()
+    magic_checked = False
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if len(content) + len(chunk) > max_bytes:
+            raise CVTooLargeError(f"Le CV dépasse {max_bytes / (1024 * 1024):g} Mo")
+        digest.update(chunk)
+        content += chunk
+        # Vérifié dès le premier kilo-octet : inutile de lire 10 Mo d'un fichier qui n'est pas un PDF
+        if not magic_checked and len(content) >= PDF_MAGIC_WINDOW:
+            if PDF_MAGIC not in content[:PDF_MAGIC_WINDOW]:
+                raise NotAPDFError("Le fichier n'est pas un PDF valide")
+            magic_checked = True
+    if not magic_checked and PDF_MAGIC not in content:
+        raise NotAPDFError("Le fichier n'est pas un PDF valide")
+    return bytes(content), digest.hexdigest()
+
+
+def store_cv_bytes(content, sha256, storage_dir):
+    """Écrit un CV déjà lu et haché dans le stockage (rien si ce contenu y est déjà) ; retourne son chemin"""
+    final_path = blob_path(storage_dir, sha256)
+    if final_path.exists():
+        return str(final_path)
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=storage_dir)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(content)
+        os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return str(final_path)
+
+
+def make_cv_id(filename, sha256):
+    """Alias lisible : nom du fichier + début de l'empreinte du contenu"""
+    stem = re.sub(r'\.pdf$', '', filename or 'cv', flags=re.IGNORECASE)
+    stem = re.sub(r'[^\w\-]+', '_', stem).strip('_') or 'cv'
+    return f"{stem}_{sha256[:12]}"
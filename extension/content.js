@@ -31,18 +31,19 @@ function extractJobContent() {
     for (const selector of selectors) {
         const element = document.querySelector(selector);
         if (element && element.textContent.trim().length > 100) {
-            content = element.textContent.trim();
+            // innerText garde les retours à la ligne : l'API s'en sert pour retirer le bruit
+            content = (element.innerText || element.textContent).trim();
             break;
         }
     }
     
     // Si aucun sélecteur spécifique ne fonctionne, prendre le contenu principal
     if (!content || content.length < 100) {
-        const bodyText = document.body.textContent || document.body.innerText || '';
+        const bodyText = document.body.innerText || document.body.textContent || '';
         const lines = bodyText.split('\n')
             .map(line => line.trim())
             .filter(line => line.length > 5 && !line.includes('Cookie') && !line.includes('JavaScript'));
-        content = lines.join(' ').substring(0, 5000);
+        content = lines.join('\n').substring(0, 20000);
     }
     
     return content;
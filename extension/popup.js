@@ -255,7 +255,7 @@ async function generateCoverLetter() {
             headers: {
                 'Content-Type': 'application/x-www-form-urlencoded',
             },
-            body: `content=${encodeURIComponent(jobContent)}`
+            body: `content=${encodeURIComponent(jobContent)}&url=${encodeURIComponent(jobUrl)}`
         });
         
         const langData = await langResponse.json();
@@ -266,6 +266,7 @@ async function generateCoverLetter() {
         const formData = new FormData();
         formData.append('offre_content', jobContent);
         formData.append('langue', langue);
+        formData.append('offre_url', jobUrl);
         
         if (cvId) {
             // Utiliser CV existant
@@ -275,10 +276,10 @@ async function generateCoverLetter() {
             formData.append('cv_file', cvFile);
         }
         
-        console.log('Envoi vers l\'API...');
+        console.log('Envoi vers l\'API (streaming)...');
         
-        // Envoyer la requête
-        const response = await fetch(`${API_BASE_URL}/generate-letter`, {
+        // Envoyer la requête : le texte arrive au fil de la génération
+        const response = await fetch(`${API_BASE_URL}/generate-letter/stream`, {
             method: 'POST',
             body: formData
         });
@@ -286,8 +287,38 @@ async function generateCoverLetter() {
         console.log('Réponse API:', response.status);
         
         if (response.ok) {
-            // L'API retourne maintenant un PDF directement
-            const pdfBlob = await response.blob();
+            const preview = document.getElementById('preview');
+            preview.textContent = '';
+            preview.style.display = 'block';
+            
+            const result = await readLetterStream(response, (text) => {
+                preview.textContent += text;
+                preview.scrollTop = preview.scrollHeight;
+            });
+            
+            if (result.error) {
+                console.error('Erreur API:', result.error);
+                showStatus(`Erreur API: ${result.error.detail}`, 'error');
+                return;
+            }
+            if (!result.done) {
+                // Flux coupé sans fin annoncée (timeout d'un proxy, redémarrage du serveur)
+                console.error('Flux interrompu avant la fin de la génération');
+                showStatus('Génération interrompue avant la fin. Veuillez réessayer.', 'error');
+                return;
+            }
+            console.log('Génération terminée:', result.done);
+            
+            // Récupérer le PDF rendu côté serveur
+            const pdfResponse = await fetch(`${API_BASE_URL}${result.done.download_url}`);
+            if (!pdfResponse.ok) {
+                // Lettre expirée ou introuvable : ne pas enregistrer la réponse d'erreur comme un PDF
+                const error = await pdfResponse.text();
+                console.error('Erreur PDF:', pdfResponse.status, error);
+                showStatus(`PDF indisponible (${pdfResponse.status}), veuillez relancer la génération`, 'error');
+                return;
+            }
+            const pdfBlob = await pdfResponse.blob();
             console.log('PDF reçu, taille:', pdfBlob.size);
             
             // Si un nouveau CV a été utilisé, recharger la liste
@@ -300,8 +331,13 @@ async function generateCoverLetter() {
             showStatus(`Lettre PDF générée avec succès en ${langue} !`, 'success');
         } else {
             const error = await response.text();
+            const retryAfter = response.headers.get('Retry-After');
             console.error('Erreur API:', error);
-            showStatus(`Erreur API: ${error}`, 'error');
+            if (retryAfter) {
+                showStatus(`Serveur occupé, réessayez dans ${retryAfter} s`, 'error');
+            } else {
+                showStatus(`Erreur API: ${error}`, 'error');
+            }
         }
         
     } catch (error) {
@@ -313,6 +349,44 @@ async function generateCoverLetter() {
     }
 }
 
+// Lecture du flux Server-Sent Events de /generate-letter/stream
+async function readLetterStream(response, onToken) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = {};
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Les événements sont séparés par une ligne vide
+        let separator;
+        while ((separator = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, separator);
+            buffer = buffer.slice(separator + 2);
+            
+            let eventName = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            const payload = data ? JSON.parse(data) : {};
+            
+            if (eventName === 'token') {
+                onToken(payload.text);
+            } else if (eventName === 'done') {
+                result.done = payload;
+            } else if (eventName === 'error') {
+                result.error = payload;
+            }
+        }
+    }
+    return result;
+}
+
 // Téléchargement de la lettre (texte - fonction conservée pour compatibilité)
 function downloadLetter(content, filename) {
     const blob = new Blob([content], { type: 'text/plain;charset=utf-8' });
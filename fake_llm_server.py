@@ -0,0 +1,310 @@
+"""
+Serveur LLM factice compatible Ollama (/api/generate) et llama.cpp (/completion).
+
+Permet de faire tourner l'API et les benchmarks sans modèle installé :
+    python fake_llm_server.py --port 11434 --token-delay 0.01
+puis lancer l'API avec LLM_URL=http://localhost:11434
+
+Le cache de prompt est simulé : chaque slot garde le dernier prompt traité et seuls
+les tokens après le préfixe commun sont "calculés" (--prefill-delay par token).
+Le chargement du modèle aussi : la première requête attend --load-delay secondes, et
+un prompt vide sur /api/generate ne fait que charger le modèle, comme avec Ollama.
+
+Pour tester la répartition sur plusieurs serveurs (llm_router.py) :
+    python fake_llm_server.py --port 11434 --instances 3 --token-delay 0.01
+démarre trois serveurs sur des ports consécutifs et affiche la valeur de LLM_URLS.
+`fail_status` (--fail-status) fait répondre les générations avec ce code d'erreur.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Lettres types renvoyées selon la langue demandée dans le prompt
+LETTRES = {
+    'anglais': (
+        "Dear Hiring Manager,\n\n"
+        "I am writing to express my strong interest in this position. My experience "
+        "matches the requirements described in your offer and I would be glad to "
+        "contribute to your team.\n\n"
+        "During my previous roles I developed solid technical and communication skills, "
+        "and I am confident that my profile fits your expectations.\n\n"
+        "I would welcome the opportunity to discuss my application with you.\n\n"
+        "Yours sincerely,"
+    ),
+    'français': (
+        "Madame, Monsieur,\n\n"
+        "Je me permets de vous adresser ma candidature pour ce poste. Mon expérience "
+        "correspond aux compétences décrites dans votre offre et je serais ravi de "
+        "rejoindre votre équipe.\n\n"
+        "Au cours de mes précédentes expériences, j'ai développé des compétences techniques "
+        "et relationnelles solides qui répondent à vos attentes.\n\n"
+        "Je me tiens à votre disposition pour un entretien.\n\n"
+        "Cordialement,"
+    ),
+    'espagnol': (
+        "Estimado/a responsable de contratación,\n\n"
+        "Me dirijo a ustedes para expresar mi interés por este puesto. Mi experiencia "
+        "corresponde a los requisitos de su oferta.\n\n"
+        "Quedo a su disposición para una entrevista.\n\n"
+        "Atentamente,"
+    ),
+    'allemand': (
+        "Sehr geehrte Damen und Herren,\n\n"
+        "hiermit bewerbe ich mich um die ausgeschriebene Stelle. Meine Erfahrung "
+        "entspricht den Anforderungen Ihres Angebots.\n\n"
+        "Über eine Einladung zu einem Gespräch freue ich mich.\n\n"
+        "Mit freundlichen Grüßen,"
+    ),
+    'italien': (
+        "Egregio responsabile delle assunzioni,\n\n"
+        "mi rivolgo a voi per esprimere il mio interesse per questa posizione. La mia "
+        "esperienza corrisponde ai requisiti della vostra offerta.\n\n"
+        "Resto a disposizione per un colloquio.\n\n"
+        "Cordiali saluti,"
+    ),
+}
+
+
+def lettre_pour_prompt(prompt):
+    """Choisit la lettre type correspondant à la langue demandée dans le prompt"""
+    match = re.search(r"cover letter in (\w+)", prompt)
+    langue = match.group(1) if match else 'anglais'
+    return LETTRES.get(langue, LETTRES['anglais'])
+
+
+def decouper_tokens(texte):
+    """Découpe grossièrement en tokens (mots et espaces) pour simuler un flux"""
+    return re.findall(r"\S+\s*|\s+", texte)
+
+
+def prefixe_commun(a, b):
+    """Nombre de tokens communs au début des deux listes"""
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeLLM/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": self.server.model}]})
+        elif self.path == "/health":
+            self._send_json({"status": "ok"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        if self.path not in ("/api/generate", "/completion"):
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        payload = self._read_json()
+        prompt = payload.get("prompt", "")
+        with self.server.stats_lock:
+            self.server.requests_count += 1
+        if self.server.fail_status:
+            self._send_json({"error": "panne simulée"}, status=self.server.fail_status)
+            return
+        with self.server.stats_lock:
+            self.server.active += 1
+            self.server.peak_active = max(self.server.peak_active, self.server.active)
+        try:
+            self._generate(payload, prompt)
+        finally:
+            with self.server.stats_lock:
+                self.server.active -= 1
+
+    def _generate(self, payload, prompt):
+        self.server.load_model()
+        if self.path == "/api/generate" and not prompt:
+            self._send_json({"model": payload.get("model", self.server.model), "response": "",
+                             "done": True, "done_reason": "load"})
+            return
+
+        # Prefill : seuls les tokens hors du préfixe déjà en cache sont calculés
+        prompt_tokens = prompt.split()
+        cached = self.server.prefill(prompt_tokens, payload.get("id_slot"),
+                                     self.path == "/api/generate" or payload.get("cache_prompt", False))
+        time.sleep(self.server.prefill_delay * (len(prompt_tokens) - cached))
+        if self.path == "/api/generate":
+            usage = {"prompt_eval_count": len(prompt_tokens) - cached}
+        else:
+            usage = {"tokens_evaluated": len(prompt_tokens), "tokens_cached": cached,
+                     "timings": {"prompt_n": len(prompt_tokens) - cached}}
+
+        tokens = decouper_tokens(lettre_pour_prompt(prompt))
+        max_tokens = (payload.get("options") or {}).get("num_predict") or payload.get("n_predict")
+        if max_tokens and max_tokens > 0:
+            tokens = tokens[:max_tokens]
+        if payload.get("stream"):
+            self._stream_tokens(tokens, usage)
+            return
+
+        time.sleep(self.server.token_delay * len(tokens))
+        texte = ''.join(tokens)
+
+        if self.path == "/api/generate":
+            self._send_json({
+                "model": payload.get("model", self.server.model),
+                "response": texte,
+                "done": True,
+                "eval_count": len(tokens),
+                **usage,
+            })
+        else:
+            self._send_json({
+                "content": texte,
+                "stop": True,
+                "tokens_predicted": len(tokens),
+                **usage,
+            })
+
+    def _stream_tokens(self, tokens, usage):
+        """Envoie les tokens un par un (NDJSON pour Ollama, SSE pour llama.cpp)"""
+        ollama = self.path == "/api/generate"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson" if ollama else "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(data):
+            line = json.dumps(data) + "\n"
+            if not ollama:
+                line = "data: " + line + "\n"
+            body = line.encode("utf-8")
+            self.wfile.write(f"{len(body):X}\r\n".encode("ascii") + body + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            for token in tokens:
+                time.sleep(self.server.token_delay)
+                write_chunk({"response": token, "done": False} if ollama else {"content": token, "stop": False})
+            write_chunk({"response": "", "done": True, "eval_count": len(tokens), **usage} if ollama
+                        else {"content": "", "stop": True, "tokens_predicted": len(tokens), **usage})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Le client a fermé la connexion (arrêt anticipé)
+            self.close_connection = True
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, token_delay=0.0, model="mistral", prefill_delay=0.0, slots=4, load_delay=0.0,
+                 fail_status=None):
+        super().__init__(address, FakeLLMHandler)
+        self.token_delay = token_delay
+        self.prefill_delay = prefill_delay
+        self.load_delay = load_delay
+        self.fail_status = fail_status
+        # Générations en cours et maximum observé (vérification des limites par serveur)
+        self.active = 0
+        self.peak_active = 0
+        self.loaded = False
+        self.load_lock = threading.Lock()
+        self.model = model
+        self.requests_count = 0
+        self.prefill_tokens = 0
+        self.cached_tokens = 0
+        self.stats_lock = threading.Lock()
+        # Dernier prompt traité par chaque slot
+        self.slots = [[] for _ in range(slots)]
+
+    def load_model(self):
+        """Simule le chargement des poids : seule la première requête attend"""
+        with self.load_lock:
+            if not self.loaded:
+                time.sleep(self.load_delay)
+                self.loaded = True
+
+    def prefill(self, prompt_tokens, slot_id=None, cache_prompt=True):
+        """
+        Choisit un slot (celui demandé, sinon celui au plus long préfixe commun)
+        et retourne le nombre de tokens du prompt repris de son cache
+        """
+        with self.stats_lock:
+            if slot_id is not None and 0 <= slot_id < len(self.slots):
+                index = slot_id
+            else:
+                index = max(range(len(self.slots)), key=lambda i: (prefixe_commun(self.slots[i], prompt_tokens), -i))
+            cached = prefixe_commun(self.slots[index], prompt_tokens) if cache_prompt else 0
+            self.slots[index] = list(prompt_tokens)
+            self.prefill_tokens += len(prompt_tokens) - cached
+            self.cached_tokens += cached
+        return cached
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_fake_server(port=0, token_delay=0.0, host="127.0.0.1", prefill_delay=0.0, slots=4, load_delay=0.0,
+                      fail_status=None):
+    """Démarre le serveur factice dans un thread et le retourne (port 0 = port libre)"""
+    server = FakeLLMServer((host, port), token_delay=token_delay, prefill_delay=prefill_delay, slots=slots,
+                           load_delay=load_delay, fail_status=fail_status)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def start_fake_servers(count, **kwargs):
+    """Démarre `count` serveurs factices sur des ports libres (LLM_URLS : leurs url séparées par des virgules)"""
+    return [start_fake_server(**kwargs) for _ in range(count)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur LLM factice pour les tests hors ligne")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-delay", type=float, default=0.0,
+                        help="Délai simulé par token généré (secondes)")
+    parser.add_argument("--prefill-delay", type=float, default=0.0,
+                        help="Délai simulé par token du prompt hors cache (secondes)")
+    parser.add_argument("--slots", type=int, default=4, help="Nombre de slots (contextes gardés en cache)")
+    parser.add_argument("--load-delay", type=float, default=0.0,
+                        help="Durée simulée du chargement du modèle à la première requête (secondes)")
+    parser.add_argument("--instances", type=int, default=1,
+                        help="Nombre de serveurs, sur des ports consécutifs à partir de --port")
+    parser.add_argument("--fail-status", type=int, default=None,
+                        help="Code d'erreur renvoyé à chaque génération (panne simulée)")
+    args = parser.parse_args()
+
+    servers = [start_fake_server(args.port + index, token_delay=args.token_delay, host=args.host,
+                                 prefill_delay=args.prefill_delay, slots=args.slots, load_delay=args.load_delay,
+                                 fail_status=args.fail_status)
+               for index in range(args.instances)]
+    for server in servers:
+        print(f"🤖 Serveur LLM factice sur {server.url}")
+    if len(servers) > 1:
+        print(f"   LLM_URLS={','.join(server.url for server in servers)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
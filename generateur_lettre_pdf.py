@@ -1,7 +1,90 @@
-import subprocess
+import functools
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date
+
 from fpdf import FPDF
 
-def generer_lettre(cv, offre, langue):
+from llm_backend import get_backend
+from metrics import output_chars, output_tokens, prompt_tokens, record_stage, stage, timed
+from prompt_builder import PROMPT_STABLE_CV, build_prompt_inputs, estimate_tokens
+from llm_limits import llm_limiter
+
+# À incrémenter à chaque modification du prompt ou du contrôle de la génération (invalide le cache des lettres)
+PROMPT_VERSION = 7
+
+# Formules de politesse par langue (ajoutées par le PDF, retirées du texte généré)
+FORMULES_OUVERTURE = {
+    'en': 'Dear Hiring Manager,',
+    'fr': 'Madame, Monsieur,',
+    'es': 'Estimado/a responsable de contratación,',
+    'de': 'Sehr geehrte Damen und Herren,',
+    'it': 'Egregio responsabile delle assunzioni,'
+}
+
+FORMULES_FERMETURE = {
+    'en': 'Yours sincerely,',
+    'fr': 'Cordialement,',
+    'es': 'Atentamente,',
+    'de': 'Mit freundlichen Grüßen,',
+    'it': 'Cordiali saluti,'
+}
+
+# Variantes fréquentes des formules de fermeture produites par le modèle
+FERMETURES_VARIANTES = ('sincerely', 'cordialement', 'best regards', 'kind regards', 'yours faithfully')
+
+OUVERTURE_RE = re.compile(
+    r"^(dear|madame|monsieur|mesdames|bonjour|estimad[oa]s?|sehr geehrte|egregi[oa]|gentile)\b[^\n]{0,80}$",
+    re.IGNORECASE
+)
+
+# Budget de génération : longueur visée et nombre moyen de caractères par token selon la langue
+LETTER_TARGET_CHARS = int(os.environ.get("LETTER_TARGET_CHARS", "1000"))
+LETTER_TOKEN_MARGIN = float(os.environ.get("LETTER_TOKEN_MARGIN", "1.5"))
+CARACTERES_PAR_TOKEN = {'en': 4.2, 'fr': 3.6, 'es': 3.7, 'de': 3.4, 'it': 3.7}
+
+# Ponctuation de fin de phrase (suivie d'un espace, ou en fin de texte) ou fin de ligne
+FIN_PHRASE_RE = re.compile(r'[.!?…]+["»)]?(?=\s|$)|\n')
+
+_arrets = Counter()
+_arrets_lock = threading.Lock()
+
+# Mise en page du PDF : police (Arial = Helvetica pour FPDF) et largeur du texte en mm
+POLICE = 'helvetica'
+LARGEUR_TEXTE = 180
+
+MOIS_FR = ('janvier', 'février', 'mars', 'avril', 'mai', 'juin',
+           'juillet', 'août', 'septembre', 'octobre', 'novembre', 'décembre')
+
+# Largeur des caractères par police (famille, style, taille), remplie au fil des lettres
+_largeurs_glyphes = {}
+
+def construire_prompt(cv, offre, langue, stable_cv=False):
+    """
+    Construit le prompt envoyé au modèle pour une offre et un CV
+    """
+    prefixe, suffixe = construire_prompt_parties(cv, offre, langue, stable_cv)
+    return prefixe + suffixe
+
+def cv_stable(backend):
+    """
+    Réduire le CV sans tenir compte de l'offre ? Utile seulement si le serveur garde
+    le contexte du préfixe ; sinon les blocs du CV sont choisis pour l'offre (BM25)
+    """
+    if PROMPT_STABLE_CV != "auto":
+        return PROMPT_STABLE_CV == "1"
+    return getattr(backend, "reuses_prefix", False)
+
+def construire_prompt_parties(cv, offre, langue, stable_cv=False):
+    """
+    Retourne (préfixe, suffixe) du prompt : instructions + CV, puis offre et langue.
+    Avec stable_cv, le préfixe ne dépend que du CV : le serveur du modèle peut en
+    garder le contexte d'une offre à l'autre.
+    """
     # Mapper les codes de langue vers des noms complets
     langue_mapping = {
         'en': 'anglais',
@@ -24,149 +107,342 @@ def generer_lettre(cv, offre, langue):
     
     exemple = exemples_debut.get(langue, exemples_debut['en'])
     
-    prompt = f"""You are an HR assistant. You MUST write a cover letter in {langue_complete}.
-CRITICAL: The entire letter MUST be written in {langue_complete}.
-
-Job offer (detected language: {langue}):
-{offre}
-
-CV:
-{cv}
-
-Example of how to start in {langue_complete}:
-{exemple}
+    # Ne garder que ce qui compte dans le CV et l'offre (budget de tokens)
+    cv, offre, stats = build_prompt_inputs(cv, offre, stable_cv=stable_cv)
+    if stats["saved_tokens"]:
+        print(f"✂️  Prompt réduit : {stats['original_tokens']} → {stats['final_tokens']} tokens "
+              f"({stats['saved_tokens']} économisés, {stats['cv_blocks_dropped']} bloc(s) du CV écartés)")
+    
+    prefixe = f"""You are an HR assistant. You write cover letters for the candidate below.
 
 Instructions:
-- Write the letter ONLY in {langue_complete}
 - Objectif : Around 1000 characters
 - Structure: Motivated introduction, profile/position match, conclusion with professional closing
 - Use a professional tone adapted to the country's culture
-- Ensure every single sentence is in {langue_complete}
 - Start directly with the letter content, no explanations
 - Write ONLY the letter content, no LaTeX formatting
 
+CV:
+{cv}
+
+"""
+
+    suffixe = f"""Job offer (detected language: {langue}):
+{offre}
+
+You MUST write a cover letter in {langue_complete}.
+CRITICAL: The entire letter MUST be written in {langue_complete}.
+Ensure every single sentence is in {langue_complete}.
+
+Example of how to start in {langue_complete}:
+{exemple}
+
 IMPORTANT: If the job offer is in English, write in English. If in French, write in French.
 RESPOND ONLY IN {langue_complete.upper()}!"""
 
-    result = subprocess.run(
-        ["ollama", "run", "mistral"],
-        input=prompt.encode("utf-8"),
-        stdout=subprocess.PIPE
-    )
-    lettre_content = result.stdout.decode("utf-8").strip()
+    return prefixe, suffixe
+
+def generer_texte_lettre(cv, offre, langue, backend=None):
+    """
+    Génère le texte brut de la lettre avec le backend LLM configuré
+    """
+    return ''.join(generer_texte_lettre_flux(cv, offre, langue, backend)).strip()
+
+def generer_texte_lettre_flux(cv, offre, langue, backend=None):
+    """
+    Génère le texte de la lettre morceau par morceau, au fil de la génération
+    (borné en tokens, arrêté à la formule de fermeture, sans formule d'ouverture).
+    L'appel au modèle prend une place de llm_limiter : API, jobs et lots se partagent
+    les LLM_MAX_CONCURRENT générations simultanées.
+    """
+    backend = backend or get_backend()
+    with stage("prompt_build"):
+        prefixe, suffixe = construire_prompt_parties(cv, offre, langue, cv_stable(backend))
+    prompt_tokens.observe(estimate_tokens(prefixe + suffixe))
+    max_tokens = budget_tokens(langue)
+    with llm_limiter.generation(), stage("llm_generate"):
+        morceaux = backend.stream(prefixe + suffixe, options={"max_tokens": max_tokens}, prefix=prefixe)
+        yield from controler_flux(morceaux, langue, max_tokens)
+
+def caracteres_par_token(langue):
+    return CARACTERES_PAR_TOKEN.get(langue, 3.8)
+
+def budget_tokens(langue):
+    """Nombre maximal de tokens à générer pour la longueur visée dans cette langue"""
+    # Marge pour les formules et les écarts du modèle autour de la longueur demandée
+    return int(LETTER_TARGET_CHARS / caracteres_par_token(langue) * LETTER_TOKEN_MARGIN) + 40
+
+def compter_tokens(texte, langue):
+    """Tokens d'un texte de la lettre, avec le même ratio que budget_tokens"""
+    return math.ceil(len(texte) / caracteres_par_token(langue))
+
+def fin_de_phrase(texte, depuis, jusqua, fin_ouverte=False):
+    """
+    Position juste après la dernière fin de phrase ou de ligne entre `depuis` et `jusqua`,
+    ou None. Une ponctuation en toute fin n'est retenue qu'avec fin_ouverte (le texte peut
+    continuer : "3" puis ".5")
+    """
+    position = None
+    for match in FIN_PHRASE_RE.finditer(texte, depuis, jusqua):
+        if match.end() < jusqua or fin_ouverte:
+            position = match.end()
+    return position
+
+def retirer_ouverture(texte):
+    """Retire la formule d'ouverture en tête du texte (le PDF ajoute la sienne)"""
+    debut = texte.lstrip()
+    premiere_ligne = debut.split('\n', 1)[0].strip()
+    formules = [f.rstrip(',').lower() for f in FORMULES_OUVERTURE.values()]
+    if OUVERTURE_RE.match(premiere_ligne) or premiere_ligne.rstrip(',').lower() in formules:
+        return debut[len(debut.split('\n', 1)[0]):].lstrip()
+    return texte
+
+def est_fermeture(ligne):
+    """
+    Vrai si la ligne est une formule de fermeture : la formule ouvre une ligne courte
+    ("Bien cordialement," mais pas "I sincerely believe that...")
+    """
+    minuscule = ligne.strip().lower()
+    formules = [f.rstrip(',').lower() for f in FORMULES_FERMETURE.values()] + list(FERMETURES_VARIANTES)
+    for formule in formules:
+        position = minuscule.find(formule)
+        if 0 <= position <= 20 and len(minuscule) <= position + len(formule) + 5:
+            return True
+    return False
+
+def chercher_fermeture(texte, depuis=0, fin=False):
+    """
+    Position du début de la première ligne de fermeture à partir de `depuis`, ou None.
+    La dernière ligne, pas encore terminée, n'est examinée qu'en fin de flux (fin=True).
+    """
+    debut = texte.rfind('\n', 0, depuis) + 1
+    while True:
+        fin_ligne = texte.find('\n', debut)
+        if fin_ligne == -1:
+            return debut if fin and est_fermeture(texte[debut:]) else None
+        if est_fermeture(texte[debut:fin_ligne]):
+            return debut
+        debut = fin_ligne + 1
+
+def controler_flux(morceaux, langue, max_tokens):
+    """
+    Relaie les morceaux du modèle en retirant l'ouverture, s'arrête dès la formule de
+    fermeture ou quand le budget de tokens est atteint, et compte la raison de l'arrêt.
+    Une ligne courte n'est envoyée qu'une fois terminée : ce peut être la formule de fermeture.
+    Un morceau n'est pas toujours un token (`ollama run` envoie des blocs de 1024 octets) :
+    les tokens sont estimés d'après le texte reçu, avec le ratio de budget_tokens. Le texte
+    est envoyé phrase par phrase : au budget, la lettre s'arrête à la dernière phrase complète.
+    """
+    ratio = caracteres_par_token(langue)
+    texte = ''
+    emis = 0
+    ouverture_traitee = False
+    recus = 0
+    caracteres = 0
+    tokens = 0
+    raison = 'fin'
+    debut = time.perf_counter()
+    try:
+        for morceau in morceaux:
+            recus += 1
+            if recus == 1:
+                record_stage("llm_first_token", time.perf_counter() - debut)
+            caracteres += len(morceau)
+            tokens = max(recus, math.ceil(caracteres / ratio))
+            texte += morceau
+            if not ouverture_traitee:
+                # Attendre la fin de la première ligne pour savoir si c'est une formule d'ouverture
+                if '\n' not in texte.lstrip() and len(texte) < 120 and tokens < max_tokens:
+                    continue
+                texte = retirer_ouverture(texte)
+                ouverture_traitee = True
+            if emis == 0:
+                texte = texte.lstrip()
+
+            fermeture = chercher_fermeture(texte, emis)
+            if fermeture is not None:
+                texte = texte[:fermeture]
+                raison = 'formule_fermeture'
+                break
+            if tokens >= max_tokens:
+                # Le dernier morceau peut dépasser le budget : son excédent n'est pas gardé, et
+                # la lettre s'arrête à la dernière phrase complète plutôt qu'au milieu d'un mot
+                excedent = max(caracteres - int(max_tokens * ratio), 0)
+                limite = max(len(texte) - excedent, emis)
+                coupe = fin_de_phrase(texte, emis, limite, fin_ouverte=True)
+                if coupe is None:
+                    # Pas de phrase terminée : au moins ne pas couper un mot
+                    coupe = max(texte.rfind(' ', emis, limite), emis)
+                texte = texte[:coupe]
+                tokens = min(tokens, max_tokens)
+                raison = 'budget_tokens'
+                break
+
+            # Lignes terminées ; d'une longue ligne (pas une formule de fermeture), les phrases terminées
+            debut_ligne = texte.rfind('\n') + 1
+            limite = debut_ligne
+            if len(texte) - debut_ligne > 60:
+                limite = fin_de_phrase(texte, max(emis, debut_ligne), len(texte)) or debut_ligne
+            if limite > emis:
+                yield texte[emis:limite]
+                emis = limite
+    finally:
+        # Fermer le flux du modèle arrête la génération côté serveur
+        if hasattr(morceaux, 'close'):
+            morceaux.close()
+
+    if not ouverture_traitee:
+        texte = retirer_ouverture(texte)
+    if raison == 'fin':
+        fermeture = chercher_fermeture(texte, emis, fin=True)
+        if fermeture is not None:
+            texte = texte[:fermeture]
+            raison = 'formule_fermeture'
+    texte = texte.rstrip()
+    if len(texte) > emis:
+        yield texte[emis:]
+
+    with _arrets_lock:
+        _arrets[raison] += 1
+    output_chars.observe(len(texte))
+    output_tokens.inc(tokens)
+
+def stats_arrets():
+    """Nombre de générations par raison d'arrêt"""
+    with _arrets_lock:
+        return dict(_arrets)
+
+def generer_lettre(cv, offre, langue, backend=None, profile=None):
+    lettre_content = generer_texte_lettre(cv, offre, langue, backend)
     
     # Générer le PDF
-    return generer_pdf_lettre(lettre_content, langue)
+    return generer_pdf_lettre(lettre_content, langue, profile)
+
+def date_lettre(langue, jour):
+    """Date affichée sous l'en-tête (en français pour 'fr', en anglais sinon)"""
+    if langue == 'fr':
+        return f"{jour.day:02d} {MOIS_FR[jour.month - 1]} {jour.year}"
+    return jour.strftime('%B %d, %Y')
+
+@functools.lru_cache(maxsize=256)
+def gabarit_lettre(langue, nom, telephone, email, jour):
+    """
+    Parties fixes de la lettre (en-tête, date, formules, signature) : calculées une
+    fois par profil, langue et jour puis réutilisées pour chaque lettre
+    """
+    return {
+        'coordonnees': tuple(c for c in (telephone, email) if c),
+        'nom': nom,
+        'date': date_lettre(langue, jour),
+        'ouverture': FORMULES_OUVERTURE.get(langue, FORMULES_OUVERTURE['en']),
+        'fermeture': FORMULES_FERMETURE.get(langue, FORMULES_FERMETURE['en']),
+    }
+
+def largeurs_glyphes(pdf):
+    """Table caractère -> largeur pour la police courante, partagée par toutes les lettres"""
+    cle = (pdf.font_family, pdf.font_style, pdf.font_size_pt)
+    table = _largeurs_glyphes.get(cle)
+    if table is None:
+        table = _largeurs_glyphes.setdefault(cle, {})
+    return table
 
-def generer_pdf_lettre(contenu_lettre, langue):
+def largeur_mot(pdf, table, mot):
+    largeur = 0.0
+    for caractere in mot:
+        largeur_caractere = table.get(caractere)
+        if largeur_caractere is None:
+            largeur_caractere = table[caractere] = pdf.get_string_width(caractere)
+        largeur += largeur_caractere
+    return largeur
+
+def couper_lignes(pdf, ligne, largeur_max=LARGEUR_TEXTE):
+    """
+    Découpe une ligne pour qu'elle tienne dans largeur_max : chaque mot est mesuré
+    une fois et la largeur de la ligne en cours est cumulée (coût linéaire)
+    """
+    table = largeurs_glyphes(pdf)
+    espace = largeur_mot(pdf, table, ' ')
+    lignes = []
+    courante = []
+    largeur = 0.0
+    for mot in ligne.split():
+        largeur_mot_courant = largeur_mot(pdf, table, mot)
+        # Comme avant, le premier mot est testé avec une espace devant (mais placé sans)
+        if largeur + espace + largeur_mot_courant < largeur_max:
+            largeur = largeur + espace + largeur_mot_courant if courante else largeur_mot_courant
+            courante.append(mot)
+        else:
+            if courante:
+                lignes.append(' '.join(courante))
+            courante = [mot]
+            largeur = largeur_mot_courant
+    if courante:
+        lignes.append(' '.join(courante))
+    return lignes
+
+@timed("pdf_render")
+def generer_pdf_lettre(contenu_lettre, langue, profile=None):
     """
     Génère un PDF professionnel de la lettre de motivation
+    L'en-tête et la signature viennent du profil du CV (nom, téléphone, email)
     """
-    
-    # Nettoyer le contenu
-    contenu_lettre = contenu_lettre.strip()
+    profile = profile or {}
+    gabarit = gabarit_lettre(langue, profile.get('name'), profile.get('phone'), profile.get('email'), date.today())
     
     # Extraire les parties de la lettre
-    paragraphes = [p.strip() for p in contenu_lettre.split('\n\n') if p.strip()]
-    
-    # Formules de politesse par langue
-    formules_ouverture = {
-        'en': 'Dear Hiring Manager,',
-        'fr': 'Madame, Monsieur,',
-        'es': 'Estimado/a responsable de contratación,',
-        'de': 'Sehr geehrte Damen und Herren,',
-        'it': 'Egregio responsabile delle assunzioni,'
-    }
-    
-    formules_fermeture = {
-        'en': 'Yours sincerely,',
-        'fr': 'Cordialement,',
-        'es': 'Atentamente,',
-        'de': 'Mit freundlichen Grüßen,',
-        'it': 'Cordiali saluti,'
-    }
-    
-    ouverture = formules_ouverture.get(langue, formules_ouverture['en'])
-    fermeture = formules_fermeture.get(langue, formules_fermeture['en'])
+    paragraphes = [p.strip() for p in contenu_lettre.strip().split('\n\n') if p.strip()]
     
     # Créer le PDF avec FPDF
     pdf = FPDF()
     pdf.add_page()
-    pdf.set_font('Arial', size=12)
     
     # En-tête avec informations personnelles
-    pdf.set_font('Arial', 'B', 14)
-    pdf.cell(0, 10, 'Camille Dupré La Tour', ln=True, align='R')
-    pdf.set_font('Arial', size=10)
-    pdf.cell(0, 5, '+33 7 68 05 88 22', ln=True, align='R')
-    pdf.cell(0, 5, 'camille.duprelatour@email.com', ln=True, align='R')
+    if gabarit['nom']:
+        pdf.set_font(POLICE, 'B', 14)
+        pdf.cell(0, 10, gabarit['nom'], ln=True, align='R')
+    pdf.set_font(POLICE, size=10)
+    for coordonnee in gabarit['coordonnees']:
+        pdf.cell(0, 5, coordonnee, ln=True, align='R')
     pdf.ln(10)
     
     # Date
-    from datetime import datetime
-    date_str = datetime.now().strftime('%B %d, %Y')
-    if langue == 'fr':
-        months_fr = {
-            'January': 'janvier', 'February': 'février', 'March': 'mars',
-            'April': 'avril', 'May': 'mai', 'June': 'juin',
-            'July': 'juillet', 'August': 'août', 'September': 'septembre',
-            'October': 'octobre', 'November': 'novembre', 'December': 'décembre'
-        }
-        for en, fr in months_fr.items():
-            date_str = date_str.replace(en, fr)
-        date_str = datetime.now().strftime(f'%d {months_fr[datetime.now().strftime("%B")]} %Y')
-    
-    pdf.set_font('Arial', size=10)
-    pdf.cell(0, 5, date_str, ln=True, align='L')
+    pdf.cell(0, 5, gabarit['date'], ln=True, align='L')
     pdf.ln(10)
     
-    
     # Formule d'ouverture
-    pdf.set_font('Arial', size=12)
-    pdf.cell(0, 8, ouverture, ln=True)
+    pdf.set_font(POLICE, size=12)
+    pdf.cell(0, 8, gabarit['ouverture'], ln=True)
     pdf.ln(5)
     
     # Corps de la lettre
-    pdf.set_font('Arial', size=11)
+    pdf.set_font(POLICE, size=11)
     
     # Traiter chaque paragraphe
     for paragraphe in paragraphes:
         # Supprimer les formules d'ouverture/fermeture si déjà présentes
-        if any(formule in paragraphe for formule in formules_ouverture.values()):
+        if any(formule in paragraphe for formule in FORMULES_OUVERTURE.values()):
             continue
-        if any(formule in paragraphe for formule in formules_fermeture.values()):
+        if any(formule in paragraphe for formule in FORMULES_FERMETURE.values()):
             continue
         if 'sincerely' in paragraphe.lower() or 'cordialement' in paragraphe.lower():
             continue
             
-        # Ajouter le paragraphe avec gestion des sauts de ligne
-        lines = paragraphe.split('\n')
-        for line in lines:
-            if line.strip():
-                # Gérer les lignes trop longues
-                words = line.strip().split(' ')
-                current_line = ''
-                for word in words:
-                    if pdf.get_string_width(current_line + ' ' + word) < 180:
-                        current_line += (' ' + word if current_line else word)
-                    else:
-                        if current_line:
-                            pdf.cell(0, 6, current_line, ln=True)
-                        current_line = word
-                
-                if current_line:
-                    pdf.cell(0, 6, current_line, ln=True)
+        # Ajouter le paragraphe ligne par ligne, en coupant les lignes trop longues
+        for line in paragraphe.split('\n'):
+            for ligne_pdf in couper_lignes(pdf, line):
+                pdf.cell(0, 6, ligne_pdf, ln=True)
         
         pdf.ln(3)  # Espacement entre paragraphes
     
     # Formule de fermeture
     pdf.ln(5)
-    pdf.cell(0, 8, fermeture, ln=True)
+    pdf.cell(0, 8, gabarit['fermeture'], ln=True)
     pdf.ln(15)
     
     # Signature
-    pdf.set_font('Arial', 'B', 12)
-    pdf.cell(0, 8, 'Camille Dupré La Tour', ln=True)
+    if gabarit['nom']:
+        pdf.set_font(POLICE, 'B', 12)
+        pdf.cell(0, 8, gabarit['nom'], ln=True)
     
     # Générer le PDF et le retourner comme bytes
     return bytes(pdf.output())
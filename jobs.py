@@ -0,0 +1,314 @@
+"""
+Génération de lettres en tâche de fond (jobs).
+
+POST /jobs enregistre la demande dans une file SQLite persistante et répond tout de
+suite ; un pool de workers la traite ensuite. Les jobs survivent à un redémarrage
+(un job "running" dont le bail a expiré est repris, au plus JOB_MAX_ATTEMPTS fois en
+tout) et sont supprimés après JOB_TTL. Le bail est renouvelé tant que le worker traite
+le job, même s'il attend une place du LLM ; un job en échec est relancé après un délai
+croissant (JOB_RETRY_DELAY, doublé à chaque tentative).
+
+Les workers tournent dans le processus de l'API (JOB_WORKERS) ou à part :
+    python jobs.py --workers 4
+"""
+import argparse
+import contextlib
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from cv_cache import get_cv_content
+from cv_profile import get_cv_profile
+from cv_db import Transaction, open_connection
+from language_id import language_of
+from letter_cache import LetterCache, generate_cached_letter
+
+JOBS_DIR = Path(os.environ.get("JOBS_DIR", "jobs"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_TTL = int(os.environ.get("JOB_TTL", str(24 * 3600)))
+JOB_LEASE = int(os.environ.get("JOB_LEASE", "600"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", "10"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    progress TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    lease_until REAL,
+    not_before REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cv_id TEXT,
+    cv_path TEXT NOT NULL,
+    cv_sha256 TEXT,
+    offre TEXT NOT NULL,
+    langue TEXT,
+    force_regenerate INTEGER NOT NULL DEFAULT 0,
+    result_path TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created);
+CREATE INDEX IF NOT EXISTS idx_jobs_expires_at ON jobs(expires_at);
+"""
+
+PUBLIC_FIELDS = ("id", "status", "progress", "created", "updated", "expires_at", "attempts", "cv_id", "langue", "error")
+
+
+class JobQueue:
+    """File de jobs persistante (SQLite, partagée entre processus)"""
+
+    def __init__(self, directory=JOBS_DIR, ttl=JOB_TTL, lease=JOB_LEASE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.directory / "jobs.db"
+        self.ttl = ttl
+        self.lease = lease
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        # Base créée avant le délai entre deux tentatives
+        if "not_before" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+            conn.execute("ALTER TABLE jobs ADD COLUMN not_before REAL")
+        # Permet de réveiller les workers du même processus dès qu'un job arrive
+        self.new_job = threading.Event()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = open_connection(self.db_path)
+        return conn
+
+    def _transaction(self, write=False):
+        return Transaction(self._connection(), immediate=write)
+
+    def submit(self, cv_path, offre, langue, cv_id=None, cv_sha256=None, force_regenerate=False):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._transaction(write=True) as conn:
+            conn.execute(
+                """INSERT INTO jobs(id, status, progress, created, updated, expires_at, cv_id, cv_path,
+                                    cv_sha256, offre, langue, force_regenerate)
+                VALUES (?, 'queued', 'queued', ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (job_id, now, now, now + self.ttl, cv_id, cv_path, cv_sha256, offre, langue, int(force_regenerate))
+            )
+        self.new_job.set()
+        return job_id
+
+    def get(self, job_id):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ? AND expires_at > ?", (job_id, time.time())).fetchone()
+        return dict(row) if row else None
+
+    def public(self, job):
+        return {field: job[field] for field in PUBLIC_FIELDS}
+
+    def claim(self):
+        """Prend le plus ancien job en attente et dont le délai est écoulé (ou dont le worker a disparu)"""
+        now = time.time()
+        with self._transaction(write=True) as conn:
+            # Un worker qui disparaît à chaque tentative (crash pendant la génération) ne doit
+            # pas faire reprendre le job indéfiniment
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', progress = 'failed', error = ?, lease_until = NULL, "
+                "updated = ? WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (f"Abandonné après {JOB_MAX_ATTEMPTS} tentatives interrompues", now, now, JOB_MAX_ATTEMPTS)
+            )
+            row = conn.execute(
+                """SELECT * FROM jobs
+                WHERE ((status = 'queued' AND (not_before IS NULL OR not_before <= ?))
+                       OR (status = 'running' AND lease_until < ?)) AND expires_at > ?
+                ORDER BY created LIMIT 1""",
+                (now, now, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', progress = 'started', attempts = attempts + 1, "
+                "lease_until = ?, updated = ? WHERE id = ?",
+                (now + self.lease, now, row["id"])
+            )
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+
+    def renew(self, job_id):
+        """Prolonge le bail du worker sans changer l'étape"""
+        now = time.time()
+        with self._transaction(write=True) as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'", (now + self.lease, job_id)
+            )
+
+    def progress(self, job_id, progress):
+        """Met à jour l'étape en cours et prolonge le bail du worker"""
+        now = time.time()
+        with self._transaction(write=True) as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, lease_until = ?, updated = ? WHERE id = ? AND status = 'running'",
+                (progress, now + self.lease, now, job_id)
+            )
+
+    def complete(self, job_id, pdf_content, langue):
+        result_path = self.directory / f"{job_id}.pdf"
+        tmp_path = result_path.with_suffix(".pdf.part")
+        tmp_path.write_bytes(pdf_content)
+        os.replace(tmp_path, result_path)
+        with self._transaction(write=True) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', progress = 'done', result_path = ?, langue = ?, "
+                "lease_until = NULL, updated = ? WHERE id = ?",
+                (str(result_path), langue, time.time(), job_id)
+            )
+
+    def fail(self, job_id, error, retry=False, delay=0):
+        """Marque le job en échec, ou le remet en file pour dans `delay` secondes (retry)"""
+        status = 'queued' if retry else 'failed'
+        now = time.time()
+        with self._transaction(write=True) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, progress = ?, error = ?, lease_until = NULL, not_before = ?, "
+                "updated = ? WHERE id = ?",
+                (status, status, error, now + delay if retry else None, now, job_id)
+            )
+
+    def purge_expired(self):
+        """Supprime les jobs expirés et leurs PDF"""
+        now = time.time()
+        with self._transaction(write=True) as conn:
+            rows = conn.execute("SELECT id, result_path FROM jobs WHERE expires_at <= ?", (now,)).fetchall()
+            conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,))
+        for row in rows:
+            if row["result_path"]:
+                try:
+                    os.unlink(row["result_path"])
+                except FileNotFoundError:
+                    pass
+        return len(rows)
+
+    def counts(self):
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+def process_job(job, letter_cache, progress):
+    """
+    Génère la lettre d'un job ; retourne (pdf, langue).
+    L'appel au modèle passe par llm_limiter (generer_texte_lettre_flux) : les workers de
+    jobs partagent les LLM_MAX_CONCURRENT places avec l'API et les lots.
+    """
+    progress("parsing_cv")
+    cv = get_cv_content(job["cv_path"], job["cv_sha256"])
+    cv = {**cv, "profile": get_cv_profile(job["cv_path"], cv["sha256"], cv["text"])}
+
+    langue = job["langue"]
+    if not langue or langue == "auto":
+        progress("detecting_language")
+        langue = language_of(job["offre"])
+
+    entry = generate_cached_letter(letter_cache, cv, job["offre"], langue, job["force_regenerate"], progress)
+    return entry["pdf"], langue
+
+
+class JobWorkerPool:
+    """Threads qui vident la file de jobs"""
+
+    def __init__(self, queue, workers=JOB_WORKERS, letter_cache=None, poll_interval=JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.workers = workers
+        self.letter_cache = letter_cache or LetterCache()
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+        self.busy = 0
+        self._busy_lock = threading.Lock()
+
+    def start(self):
+        self._stop.clear()
+        self.queue.purge_expired()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self.queue.new_job.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        last_purge = time.time()
+        while not self._stop.is_set():
+            if time.time() - last_purge > 60:
+                self.queue.purge_expired()
+                last_purge = time.time()
+
+            job = self.queue.claim()
+            if job is None:
+                self.queue.new_job.wait(self.poll_interval)
+                self.queue.new_job.clear()
+                continue
+
+            with self._busy_lock:
+                self.busy += 1
+            try:
+                with self._lease_kept(job["id"]):
+                    pdf_content, langue = process_job(
+                        job, self.letter_cache, lambda step: self.queue.progress(job["id"], step)
+                    )
+                self.queue.complete(job["id"], pdf_content, langue)
+            except Exception as e:
+                retry = job["attempts"] < JOB_MAX_ATTEMPTS
+                # LLM indisponible : inutile de brûler toutes les tentatives d'un coup
+                delay = JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+                print(f"   ❌ Job {job['id']} échoué (tentative {job['attempts']}): {e}")
+                self.queue.fail(job["id"], str(e), retry=retry, delay=delay)
+            finally:
+                with self._busy_lock:
+                    self.busy -= 1
+
+    @contextlib.contextmanager
+    def _lease_kept(self, job_id):
+        """
+        Renouvelle le bail pendant le traitement : un job qui attend une place du LLM
+        (lots, autres requêtes) ne doit pas être repris par un autre worker
+        """
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.queue.lease / 3):
+                self.queue.renew(job_id)
+
+        thread = threading.Thread(target=renew, name=f"job-lease-{job_id[:8]}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def stats(self):
+        return {"workers": self.workers, "busy": self.busy, "jobs": self.queue.counts()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Workers de génération de lettres (file de jobs)")
+    parser.add_argument("--workers", type=int, default=max(JOB_WORKERS, 1))
+    args = parser.parse_args()
+
+    pool = JobWorkerPool(JobQueue(), workers=args.workers)
+    pool.start()
+    print(f"👷 {args.workers} worker(s) à l'écoute de {pool.queue.db_path}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
@@ -0,0 +1,131 @@
+"""
+Détection de la langue des offres, déterministe et mise en cache.
+
+langdetect.detect tire ses n-grammes au hasard (deux appels peuvent donner deux
+langues différentes sur un texte court), charge ses profils au premier appel et
+analyse tout le texte. Ce module :
+- charge les profils une fois (preload() au démarrage de l'API),
+- fixe la graine du tirage : même texte, même langue,
+- classe un échantillon borné du texte (LANG_SAMPLE_CHARS),
+- retourne la langue avec sa probabilité,
+- mémorise le résultat par empreinte de l'échantillon (LRU).
+
+La langue détectée par /detect-language est ainsi resservie sans calcul quand
+/generate-letter redétecte la même offre avec langue=auto.
+
+Configuration :
+- LANG_SAMPLE_CHARS : taille de l'échantillon analysé (caractères), défaut 2000
+- LANG_CACHE_SIZE : nombre de résultats gardés en mémoire, défaut 2048
+- LANG_SEED : graine du tirage de langdetect, défaut 0
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from langdetect import DetectorFactory, PROFILES_DIRECTORY
+from langdetect.lang_detect_exception import LangDetectException
+
+from metrics import timed
+
+LANG_SAMPLE_CHARS = int(os.environ.get("LANG_SAMPLE_CHARS", "2000"))
+LANG_CACHE_SIZE = int(os.environ.get("LANG_CACHE_SIZE", "2048"))
+LANG_SEED = int(os.environ.get("LANG_SEED", "0"))
+
+# Langue retournée quand le texte ne permet pas de conclure (vide, chiffres...)
+DEFAULT_LANGUAGE = "en"
+
+_factory = None
+_factory_lock = threading.Lock()
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_totals = {"requests": 0, "hits": 0, "misses": 0, "undetected": 0, "detect_seconds": 0.0}
+
+
+def preload():
+    """Charge les profils de langue (≈ 0,5 s) ; appelé au démarrage pour ne pas le payer à la première offre"""
+    global _factory
+    with _factory_lock:
+        if _factory is None:
+            started = time.perf_counter()
+            factory = DetectorFactory()
+            factory.load_profile(PROFILES_DIRECTORY)
+            factory.set_seed(LANG_SEED)
+            _factory = factory
+            print(f"🌐 Profils de langue chargés en {time.perf_counter() - started:.2f} s "
+                  f"({len(factory.get_lang_list())} langues)")
+        return _factory
+
+
+def text_sample(text, max_chars=LANG_SAMPLE_CHARS):
+    """Début du texte coupé à un espace : le titre et la description suffisent à la langue"""
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars]
+
+
+def _classify(sample):
+    detector = _factory.create()
+    detector.set_max_text_length(len(sample))
+    detector.append(sample)
+    try:
+        candidates = detector.get_probabilities()
+    except LangDetectException:
+        return None
+    return [{"langue": c.lang, "confidence": round(c.prob, 4)} for c in candidates]
+
+
+@timed("language_detect")
+def identify_language(text, default=DEFAULT_LANGUAGE):
+    """
+    Retourne {"langue", "confidence", "candidates", "cached"} ; la langue par défaut
+    (confiance 0) si le texte ne contient rien d'exploitable
+    """
+    sample = text_sample(text or "")
+    key = hashlib.sha1(sample.encode("utf-8")).hexdigest()
+    with _lock:
+        _totals["requests"] += 1
+        candidates = _cache.get(key)
+        if candidates is not None:
+            _cache.move_to_end(key)
+            _totals["hits"] += 1
+    cached = candidates is not None
+
+    if not cached:
+        preload()
+        started = time.perf_counter()
+        candidates = _classify(sample) if sample else None
+        candidates = candidates or []
+        with _lock:
+            _totals["misses"] += 1
+            _totals["detect_seconds"] += time.perf_counter() - started
+            if not candidates:
+                _totals["undetected"] += 1
+            _cache[key] = candidates
+            while len(_cache) > LANG_CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    if not candidates:
+        return {"langue": default, "confidence": 0.0, "candidates": [], "cached": cached}
+    return {**candidates[0], "candidates": candidates, "cached": cached}
+
+
+def language_of(text, default=DEFAULT_LANGUAGE):
+    """Code de la langue du texte (remplace langdetect.detect, sans exception)"""
+    return identify_language(text, default)["langue"]
+
+
+def stats():
+    """Totaux depuis le démarrage du processus"""
+    with _lock:
+        totals = dict(_totals)
+        totals["entries"] = len(_cache)
+    totals["detect_seconds"] = round(totals["detect_seconds"], 3)
+    totals["profiles_loaded"] = _factory is not None
+    if totals["requests"]:
+        totals["hit_rate"] = round(totals["hits"] / totals["requests"], 3)
+    return totals
@@ -0,0 +1,268 @@
+"""
+Cache des lettres générées (texte brut et PDF rendu).
+
+La clé combine l'empreinte du CV, l'offre normalisée (espaces), la langue, le modèle
+et la version du prompt : régénérer la même lettre (double clic, rechargement de la
+page...) ne coûte plus un appel au LLM. Deux niveaux :
+- un LRU en mémoire (LETTER_CACHE_MEMORY entrées)
+- un répertoire sur disque borné en taille (LETTER_CACHE_MAX_MB) avec expiration (LETTER_CACHE_TTL)
+
+Une offre republiée avec un texte légèrement différent n'a pas la même clé : l'index des
+quasi-doublons (near_duplicates.py) retrouve alors la lettre de l'offre d'origine.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+
+from cv_profile import cv_for_prompt
+from generateur_lettre_pdf import PROMPT_VERSION, generer_pdf_lettre, generer_texte_lettre
+from llm_backend import get_backend
+from near_duplicates import NEAR_DUP_REUSE, get_offer_index
+from worker_pool import call_cpu
+
+LETTER_CACHE_DIR = Path(os.environ.get("LETTER_CACHE_DIR", "letter_cache"))
+LETTER_CACHE_MEMORY = int(os.environ.get("LETTER_CACHE_MEMORY", "64"))
+LETTER_CACHE_MAX_MB = float(os.environ.get("LETTER_CACHE_MAX_MB", "200"))
+LETTER_CACHE_TTL = int(os.environ.get("LETTER_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def normalize_offer(offre):
+    """Normalise les espaces pour que deux extractions de la même page donnent la même clé"""
+    return ' '.join(offre.split())
+
+
+def make_key(cv_sha256, offre, langue, model, prompt_version):
+    offer_hash = hashlib.sha256(normalize_offer(offre).encode("utf-8")).hexdigest()
+    raw = "|".join([cv_sha256, offer_hash, langue, model, str(prompt_version)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def letter_key(cv_sha256, offre, langue):
+    """Clé d'une lettre pour le modèle configuré et la version actuelle du prompt"""
+    return make_key(cv_sha256, offre, langue, get_backend().model, PROMPT_VERSION)
+
+
+def similarity_scope(cv_sha256, langue):
+    """Portée de la recherche de quasi-doublons : même CV, même langue, même modèle et prompt"""
+    return "|".join([cv_sha256, langue, get_backend().model, str(PROMPT_VERSION)])
+
+
+def find_similar_letter(letter_cache, cv_sha256, offre, langue, render_pdf, threshold=None):
+    """
+    Lettre déjà générée pour une offre quasi identique, ou None. L'entrée porte en plus
+    "similarity" (Jaccard estimé) et "similar_url" (URL de l'offre d'origine).
+    Une offre dont la lettre a quitté le cache est retirée de l'index.
+    """
+    index = get_offer_index()
+    for match in index.find(similarity_scope(cv_sha256, langue), offre, threshold):
+        entry = letter_cache.get_current(match["letter_key"], render_pdf)
+        if entry is not None:
+            return {**entry, "similarity": match["similarity"], "similar_url": match["url"]}
+        index.remove(match["letter_key"])
+    return None
+
+
+def find_similar_letters(letter_cache, cv_sha256, offre, langue, threshold=None, limit=3):
+    """
+    Textes des lettres générées pour des offres quasi identiques, les plus proches d'abord :
+    [{"similarity", "url", "created", "text"}] (point de départ d'une nouvelle lettre)
+    """
+    index = get_offer_index()
+    letters = []
+    for match in index.find(similarity_scope(cv_sha256, langue), offre, threshold, limit):
+        entry = letter_cache.get(match["letter_key"])
+        if entry is None:
+            index.remove(match["letter_key"])
+            continue
+        letters.append({"similarity": match["similarity"], "url": match["url"],
+                        "created": match["created"], "text": entry["text"]})
+    return letters
+
+
+def remember_offer(cv_sha256, offre, langue, cache_key, url=None):
+    """Indexe l'offre d'une lettre qui vient d'être générée"""
+    get_offer_index().add(similarity_scope(cv_sha256, langue), offre, cache_key, url)
+
+
+def generate_cached_letter(letter_cache, cv, offre, langue, force_regenerate=False, progress=None, url=None):
+    """
+    Retourne l'entrée du cache pour cette lettre, en la générant si besoin
+    (cv est une extraction de cv_cache : "text", "sha256" et éventuellement "profile").
+    La clé "cached" indique si la lettre vient du cache, "similarity" si elle a été
+    générée pour une offre quasi identique (NEAR_DUP_REUSE).
+    """
+    progress = progress or (lambda step: None)
+    profile = cv.get("profile")
+    render_pdf = lambda text, lang: call_cpu(generer_pdf_lettre, text, lang, profile)
+    cache_key = letter_key(cv["sha256"], offre, langue)
+    if not force_regenerate:
+        cached = letter_cache.get_current(cache_key, render_pdf)
+        if cached is not None:
+            return {**cached, "cached": True}
+        if NEAR_DUP_REUSE:
+            similar = find_similar_letter(letter_cache, cv["sha256"], offre, langue, render_pdf)
+            if similar is not None:
+                return {**similar, "cached": True}
+
+    progress("generating")
+    lettre_content = generer_texte_lettre(cv_for_prompt(cv), offre, langue)
+    progress("rendering")
+    pdf_content = call_cpu(generer_pdf_lettre, lettre_content, langue, profile)
+    entry = letter_cache.put(cache_key, lettre_content, langue, pdf_content)
+    remember_offer(cv["sha256"], offre, langue, cache_key, url)
+    return {**entry, "cached": False}
+
+
+class LetterCache:
+    """
+    Cache à deux niveaux. Une entrée est un dict :
+    {"text", "langue", "pdf" (bytes), "rendered_on" (date ISO du PDF)}
+    """
+
+    def __init__(self, directory=LETTER_CACHE_DIR, memory_size=LETTER_CACHE_MEMORY,
+                 max_bytes=int(LETTER_CACHE_MAX_MB * 1024 * 1024), ttl=LETTER_CACHE_TTL):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.memory_size = memory_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _paths(self, key):
+        return self.directory / f"{key}.json", self.directory / f"{key}.pdf"
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Retourne l'entrée en cache ou None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry["created"] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry
+            self._memory.pop(key, None)
+
+        meta_path, pdf_path = self._paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if now - entry["created"] > self.ttl:
+                self._delete(key)
+                raise FileNotFoundError(meta_path)
+            entry["pdf"] = pdf_path.read_bytes()
+            # La date d'accès sert à l'éviction LRU sur disque
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+
+        self._remember(key, entry)
+        with self._lock:
+            self.counters["disk_hits"] += 1
+        return entry
+
+    def get_current(self, key, render_pdf):
+        """
+        Comme get(), mais le PDF est rendu à nouveau avec render_pdf(texte, langue)
+        s'il date d'un autre jour (la date figure dans la lettre)
+        """
+        entry = self.get(key)
+        if entry is not None and entry["rendered_on"] != date.today().isoformat():
+            entry = self.put(key, entry["text"], entry["langue"], render_pdf(entry["text"], entry["langue"]))
+        return entry
+
+    def put(self, key, text, langue, pdf):
+        entry = {
+            "text": text,
+            "langue": langue,
+            "rendered_on": date.today().isoformat(),
+            "created": time.time(),
+        }
+        meta_path, pdf_path = self._paths(key)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        pdf_tmp = pdf_path.with_suffix(suffix)
+        pdf_tmp.write_bytes(pdf)
+        os.replace(pdf_tmp, pdf_path)
+        meta_tmp = meta_path.with_suffix(suffix)
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(meta_tmp, meta_path)
+
+        entry = {**entry, "pdf": pdf}
+        self._remember(key, entry)
+        with self._lock:
+            self.counters["stores"] += 1
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(pdf) + meta_path.stat().st_size
+            over_limit = self._disk_bytes is None or self._disk_bytes > self.max_bytes
+        if over_limit:
+            self._evict()
+        return entry
+
+    def _delete(self, key):
+        for path in self._paths(key):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """Supprime les entrées expirées puis les moins récemment utilisées au-delà de la taille max"""
+        now = time.time()
+        entries = []
+        total = 0
+        for meta_path in self.directory.glob("*.json"):
+            key = meta_path.stem
+            try:
+                accessed = meta_path.stat().st_mtime
+                size = meta_path.stat().st_size + self._paths(key)[1].stat().st_size
+            except OSError:
+                continue
+            entries.append((accessed, key, size))
+            total += size
+
+        entries.sort()
+        evicted = 0
+        for accessed, key, size in entries:
+            expired = now - accessed > self.ttl
+            if not expired and total <= self.max_bytes:
+                continue
+            self._delete(key)
+            with self._lock:
+                self._memory.pop(key, None)
+            total -= size
+            evicted += 1
+
+        with self._lock:
+            self._disk_bytes = total
+            self.counters["evictions"] += evicted
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            memory_entries = len(self._memory)
+            disk_bytes = self._disk_bytes
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "memory_entries": memory_entries,
+            "disk_bytes": disk_bytes,
+        }
@@ -0,0 +1,334 @@
+"""
+Backends de génération pour le LLM local (Ollama, llama.cpp).
+
+Le backend HTTP garde une connexion keep-alive vers le serveur du modèle au lieu
+de lancer un processus `ollama run` à chaque lettre. Le backend subprocess est
+conservé comme solution de repli quand aucun serveur HTTP n'est joignable.
+
+Configuration par variables d'environnement :
+- LLM_BACKEND : "http" (défaut) ou "subprocess"
+- LLM_URL : adresse du serveur (défaut http://localhost:11434)
+- LLM_API : "ollama" (défaut) ou "llamacpp"
+- LLM_MODEL : nom du modèle (défaut mistral)
+- LLM_CONNECT_TIMEOUT / LLM_READ_TIMEOUT : timeouts en secondes
+- LLM_OPTIONS : options de génération au format JSON (ex: {"temperature": 0.7})
+- LLM_KEEP_ALIVE : durée de maintien du modèle en mémoire côté Ollama
+- LLM_POOL_SIZE : nombre de connexions gardées ouvertes
+- LLM_FALLBACK_SUBPROCESS : "1" pour basculer sur `ollama run` si le serveur est injoignable
+- LLM_URLS : plusieurs serveurs entre lesquels répartir les générations (voir llm_router.py),
+  à la place de LLM_URL
+
+`prefix` (début stable du prompt : instructions + CV) permet au serveur de réutiliser
+le contexte déjà calculé pour ce préfixe (voir prefix_cache.py). L'option "max_tokens"
+borne la génération (num_predict pour Ollama, n_predict pour llama.cpp).
+"""
+import codecs
+import json
+import os
+import subprocess
+import threading
+from contextlib import nullcontext
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from prefix_cache import prefix_cache as default_prefix_cache
+from prompt_builder import estimate_tokens
+
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "http")
+LLM_URL = os.environ.get("LLM_URL", "http://localhost:11434")
+LLM_API = os.environ.get("LLM_API", "ollama")
+LLM_MODEL = os.environ.get("LLM_MODEL", "mistral")
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "3"))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "300"))
+LLM_OPTIONS = json.loads(os.environ.get("LLM_OPTIONS", "{}"))
+LLM_KEEP_ALIVE = os.environ.get("LLM_KEEP_ALIVE", "30m")
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "8"))
+LLM_FALLBACK_SUBPROCESS = os.environ.get("LLM_FALLBACK_SUBPROCESS", "1") == "1"
+
+
+class LLMError(Exception):
+    """Erreur levée quand le modèle ne peut pas produire de réponse"""
+
+
+class SubprocessBackend:
+    """Appelle `ollama run <modèle>` dans un nouveau processus (comportement historique)"""
+
+    # Un nouveau processus à chaque lettre : aucun contexte repris d'un appel à l'autre
+    reuses_prefix = False
+
+    def __init__(self, model=LLM_MODEL, timeout=LLM_READ_TIMEOUT):
+        self.model = model
+        self.timeout = timeout
+
+    def generate(self, prompt, options=None, prefix=None):
+        try:
+            result = subprocess.run(
+                ["ollama", "run", self.model],
+                input=prompt.encode("utf-8"),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=self.timeout
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise LLMError(f"Échec de `ollama run {self.model}`: {e}") from e
+
+        if result.returncode != 0:
+            raise LLMError(result.stderr.decode("utf-8", errors="replace").strip())
+        return result.stdout.decode("utf-8")
+
+    def preload(self):
+        """Rien à préparer : chaque génération lance son propre processus"""
+
+    def stream(self, prompt, options=None, prefix=None):
+        """Produit la sortie de `ollama run` au fil de l'eau"""
+        try:
+            process = subprocess.Popen(
+                ["ollama", "run", self.model],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+        except OSError as e:
+            raise LLMError(f"Échec de `ollama run {self.model}`: {e}") from e
+
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            process.stdin.write(prompt.encode("utf-8"))
+            process.stdin.close()
+            while True:
+                chunk = process.stdout.read1(1024)
+                if not chunk:
+                    break
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            if process.wait(timeout=self.timeout) != 0:
+                raise LLMError(f"`ollama run {self.model}` a échoué (code {process.returncode})")
+        finally:
+            if process.poll() is None:
+                process.kill()
+
+
+class HTTPBackend:
+    """Client HTTP vers un serveur Ollama ou llama.cpp, avec connexions réutilisées"""
+
+    def __init__(self, url=LLM_URL, api=LLM_API, model=LLM_MODEL, options=None,
+                 connect_timeout=LLM_CONNECT_TIMEOUT, read_timeout=LLM_READ_TIMEOUT,
+                 keep_alive=LLM_KEEP_ALIVE, pool_size=LLM_POOL_SIZE, prefix_cache=None):
+        if api not in ("ollama", "llamacpp"):
+            raise ValueError(f"API LLM inconnue: {api}")
+        self.url = url.rstrip('/')
+        self.api = api
+        self.model = model
+        self.options = dict(LLM_OPTIONS if options is None else options)
+        self.timeout = (connect_timeout, read_timeout)
+        self.keep_alive = keep_alive
+        self.prefix_cache = prefix_cache or default_prefix_cache
+
+        # Une seule session partagée : le pool garde les connexions TCP ouvertes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _payload(self, prompt, options, stream=False, slot=None):
+        opts = {**self.options, **(options or {})}
+        max_tokens = opts.pop("max_tokens", None)
+        if max_tokens:
+            opts.setdefault("num_predict" if self.api == "ollama" else "n_predict", max_tokens)
+        if self.api == "ollama":
+            # Ollama réutilise de lui-même le plus long préfixe commun déjà calculé
+            payload = {"model": self.model, "prompt": prompt, "stream": stream, "options": opts}
+            if self.keep_alive:
+                payload["keep_alive"] = self.keep_alive
+            return "/api/generate", payload
+        # llama.cpp : les options sont à plat dans le corps de la requête
+        payload = {"prompt": prompt, "stream": stream, "cache_prompt": True, **opts}
+        if slot is not None:
+            payload["id_slot"] = slot
+        return "/completion", payload
+
+    @property
+    def reuses_prefix(self):
+        """Le contexte du préfixe est gardé d'un appel à l'autre (llama.cpp avec un slot par CV)"""
+        return self.api == "llamacpp" and bool(self.prefix_cache.slots)
+
+    def _prefix_slot(self, prefix):
+        if prefix is None:
+            return nullcontext((None, False))
+        return self.prefix_cache.use(self.model, prefix)
+
+    def _record_usage(self, prompt, data, hit):
+        """Mesure les tokens de prefill calculés et repris du cache d'après la réponse du serveur"""
+        if self.api == "ollama":
+            prefill = data.get("prompt_eval_count")
+            if prefill is None:
+                return
+            # Ollama ne donne que les tokens calculés : le total est estimé si le préfixe était en cache
+            total = max(prefill, estimate_tokens(prompt)) if hit else prefill
+        else:
+            total = data.get("tokens_evaluated")
+            if total is None:
+                return
+            prefill = (data.get("timings") or {}).get("prompt_n")
+            if prefill is None:
+                prefill = total - (data.get("tokens_cached") or 0)
+        self.prefix_cache.record(total, prefill, max(total - prefill, 0))
+
+    def _post(self, path, payload, **kwargs):
+        try:
+            response = self.session.post(self.url + path, json=payload, timeout=self.timeout, **kwargs)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise LLMError(f"Requête vers {self.url}{path} échouée: {e}") from e
+        return response
+
+    def preload(self):
+        """
+        Charge le modèle sans rien générer : prompt vide pour Ollama (le modèle reste
+        en mémoire LLM_KEEP_ALIVE), vérification de /health pour llama.cpp, qui charge
+        le modèle à son lancement
+        """
+        if self.api == "ollama":
+            payload = {"model": self.model, "prompt": "", "stream": False}
+            if self.keep_alive:
+                payload["keep_alive"] = self.keep_alive
+            self._post("/api/generate", payload)
+            return
+        self.health()
+
+    def health(self):
+        """Vérifie que le serveur répond, sans charger le modèle (/api/tags ou /health)"""
+        path = "/api/tags" if self.api == "ollama" else "/health"
+        connect_timeout = self.timeout[0]
+        try:
+            self.session.get(self.url + path, timeout=(connect_timeout, connect_timeout)).raise_for_status()
+        except requests.RequestException as e:
+            raise LLMError(f"Serveur {self.url} pas prêt: {e}") from e
+
+    def generate(self, prompt, options=None, prefix=None):
+        with self._prefix_slot(prefix) as (slot, hit):
+            path, payload = self._payload(prompt, options, slot=slot)
+            data = self._post(path, payload).json()
+        self._record_usage(prompt, data, hit)
+        return data["response"] if self.api == "ollama" else data["content"]
+
+    def stream(self, prompt, options=None, prefix=None):
+        """
+        Produit les morceaux de texte au fur et à mesure de la génération
+        (NDJSON pour Ollama, Server-Sent Events pour llama.cpp)
+        """
+        with self._prefix_slot(prefix) as (slot, hit):
+            path, payload = self._payload(prompt, options, stream=True, slot=slot)
+            response = self._post(path, payload, stream=True)
+            try:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    if self.api == "llamacpp":
+                        if not line.startswith(b"data:"):
+                            continue
+                        line = line[len(b"data:"):]
+                    data = json.loads(line)
+                    text = data.get("response") if self.api == "ollama" else data.get("content")
+                    if text:
+                        yield text
+                    if data.get("done") or data.get("stop"):
+                        self._record_usage(prompt, data, hit)
+                        break
+            except requests.RequestException as e:
+                raise LLMError(f"Flux interrompu depuis {self.url}{path}: {e}") from e
+            finally:
+                response.close()
+
+
+class FallbackBackend:
+    """Essaie le backend principal et bascule sur le secondaire si le serveur est injoignable"""
+
+    def __init__(self, primary, secondary):
+        self.primary = primary
+        self.secondary = secondary
+
+    @property
+    def model(self):
+        return self.primary.model
+
+    @property
+    def reuses_prefix(self):
+        return self.primary.reuses_prefix
+
+    def preload(self):
+        try:
+            self.primary.preload()
+        except LLMError as e:
+            if not isinstance(e.__cause__, requests.ConnectionError):
+                raise
+            print(f"   ⚠️  Serveur LLM injoignable, repli sur `ollama run`: {e}")
+            self.secondary.preload()
+
+    def generate(self, prompt, options=None, prefix=None):
+        try:
+            return self.primary.generate(prompt, options, prefix)
+        except LLMError as e:
+            if not isinstance(e.__cause__, requests.ConnectionError):
+                raise
+            print(f"   ⚠️  Serveur LLM injoignable, repli sur `ollama run`: {e}")
+            return self.secondary.generate(prompt, options, prefix)
+
+    def stream(self, prompt, options=None, prefix=None):
+        try:
+            # La connexion est établie dès le premier next(), avant tout token
+            chunks = self.primary.stream(prompt, options, prefix)
+            first = next(chunks, None)
+        except LLMError as e:
+            if not isinstance(e.__cause__, requests.ConnectionError):
+                raise
+            print(f"   ⚠️  Serveur LLM injoignable, repli sur `ollama run`: {e}")
+            yield from self.secondary.stream(prompt, options, prefix)
+            return
+        if first is not None:
+            yield first
+            yield from chunks
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(kind=LLM_BACKEND):
+    """Construit le backend décrit par la configuration"""
+    if kind == "subprocess":
+        return SubprocessBackend()
+    if kind == "http":
+        from llm_router import LLM_URLS, create_router
+        backend = create_router() if LLM_URLS else HTTPBackend()
+        if LLM_FALLBACK_SUBPROCESS:
+            return FallbackBackend(backend, SubprocessBackend())
+        return backend
+    raise ValueError(f"Backend LLM inconnu: {kind}")
+
+
+def get_backend():
+    """Retourne le backend partagé par le processus (créé au premier appel)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def preload_model():
+    """Charge le modèle du backend partagé (démarrage de l'API, keep-alive)"""
+    get_backend().preload()
+
+
+def set_backend(backend):
+    """Remplace le backend partagé (tests, benchmarks, serveur factice)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
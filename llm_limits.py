@@ -0,0 +1,22 @@
+"""
+Limite des générations LLM simultanées, partagée par l'API, les workers de jobs et les lots.
+
+Configuration :
+- LLM_MAX_CONCURRENT : nombre de générations LLM simultanées, défaut 2 (avec LLM_URLS :
+  la somme des places des serveurs)
+- LLM_MAX_QUEUE : nombre de générations en attente avant de refuser (503), défaut 8
+"""
+import os
+
+from llm_router import router_capacity
+from metrics import register_gauge
+from worker_pool import ConcurrencyLimiter
+
+# Avec plusieurs serveurs LLM, autant de générations que de places sur l'ensemble des serveurs
+LLM_MAX_CONCURRENT = int(os.environ.get("LLM_MAX_CONCURRENT", str(router_capacity() or 2)))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "8"))
+
+# Limiteur partagé pour les appels au LLM
+llm_limiter = ConcurrencyLimiter(LLM_MAX_CONCURRENT, LLM_MAX_QUEUE)
+register_gauge("llm_in_flight", "Générations LLM en cours", lambda: llm_limiter.in_flight)
+register_gauge("llm_waiting", "Générations LLM en attente d'une place", lambda: llm_limiter.waiting)
@@ -0,0 +1,431 @@
+"""
+Répartition des générations sur plusieurs serveurs LLM (plusieurs processus Ollama ou
+llama.cpp sur la même machine ou sur plusieurs).
+
+Un seul serveur plafonne le débit quel que soit le nombre de workers de l'API. Avec
+LLM_URLS, chaque génération est envoyée au serveur qui a le moins de requêtes en cours
+(à égalité, le dernier à avoir traité le même préfixe, pour réutiliser son contexte) :
+- chaque serveur a un nombre maximal de générations simultanées ; quand tous sont
+  pleins, la génération attend qu'une place se libère,
+- un serveur qui échoue (connexion refusée, timeout, erreur 5xx) est écarté après
+  LLM_ROUTER_MAX_FAILS échecs de suite, pendant LLM_ROUTER_COOLDOWN secondes
+  (vérification passive), et un thread interroge régulièrement chaque serveur
+  (/api/tags pour Ollama, /health pour llama.cpp) pour l'écarter ou le réintégrer
+  (vérification active),
+- une génération en échec est relancée sur un autre serveur (avant le premier token
+  en streaming : un texte déjà envoyé ne peut pas être repris).
+
+Configuration :
+- LLM_URLS : adresses des serveurs séparées par des virgules, avec éventuellement le
+  nombre maximal de générations simultanées après un # (ex: http://a:11434#4,http://b:11434)
+- LLM_BACKEND_MAX_CONCURRENT : générations simultanées par serveur, défaut 2
+- LLM_ROUTER_RETRIES : nombre de serveurs essayés en plus du premier, défaut 2
+- LLM_ROUTER_MAX_FAILS : échecs de suite avant d'écarter un serveur, défaut 2
+- LLM_ROUTER_COOLDOWN : durée (s) pendant laquelle un serveur en échec est écarté, défaut 30
+- LLM_ROUTER_HEALTH_INTERVAL : intervalle (s) des vérifications actives, 0 = désactivées, défaut 10
+- LLM_ROUTER_QUEUE_TIMEOUT : attente maximale (s) d'une place libre, défaut 300
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from llm_backend import LLM_API, LLM_MODEL, HTTPBackend, LLMError, get_backend
+from metrics import Counter, Histogram, register_gauge
+from prefix_cache import LLM_SLOTS, PrefixCache, prefix_key
+
+LLM_BACKEND_MAX_CONCURRENT = int(os.environ.get("LLM_BACKEND_MAX_CONCURRENT", "2"))
+LLM_ROUTER_RETRIES = int(os.environ.get("LLM_ROUTER_RETRIES", "2"))
+LLM_ROUTER_MAX_FAILS = int(os.environ.get("LLM_ROUTER_MAX_FAILS", "2"))
+LLM_ROUTER_COOLDOWN = float(os.environ.get("LLM_ROUTER_COOLDOWN", "30"))
+LLM_ROUTER_HEALTH_INTERVAL = float(os.environ.get("LLM_ROUTER_HEALTH_INTERVAL", "10"))
+LLM_ROUTER_QUEUE_TIMEOUT = float(os.environ.get("LLM_ROUTER_QUEUE_TIMEOUT", "300"))
+
+# Préfixes dont on retient le dernier serveur (au-delà, les plus anciens sont oubliés)
+AFFINITY_MAX_ENTRIES = 1024
+
+
+def parse_urls(value, default_max_concurrent=LLM_BACKEND_MAX_CONCURRENT):
+    """"http://a:11434#4, http://b:11434" -> [("http://a:11434", 4), ("http://b:11434", défaut)]"""
+    endpoints = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, _, cap = item.partition("#")
+        endpoints.append((url.rstrip("/"), int(cap) if cap else default_max_concurrent))
+    return endpoints
+
+
+LLM_URLS = parse_urls(os.environ.get("LLM_URLS", ""))
+
+
+def router_capacity():
+    """Générations simultanées possibles sur l'ensemble des serveurs (0 sans LLM_URLS)"""
+    return sum(cap for _, cap in LLM_URLS)
+
+
+def is_retryable(error):
+    """Échec propre au serveur (injoignable, trop lent, erreur 5xx) : un autre peut réussir"""
+    cause = error.__cause__
+    if isinstance(cause, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(cause, requests.HTTPError) and cause.response is not None:
+        return cause.response.status_code >= 500
+    return isinstance(cause, requests.RequestException)
+
+
+backend_requests = Counter("llm_backend_requests_total", "Générations par serveur LLM et résultat",
+                           labels=("backend", "outcome"))
+backend_seconds = Histogram("llm_backend_seconds", "Durée des générations par serveur LLM (s)",
+                            labels=("backend",))
+
+
+class Upstream:
+    """Un serveur LLM et son état : générations en cours, échecs, écartement"""
+
+    def __init__(self, backend, max_concurrent):
+        self.backend = backend
+        self.url = backend.url
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        # Écarté par une vérification active (et non après des générations en échec)
+        self.check_failed = False
+        self.last_error = None
+        self.last_check = None
+        self.avg_duration = None
+        self.counters = {"requests": 0, "succeeded": 0, "failed": 0, "retried": 0, "checks_failed": 0}
+
+    def available(self, now):
+        return now >= self.down_until
+
+    def stats(self, now):
+        return {
+            "url": self.url,
+            "healthy": self.available(now),
+            "down_for": round(self.down_until - now, 1) if not self.available(now) else 0,
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            **self.counters,
+            "consecutive_failures": self.consecutive_failures,
+            "avg_seconds": round(self.avg_duration, 3) if self.avg_duration is not None else None,
+            "last_error": self.last_error,
+            "last_check": self.last_check,
+        }
+
+
+class LLMRouter:
+    """
+    Backend qui répartit les générations sur plusieurs HTTPBackend (même interface :
+    generate, stream, preload, model)
+    """
+
+    def __init__(self, backends, max_concurrent=LLM_BACKEND_MAX_CONCURRENT, retries=LLM_ROUTER_RETRIES,
+                 max_fails=LLM_ROUTER_MAX_FAILS, cooldown=LLM_ROUTER_COOLDOWN,
+                 health_interval=LLM_ROUTER_HEALTH_INTERVAL, queue_timeout=LLM_ROUTER_QUEUE_TIMEOUT):
+        """backends : liste de HTTPBackend ou de couples (HTTPBackend, générations simultanées max)"""
+        if not backends:
+            raise ValueError("Aucun serveur LLM à répartir")
+        self.upstreams = [Upstream(*item) if isinstance(item, tuple) else Upstream(item, max_concurrent)
+                          for item in backends]
+        self.retries = min(retries, len(self.upstreams) - 1)
+        self.max_fails = max_fails
+        self.cooldown = cooldown
+        self.health_interval = health_interval
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._turn = 0
+        self.counters = {"requests": 0, "retries": 0, "exhausted": 0, "waits": 0, "wait_seconds": 0.0,
+                         "affinity_hits": 0}
+        # Préfixe -> index du dernier serveur qui l'a traité avec succès (LRU)
+        self._last_served = OrderedDict()
+        self._stop = threading.Event()
+        self._checker = None
+        if health_interval > 0:
+            self._checker = threading.Thread(target=self._check_loop, name="llm-health", daemon=True)
+            self._checker.start()
+
+    @property
+    def model(self):
+        return self.upstreams[0].backend.model
+
+    @property
+    def reuses_prefix(self):
+        return all(upstream.backend.reuses_prefix for upstream in self.upstreams)
+
+    # --- Choix du serveur ---
+
+    def _pick(self, tried, affinity):
+        """
+        Serveur disponible avec le moins de générations en cours et une place libre ;
+        à égalité, le dernier à avoir traité le préfixe, puis chacun son tour. Si tous
+        sont écartés, le premier à revenir est essayé quand même. None si tous sont pleins.
+        """
+        now = time.monotonic()
+        candidates = [u for u in self.upstreams if u not in tried]
+        healthy = [u for u in candidates if u.available(now)]
+        if not healthy:
+            healthy = sorted(candidates, key=lambda u: u.down_until)[:1]
+        free = [u for u in healthy if u.in_flight < u.max_concurrent]
+        if not free:
+            return None
+
+        def rank(upstream):
+            return upstream.in_flight, self.upstreams.index(upstream) != affinity
+        best = min(rank(upstream) for upstream in free)
+        tied = [upstream for upstream in free if rank(upstream) == best]
+        self._turn += 1
+        return tied[self._turn % len(tied)]
+
+    def _acquire(self, tried, affinity):
+        """Réserve une place sur un serveur, en attendant si tous sont pleins"""
+        deadline = None
+        with self._condition:
+            while True:
+                upstream = self._pick(tried, affinity)
+                if upstream is not None:
+                    upstream.in_flight += 1
+                    upstream.counters["requests"] += 1
+                    if affinity is not None and self.upstreams[affinity] is upstream:
+                        self.counters["affinity_hits"] += 1
+                    break
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + self.queue_timeout
+                    waited = now
+                    self.counters["waits"] += 1
+                if now >= deadline or not self._condition.wait(deadline - now):
+                    raise LLMError(f"Aucun serveur LLM libre après {self.queue_timeout:g} s d'attente")
+            if deadline is not None:
+                self.counters["wait_seconds"] += time.monotonic() - waited
+        return upstream
+
+    def _release(self, upstream, started, error=None, key=None):
+        """Libère la place et met à jour l'état du serveur d'après le résultat"""
+        duration = time.monotonic() - started
+        with self._condition:
+            upstream.in_flight -= 1
+            if error is None:
+                if key is not None:
+                    self._remember(key, upstream)
+                upstream.counters["succeeded"] += 1
+                upstream.consecutive_failures = 0
+                upstream.avg_duration = duration if upstream.avg_duration is None \
+                    else 0.8 * upstream.avg_duration + 0.2 * duration
+            else:
+                upstream.counters["failed"] += 1
+                upstream.last_error = str(error)
+                if is_retryable(error):
+                    upstream.consecutive_failures += 1
+                    if upstream.consecutive_failures >= self.max_fails:
+                        upstream.down_until = time.monotonic() + self.cooldown
+            self._condition.notify_all()
+        backend_requests.inc(backend=upstream.url, outcome="error" if error else "ok")
+        if error is None:
+            backend_seconds.observe(duration, backend=upstream.url)
+
+    def _prefix_key(self, prefix):
+        return None if prefix is None else prefix_key(self.model, prefix)
+
+    def _remember(self, key, upstream):
+        """Note le serveur qui vient de traiter ce préfixe (appelé avec le verrou)"""
+        self._last_served[key] = self.upstreams.index(upstream)
+        self._last_served.move_to_end(key)
+        if len(self._last_served) > AFFINITY_MAX_ENTRIES:
+            self._last_served.popitem(last=False)
+
+    def _attempts(self, key):
+        """Produit les serveurs à essayer l'un après l'autre, place réservée"""
+        tried = []
+        with self._condition:
+            self.counters["requests"] += 1
+            # Serveur préféré : le dernier à avoir traité ce préfixe (même CV), dont le
+            # contexte est peut-être encore chargé
+            affinity = self._last_served.get(key) if key is not None else None
+        for attempt in range(self.retries + 1):
+            upstream = self._acquire(tried, affinity)
+            tried.append(upstream)
+            if attempt:
+                with self._condition:
+                    self.counters["retries"] += 1
+            yield upstream
+
+    def _give_up(self, upstream, error, attempt):
+        """True si l'erreur doit remonter (non due au serveur, ou plus d'essai possible)"""
+        if not is_retryable(error):
+            return True
+        if attempt >= self.retries:
+            with self._condition:
+                self.counters["exhausted"] += 1
+            return True
+        with self._condition:
+            upstream.counters["retried"] += 1
+        print(f"   ⚠️  Serveur LLM {upstream.url} en échec, nouvel essai sur un autre: {error}")
+        return False
+
+    # --- Interface des backends ---
+
+    def generate(self, prompt, options=None, prefix=None):
+        key = self._prefix_key(prefix)
+        for attempt, upstream in enumerate(self._attempts(key)):
+            started = time.monotonic()
+            try:
+                text = upstream.backend.generate(prompt, options, prefix)
+            except LLMError as e:
+                self._release(upstream, started, e)
+                if self._give_up(upstream, e, attempt):
+                    raise
+                continue
+            except Exception as e:
+                self._release(upstream, started, e)
+                raise
+            self._release(upstream, started, key=key)
+            return text
+
+    def stream(self, prompt, options=None, prefix=None):
+        key = self._prefix_key(prefix)
+        for attempt, upstream in enumerate(self._attempts(key)):
+            started = time.monotonic()
+            chunks = upstream.backend.stream(prompt, options, prefix)
+            try:
+                # La connexion est établie dès le premier next(), avant tout token
+                first = next(chunks, None)
+            except LLMError as e:
+                self._release(upstream, started, e)
+                if self._give_up(upstream, e, attempt):
+                    raise
+                continue
+            except Exception as e:
+                self._release(upstream, started, e)
+                raise
+            error = None
+            try:
+                if first is not None:
+                    yield first
+                    yield from chunks
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                chunks.close()
+                self._release(upstream, started, error, key)
+            return
+
+    def preload(self):
+        """Charge le modèle sur tous les serveurs en parallèle ; erreur si aucun n'a répondu"""
+        def load(upstream):
+            try:
+                upstream.backend.preload()
+            except LLMError as e:
+                self._mark_check(upstream, e)
+                return e
+            self._mark_check(upstream, None)
+            return None
+
+        with ThreadPoolExecutor(max_workers=len(self.upstreams)) as executor:
+            errors = [error for error in executor.map(load, self.upstreams) if error is not None]
+        if len(errors) == len(self.upstreams):
+            raise errors[0]
+        for upstream in self.upstreams:
+            if upstream.last_error and not upstream.available(time.monotonic()):
+                print(f"   ⚠️  Serveur LLM {upstream.url} pas prêt: {upstream.last_error}")
+
+    # --- Vérifications actives ---
+
+    def _mark_check(self, upstream, error):
+        with self._condition:
+            upstream.last_check = time.time()
+            if error is None:
+                # Un serveur qui répond mais dont les générations échouent reste écarté jusqu'à
+                # la fin de son délai : seule une vérification en échec est annulée ici
+                if upstream.check_failed:
+                    upstream.check_failed = False
+                    upstream.down_until = 0.0
+            else:
+                upstream.counters["checks_failed"] += 1
+                upstream.last_error = str(error)
+                upstream.check_failed = True
+                # Écarté au moins jusqu'à la prochaine vérification
+                upstream.down_until = time.monotonic() + max(self.cooldown, self.health_interval)
+            self._condition.notify_all()
+
+    def check_health(self):
+        """Interroge chaque serveur et met à jour son état ; retourne {url: sain}"""
+        health = {}
+        for upstream in self.upstreams:
+            try:
+                upstream.backend.health()
+                error = None
+            except LLMError as e:
+                error = e
+            self._mark_check(upstream, error)
+            health[upstream.url] = error is None
+        return health
+
+    def _check_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def close(self):
+        """Arrête les vérifications actives"""
+        self._stop.set()
+        if self._checker is not None:
+            self._checker.join(timeout=5)
+
+    def in_flight(self):
+        with self._condition:
+            return {upstream.url: upstream.in_flight for upstream in self.upstreams}
+
+    def stats(self):
+        now = time.monotonic()
+        with self._condition:
+            counters = dict(self.counters)
+            backends = [upstream.stats(now) for upstream in self.upstreams]
+        waits = counters["waits"]
+        return {
+            "strategy": "least_outstanding",
+            **{name: value for name, value in counters.items() if name != "wait_seconds"},
+            "avg_wait_seconds": round(counters["wait_seconds"] / waits, 3) if waits else None,
+            "healthy": sum(1 for backend in backends if backend["healthy"]),
+            "capacity": sum(backend["max_concurrent"] for backend in backends),
+            "backends": backends,
+        }
+
+
+def create_router(endpoints=None, api=LLM_API, model=LLM_MODEL):
+    """Routeur sur les serveurs de LLM_URLS"""
+    endpoints = LLM_URLS if endpoints is None else endpoints
+    # Les slots llama.cpp sont propres à chaque serveur : un suivi des préfixes par serveur
+    backends = [(HTTPBackend(url, api=api, model=model, prefix_cache=PrefixCache() if LLM_SLOTS else None), cap)
+                for url, cap in endpoints]
+    return LLMRouter(backends)
+
+
+def current_router():
+    """Routeur du backend partagé, ou None si les générations vont à un seul serveur"""
+    backend = get_backend()
+    backend = getattr(backend, "primary", backend)
+    return backend if isinstance(backend, LLMRouter) else None
+
+
+def stats():
+    """État de chaque serveur LLM (routeur) ou adresse du serveur unique"""
+    router = current_router()
+    if router is None:
+        backend = get_backend()
+        backend = getattr(backend, "primary", backend)
+        return {"strategy": "single", "url": getattr(backend, "url", None)}
+    return router.stats()
+
+
+def _in_flight():
+    router = current_router()
+    return router.in_flight() if router is not None else None
+
+
+register_gauge("llm_backend_in_flight", "Générations en cours par serveur LLM", _in_flight, label="backend")
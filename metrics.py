@@ -0,0 +1,231 @@
+"""
+Mesures du pipeline (format texte Prometheus) et en-tête Server-Timing.
+
+Chaque étape (parsing du CV, nettoyage de l'offre, détection de langue, génération,
+rendu PDF...) est chronométrée avec stage() : la durée alimente un histogramme par
+étape, une exception incrémente le compteur d'erreurs de l'étape, et la durée est
+ajoutée aux mesures de la requête en cours (Server-Timing) si une requête est suivie.
+
+Les mesures sont gardées en mémoire dans le processus (sans dépendance) et exposées par
+render_metrics() sur /metrics. Les valeurs instantanées (générations en cours, file
+d'attente) sont lues au moment de l'export via register_gauge().
+"""
+import contextvars
+import functools
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = "cover_letter"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+CHAR_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 5000, 10000)
+
+_lock = threading.Lock()
+_registry = []
+
+# Durées des étapes de la requête en cours : [(étape, secondes)], None hors requête
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help_text
+        self.label_names = tuple(labels)
+        # Un compteur sans label est exporté dès le départ, à 0
+        self._values = {} if self.label_names else {(): 0}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in items)
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labels=()):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(labels)
+        self._series = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = sorted((key, {**series, "buckets": list(series["buckets"])}) for key, series in self._series.items())
+        for key, series in items:
+            for bound, count in zip(self.buckets + (float("inf"),), series["buckets"] + [series["count"]]):
+                labels = _labels(self.label_names, key, [f'le="{_number(bound)}"'])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(series['sum'])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {series['count']}")
+        return lines
+
+
+class Gauge:
+    """Valeur lue à l'export : read() retourne un nombre ou un dict {valeur du label: nombre}"""
+
+    def __init__(self, name, help_text, read, label=None):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help_text
+        self.read = read
+        self.label = label
+        _registry.append(self)
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if isinstance(value, dict):
+            lines.extend(f"{self.name}{_labels((self.label,), (key,))} {_number(v)}" for key, v in sorted(value.items()))
+        elif value is not None:
+            lines.append(f"{self.name} {_number(value)}")
+        return lines
+
+
+stage_seconds = Histogram("stage_seconds", "Durée des étapes du pipeline (s)", labels=("stage",))
+stage_errors = Counter("stage_errors_total", "Étapes terminées par une exception", labels=("stage",))
+http_seconds = Histogram("http_request_seconds", "Durée des requêtes HTTP (s)",
+                         labels=("method", "route", "status"))
+prompt_tokens = Histogram("prompt_tokens", "Taille estimée des prompts (tokens)", buckets=TOKEN_BUCKETS)
+output_chars = Histogram("output_chars", "Taille des lettres générées (caractères)", buckets=CHAR_BUCKETS)
+output_tokens = Counter("output_tokens_total", "Tokens produits par le modèle")
+llm_rejected = Counter("llm_rejected_total", "Générations refusées car la file d'attente était pleine")
+
+
+def register_gauge(name, help_text, read, label=None):
+    """Valeur instantanée (file d'attente, générations en cours...) lue à chaque export"""
+    return Gauge(name, help_text, read, label)
+
+
+def record_timing(name, seconds):
+    """Ajoute une durée aux mesures Server-Timing de la requête en cours (s'il y en a une)"""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def record_stage(name, seconds):
+    """Durée d'une étape mesurée ailleurs (attente, premier token...)"""
+    stage_seconds.observe(seconds, stage=name)
+    record_timing(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Chronomètre une étape : histogramme, compteur d'erreurs et Server-Timing"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage=name)
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """Décorateur : chaque appel de la fonction est une étape `name`"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        # Lu par worker_pool : dans un processus fils, la mesure est prise côté parent
+        wrapper.stage_name = name
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def request_timings():
+    """Suit les étapes exécutées pendant une requête ; produit la liste [(étape, secondes)]"""
+    timings = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing_header(timings, total=None):
+    """Valeur de l'en-tête Server-Timing (durées en ms, une entrée par étape, cumulées par nom)"""
+    durations = {}
+    for name, seconds in list(timings):
+        durations[name] = durations.get(name, 0.0) + seconds
+    entries = [f"{re.sub(r'[^A-Za-z0-9_-]', '_', name)};dur={seconds * 1000:.1f}" for name, seconds in durations.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def instrument_app(app):
+    """
+    Ajoute à une application FastAPI la mesure des requêtes (histogramme par route)
+    et l'en-tête Server-Timing avec la durée de chaque étape
+    """
+    @app.middleware("http")
+    async def server_timing(request, call_next):
+        started = time.perf_counter()
+        with request_timings() as timings:
+            status = 500
+            try:
+                response = await call_next(request)
+                status = response.status_code
+            finally:
+                total = time.perf_counter() - started
+                route = request.scope.get("route")
+                http_seconds.observe(total, method=request.method,
+                                     route=getattr(route, "path", "unmatched"), status=str(status))
+            response.headers["Server-Timing"] = server_timing_header(timings, total)
+            response.headers["Timing-Allow-Origin"] = "*"
+            return response
+
+
+def render_metrics():
+    """Toutes les mesures au format texte Prometheus"""
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
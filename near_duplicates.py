@@ -0,0 +1,271 @@
+"""
+Index des offres déjà traitées pour retrouver les quasi-doublons (MinHash + LSH).
+
+Une même offre est souvent republiée (JobTeaser, LinkedIn, Indeed...) avec de petites
+différences de texte : la clé exacte du cache des lettres ne la reconnaît pas. Chaque
+offre pour laquelle une lettre a été générée est indexée :
+- le texte est découpé en shingles (suites de SHINGLE_SIZE mots), hachés sur 64 bits,
+- la signature MinHash (SIGNATURE_SIZE valeurs) est calculée en une passe sur les
+  shingles (one permutation hashing : une case par valeur, densifiée),
+- la signature est coupée en LSH_BANDS bandes ; chaque bande donne un seau, propre à
+  la portée (même CV, même langue, même modèle, même version du prompt).
+
+Une recherche ne lit que les offres qui partagent un seau avec la nouvelle offre
+(requête indexée SQLite) puis estime leur similarité de Jaccard sur les signatures :
+son coût ne dépend pas du nombre d'offres indexées. L'index est mis à jour à chaque
+nouvelle lettre et borné à NEAR_DUP_MAX_OFFERS offres (les plus anciennes sortent).
+
+Configuration :
+- NEAR_DUP_DB : base SQLite de l'index, défaut offer_index.db
+- NEAR_DUP_THRESHOLD : similarité (Jaccard estimé) à partir de laquelle deux offres sont
+  considérées comme la même, défaut 0.8
+- NEAR_DUP_REUSE : "1" (défaut) pour resservir directement la lettre d'une offre
+  quasi identique, "0" pour seulement la proposer (/offers/similar)
+- NEAR_DUP_MAX_OFFERS : nombre maximal d'offres indexées, défaut 100000
+"""
+import hashlib
+import os
+import string
+import threading
+import time
+import zlib
+from array import array
+
+from cv_db import Transaction, open_connection
+
+NEAR_DUP_DB = os.environ.get("NEAR_DUP_DB", "offer_index.db")
+NEAR_DUP_THRESHOLD = float(os.environ.get("NEAR_DUP_THRESHOLD", "0.8"))
+NEAR_DUP_REUSE = os.environ.get("NEAR_DUP_REUSE", "1") == "1"
+NEAR_DUP_MAX_OFFERS = int(os.environ.get("NEAR_DUP_MAX_OFFERS", "100000"))
+
+SHINGLE_SIZE = 3
+# 128 valeurs en 16 bandes de 8 : une offre similaire à 80 % partage un seau avec une
+# probabilité de 95 %, à 90 % presque toujours, à 50 % dans 6 % des cas seulement
+SIGNATURE_SIZE = 128
+LSH_BANDS = 16
+ROWS_PER_BAND = SIGNATURE_SIZE // LSH_BANDS
+BIN_BITS = SIGNATURE_SIZE.bit_length() - 1
+
+MASK64 = (1 << 64) - 1
+EMPTY = MASK64
+
+# Ponctuation retirée autour des mots (plus rapide qu'une expression régulière sur une page entière)
+PUNCTUATION = string.punctuation + "«»–—•·©’“”…"
+
+
+def shingles(text):
+    """Empreintes 64 bits des suites de SHINGLE_SIZE mots (casse et ponctuation ignorées)"""
+    words = [zlib.crc32(word.encode("utf-8")) for word in
+             (raw.strip(PUNCTUATION) for raw in text.lower().split()) if word]
+    if not words:
+        return set()
+    if len(words) < SHINGLE_SIZE:
+        words += [0] * (SHINGLE_SIZE - len(words))
+    # Combinaison ordonnée des mots de chaque shingle, puis mélange des bits (xorshift-multiply)
+    combined = words[:len(words) - SHINGLE_SIZE + 1]
+    for offset in range(1, SHINGLE_SIZE):
+        combined = [(value * 0x9E3779B97F4A7C15 + word) & MASK64
+                    for value, word in zip(combined, words[offset:])]
+    return {((value ^ (value >> 31)) * 0xBF58476D1CE4E5B9) & MASK64 for value in set(combined)}
+
+
+def signature(hashes):
+    """
+    Signature MinHash en une passe : les bits de poids faible choisissent la case,
+    le reste est la valeur ; une case vide reprend la valeur de la suivante non vide
+    (densification). Les valeurs sont gardées sur 32 bits. None pour un texte vide.
+    """
+    if not hashes:
+        return None
+    mins = [EMPTY] * SIGNATURE_SIZE
+    for value in hashes:
+        slot = value & (SIGNATURE_SIZE - 1)
+        rest = value >> BIN_BITS
+        if rest < mins[slot]:
+            mins[slot] = rest
+    if EMPTY in mins:
+        # Parcours à rebours, en partant de la dernière case non vide (circulaire)
+        last = next(value for value in mins if value != EMPTY)
+        for index in range(SIGNATURE_SIZE - 1, -1, -1):
+            if mins[index] == EMPTY:
+                mins[index] = last
+            else:
+                last = mins[index]
+    return array('I', (value & 0xFFFFFFFF for value in mins))
+
+
+def similarity(first, second):
+    """Similarité de Jaccard estimée : part des valeurs identiques des deux signatures"""
+    return sum(a == b for a, b in zip(first, second)) / SIGNATURE_SIZE
+
+
+def scope_key(scope):
+    """Clé de 16 octets de la portée (CV, langue, modèle, prompt)"""
+    return hashlib.sha256(scope.encode("utf-8")).digest()[:16]
+
+
+def band_buckets(key, sig):
+    """Seau de chaque bande : entier signé 64 bits (type INTEGER de SQLite)"""
+    data = sig.tobytes()
+    width = ROWS_PER_BAND * sig.itemsize
+    buckets = []
+    for band in range(LSH_BANDS):
+        digest = hashlib.blake2b(data[band * width:(band + 1) * width], digest_size=8,
+                                 key=key, person=band.to_bytes(16, "little")).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+
+class OfferIndex:
+    """Offres indexées et seaux LSH dans SQLite (une connexion par thread)"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS offers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scope BLOB NOT NULL,
+        letter_key TEXT NOT NULL UNIQUE,
+        url TEXT,
+        signature BLOB NOT NULL,
+        created REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS buckets (
+        bucket INTEGER NOT NULL,
+        offer_id INTEGER NOT NULL,
+        PRIMARY KEY (bucket, offer_id)
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path=NEAR_DUP_DB, threshold=NEAR_DUP_THRESHOLD, max_offers=NEAR_DUP_MAX_OFFERS):
+        self.db_path = str(db_path)
+        self.threshold = threshold
+        self.max_offers = max_offers
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+        self.counters = {"lookups": 0, "matches": 0, "candidates": 0, "added": 0, "evicted": 0, "seconds": 0.0}
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = open_connection(self.db_path)
+        return conn
+
+    def add(self, scope, text, letter_key, url=None):
+        """Indexe l'offre d'une lettre générée ; False si le texte est vide ou déjà indexé"""
+        sig = signature(shingles(text))
+        if sig is None:
+            return False
+        key = scope_key(scope)
+        with Transaction(self._connection(), immediate=True) as conn:
+            if conn.execute("SELECT 1 FROM offers WHERE letter_key = ?", (letter_key,)).fetchone():
+                return False
+            offer_id = conn.execute(
+                "INSERT INTO offers(scope, letter_key, url, signature, created) VALUES (?, ?, ?, ?, ?)",
+                (key, letter_key, url, sig.tobytes(), time.time())
+            ).lastrowid
+            conn.executemany("INSERT OR IGNORE INTO buckets(bucket, offer_id) VALUES (?, ?)",
+                             [(bucket, offer_id) for bucket in band_buckets(key, sig)])
+            evicted = self._evict(conn, offer_id)
+        with self._lock:
+            self.counters["added"] += 1
+            self.counters["evicted"] += evicted
+        return True
+
+    @staticmethod
+    def _delete(conn, row):
+        """Supprime une offre et ses seaux (recalculés depuis la signature)"""
+        sig = array('I')
+        sig.frombytes(row["signature"])
+        conn.executemany("DELETE FROM buckets WHERE bucket = ? AND offer_id = ?",
+                         [(bucket, row["id"]) for bucket in band_buckets(row["scope"], sig)])
+        conn.execute("DELETE FROM offers WHERE id = ?", (row["id"],))
+
+    def _evict(self, conn, newest_id):
+        """Retire les offres les plus anciennes au-delà de max_offers"""
+        # Les id ne sont jamais réutilisés : l'écart entre le plus ancien et le plus récent
+        # majore le nombre d'offres (qui n'est compté que s'il peut dépasser la limite)
+        oldest_id = conn.execute("SELECT MIN(id) FROM offers").fetchone()[0]
+        if newest_id - oldest_id + 1 <= self.max_offers:
+            return 0
+        excess = conn.execute("SELECT COUNT(*) FROM offers").fetchone()[0] - self.max_offers
+        if excess <= 0:
+            return 0
+        rows = conn.execute("SELECT id, scope, signature FROM offers ORDER BY id LIMIT ?", (excess,)).fetchall()
+        for row in rows:
+            self._delete(conn, row)
+        return len(rows)
+
+    def find(self, scope, text, threshold=None, limit=3):
+        """
+        Offres indexées dans la même portée dont la similarité dépasse le seuil, les plus
+        proches d'abord : [{"letter_key", "url", "similarity", "created"}]
+        """
+        started = time.perf_counter()
+        sig = signature(shingles(text))
+        matches = [] if sig is None else self.find_signature(scope, sig, threshold, limit)
+        with self._lock:
+            self.counters["lookups"] += 1
+            self.counters["matches"] += bool(matches)
+            self.counters["seconds"] += time.perf_counter() - started
+        return matches
+
+    def find_signature(self, scope, sig, threshold=None, limit=3):
+        """Comme find(), à partir d'une signature déjà calculée"""
+        threshold = self.threshold if threshold is None else threshold
+        key = scope_key(scope)
+        buckets = band_buckets(key, sig)
+        candidates = self._connection().execute(
+            f"SELECT id, scope, letter_key, url, signature, created FROM offers WHERE id IN "
+            f"(SELECT offer_id FROM buckets WHERE bucket IN ({', '.join('?' * len(buckets))}))",
+            buckets
+        ).fetchall()
+        matches = []
+        for row in candidates:
+            if row["scope"] != key:
+                continue
+            other = array('I')
+            other.frombytes(row["signature"])
+            score = similarity(sig, other)
+            if score >= threshold:
+                matches.append({"letter_key": row["letter_key"], "url": row["url"],
+                                "similarity": round(score, 3), "created": row["created"]})
+        matches.sort(key=lambda match: -match["similarity"])
+        with self._lock:
+            self.counters["candidates"] += len(candidates)
+        return matches[:limit]
+
+    def remove(self, letter_key):
+        """Retire une offre dont la lettre n'existe plus"""
+        with Transaction(self._connection(), immediate=True) as conn:
+            row = conn.execute("SELECT id, scope, signature FROM offers WHERE letter_key = ?",
+                               (letter_key,)).fetchone()
+            if row is not None:
+                self._delete(conn, row)
+
+    def count(self):
+        with Transaction(self._connection()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM offers").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters["lookups"]
+        return {
+            **{name: value for name, value in counters.items() if name != "seconds"},
+            "offers": self.count(),
+            "threshold": self.threshold,
+            "match_rate": round(counters["matches"] / lookups, 3) if lookups else None,
+            "lookup_ms_avg": round(counters["seconds"] / lookups * 1000, 3) if lookups else None,
+        }
+
+
+_offer_index = None
+_offer_index_lock = threading.Lock()
+
+
+def get_offer_index():
+    global _offer_index
+    with _offer_index_lock:
+        if _offer_index is None:
+            _offer_index = OfferIndex()
+        return _offer_index
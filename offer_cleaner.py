@@ -0,0 +1,300 @@
+"""
+Nettoyage du texte des offres avant la détection de langue et le prompt.
+
+Le texte vient de l'extension (sélecteur de la description ou tout le body) ou de
+parser_offre (balises <p> ou texte Selenium) : bandeaux cookies, menus, listes
+"offres similaires" et lignes répétées s'y mélangent à l'offre. Ce module :
+- supprime les lignes répétées et les lignes de bruit connues (cookies, partage...),
+- apprend par domaine la fréquence de chaque ligne sur les offres déjà vues : une ligne
+  présente sur la plupart des pages d'un site (menu, pied de page) est du bruit,
+- garde le bloc de la description du poste (entre un titre de début et une liste
+  d'offres similaires, par exemple).
+
+Le texte nettoyé sert aussi de clé au cache des lettres : la même offre à la même URL
+doit toujours donner le même texte, même quand les statistiques du domaine ont changé
+depuis. Le premier nettoyage d'une offre (avec apprentissage) est donc gardé et resservi.
+
+Configuration :
+- OFFER_STATS_DB : base des statistiques par domaine, défaut offer_stats.db
+- OFFER_BOILERPLATE_RATIO : part des offres d'un domaine où une ligne doit apparaître
+  pour être considérée comme du bruit, défaut 0.5
+- OFFER_STATS_MIN_OFFERS : nombre d'offres vues avant d'utiliser les statistiques, défaut 3
+- OFFER_CLEANED_MAX : nombre de textes nettoyés gardés (les plus anciens sont oubliés), défaut 20000
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from cv_db import Transaction, open_connection
+from metrics import timed
+from prompt_builder import split_sentences
+
+OFFER_STATS_DB = os.environ.get("OFFER_STATS_DB", "offer_stats.db")
+OFFER_BOILERPLATE_RATIO = float(os.environ.get("OFFER_BOILERPLATE_RATIO", "0.5"))
+OFFER_STATS_MIN_OFFERS = int(os.environ.get("OFFER_STATS_MIN_OFFERS", "3"))
+OFFER_CLEANED_MAX = int(os.environ.get("OFFER_CLEANED_MAX", "20000"))
+
+# En dessous, on ne coupe plus : mieux vaut un peu de bruit qu'une offre tronquée
+MIN_DESCRIPTION_CHARS = 200
+
+NOISE_PATTERNS = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r"\bcookies?\b.*\b(accept|utilis|use|consent|param|settings|préférences|akzeptier|utilizz)",
+        r"(enable|activer|activez|aktivieren|habilita|abilita)\w* (le |el |il )?javascript|javascript (is )?(disabled|required)",
+        r"^(accepter|refuser|tout accepter|tout refuser|accept all|reject all|aceptar|akzeptieren|accetta)\b",
+        r"^(partager|share|compartir|teilen|condividi)\b",
+        r"^(se connecter|connexion|s'inscrire|sign in|log in|sign up|iniciar sesión|anmelden|accedi)\b",
+        r"^(signaler|report this job|melden)\b",
+        r"^(postuler|apply|apply now|bewerben|candidarsi|inscribirse)( maintenant| now| jetzt| ahora| ora)?$",
+        r"^(enregistrer|sauvegarder|save|guardar|speichern|salva)( l'offre| job| this job)?$",
+        r"^(accueil|home|inicio|startseite)$",
+        r"^©|all rights reserved|tous droits réservés",
+    )
+]
+
+START_MARKERS = re.compile(
+    r"^(description (du poste|de l'offre|du job)|descriptif du poste|le poste|votre mission|vos missions|missions"
+    r"|job description|about the (job|role|position)|the role|your role|role description"
+    r"|descripción (del puesto|de la oferta|del empleo)|tus funciones"
+    r"|stellenbeschreibung|ihre aufgaben|deine aufgaben"
+    r"|descrizione (del lavoro|della posizione|dell'offerta)|mansioni)\b",
+    re.IGNORECASE
+)
+
+STOP_MARKERS = re.compile(
+    r"^(offres similaires|offres d'emploi similaires|emplois similaires|ces offres pourraient|voir plus d'offres"
+    r"|similar jobs|similar job offers|people also viewed|more jobs|jobs you may like|recommended jobs"
+    r"|empleos similares|ofertas similares|ähnliche jobs|ähnliche stellen|offerte simili|lavori simili)\b",
+    re.IGNORECASE
+)
+
+_stats_lock = threading.Lock()
+_totals = {"offers": 0, "original_chars": 0, "cleaned_chars": 0, "repeated_lines": 0, "boilerplate_lines": 0}
+
+
+def offer_domain(url):
+    """Domaine de l'offre (sans www.), ou None"""
+    if not url:
+        return None
+    host = urlparse(url if "//" in url else f"//{url}").hostname or ""
+    return host[4:] if host.startswith("www.") else host or None
+
+
+def line_key(line):
+    """Empreinte d'une ligne, insensible à la casse, à la ponctuation et aux espaces"""
+    normalized = re.sub(r"\W+", " ", line.lower()).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def split_offer_lines(text):
+    """Lignes non vides ; un texte sur une seule ligne est découpé en phrases"""
+    return [line.strip() for line in split_sentences(text).splitlines() if line.strip()]
+
+
+def remove_repeated_lines(lines):
+    seen = set()
+    kept = []
+    for line in lines:
+        key = line_key(line)
+        if key not in seen:
+            seen.add(key)
+            kept.append(line)
+    return kept
+
+
+def is_noise(line):
+    return any(pattern.search(line) for pattern in NOISE_PATTERNS) and len(line) < 200
+
+
+def trim_to_description(lines):
+    """Garde les lignes entre un titre de description et une liste d'offres similaires"""
+    def length(part):
+        return sum(len(line) for line in part)
+
+    for index, line in enumerate(lines):
+        if STOP_MARKERS.match(line) and length(lines[:index]) >= MIN_DESCRIPTION_CHARS:
+            lines = lines[:index]
+            break
+
+    for index, line in enumerate(lines):
+        if START_MARKERS.match(line) and length(lines[index:]) >= MIN_DESCRIPTION_CHARS:
+            # Le titre du poste précède souvent la description : on le garde
+            title = lines[:1] if index > 0 else []
+            return title + lines[index:]
+    return lines
+
+
+class DomainStats:
+    """Fréquence des lignes par domaine, apprise sur les offres déjà vues (SQLite)"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS offers_seen (
+        domain TEXT NOT NULL,
+        offer_hash TEXT NOT NULL,
+        PRIMARY KEY (domain, offer_hash)
+    );
+    CREATE TABLE IF NOT EXISTS line_counts (
+        domain TEXT NOT NULL,
+        line_hash TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (domain, line_hash)
+    );
+    CREATE TABLE IF NOT EXISTS cleaned_offers (
+        offer_hash TEXT PRIMARY KEY,
+        cleaned TEXT NOT NULL,
+        created REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_cleaned_offers_created ON cleaned_offers(created);
+    """
+
+    def __init__(self, db_path=OFFER_STATS_DB, ratio=OFFER_BOILERPLATE_RATIO, min_offers=OFFER_STATS_MIN_OFFERS,
+                 max_cleaned=OFFER_CLEANED_MAX):
+        self.db_path = str(db_path)
+        self.ratio = ratio
+        self.min_offers = min_offers
+        self.max_cleaned = max_cleaned
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = open_connection(self.db_path)
+        return conn
+
+    def learn(self, domain, offer_id, line_hashes):
+        """Compte les lignes d'une offre ; une même offre (même URL) n'est comptée qu'une fois"""
+        line_hashes = sorted(set(line_hashes))
+        offer_hash = hashlib.sha1(offer_id.encode("utf-8")).hexdigest()
+        with Transaction(self._connection(), immediate=True) as conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO offers_seen(domain, offer_hash) VALUES (?, ?)", (domain, offer_hash)
+            ).rowcount
+            if inserted:
+                conn.executemany(
+                    """INSERT INTO line_counts(domain, line_hash, count) VALUES (?, ?, 1)
+                    ON CONFLICT(domain, line_hash) DO UPDATE SET count = count + 1""",
+                    [(domain, line_hash) for line_hash in line_hashes]
+                )
+
+    def boilerplate(self, domain, line_hashes):
+        """Empreintes des lignes présentes dans au moins `ratio` des offres du domaine"""
+        with Transaction(self._connection()) as conn:
+            offers = conn.execute("SELECT COUNT(*) FROM offers_seen WHERE domain = ?", (domain,)).fetchone()[0]
+            if offers < self.min_offers:
+                return set()
+            line_hashes = list(set(line_hashes))
+            threshold = max(2, self.ratio * offers)
+            found = set()
+            # Par paquets pour rester sous la limite de paramètres de SQLite
+            for start in range(0, len(line_hashes), 500):
+                chunk = line_hashes[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT line_hash FROM line_counts WHERE domain = ? AND count >= ? "
+                    f"AND line_hash IN ({', '.join('?' * len(chunk))})",
+                    [domain, threshold, *chunk]
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+
+    def cleaned(self, offer_hash):
+        """Texte nettoyé gardé pour cette offre, ou None"""
+        with Transaction(self._connection()) as conn:
+            row = conn.execute("SELECT cleaned FROM cleaned_offers WHERE offer_hash = ?", (offer_hash,)).fetchone()
+        return row[0] if row else None
+
+    def keep_cleaned(self, offer_hash, cleaned):
+        """Garde le texte nettoyé d'une offre (le premier l'emporte) dans la limite de max_cleaned"""
+        with Transaction(self._connection(), immediate=True) as conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO cleaned_offers(offer_hash, cleaned, created) VALUES (?, ?, ?)",
+                (offer_hash, cleaned, time.time())
+            ).rowcount
+            if inserted:
+                excess = conn.execute("SELECT COUNT(*) FROM cleaned_offers").fetchone()[0] - self.max_cleaned
+                if excess > 0:
+                    conn.execute(
+                        "DELETE FROM cleaned_offers WHERE offer_hash IN "
+                        "(SELECT offer_hash FROM cleaned_offers ORDER BY created LIMIT ?)", (excess,)
+                    )
+
+
+_domain_stats = None
+_domain_stats_lock = threading.Lock()
+
+
+def get_domain_stats():
+    global _domain_stats
+    with _domain_stats_lock:
+        if _domain_stats is None:
+            _domain_stats = DomainStats()
+        return _domain_stats
+
+
+@timed("offer_clean")
+def clean_offer(text, url=None, learn=True, domain_stats=None):
+    """
+    Retourne le texte de l'offre nettoyé (une ligne par phrase ou élément).
+    Avec l'URL, les lignes fréquentes sur le domaine sont retirées et l'offre
+    enrichit les statistiques du domaine (learn=True) ; le résultat est alors gardé
+    et resservi tel quel pour la même offre à la même URL.
+    """
+    if not text:
+        return text
+    lines = split_offer_lines(text)
+    unique = remove_repeated_lines(lines)
+    repeated = len(lines) - len(unique)
+
+    kept = [line for line in unique if not is_noise(line)]
+    boilerplate = len(unique) - len(kept)
+
+    domain = offer_domain(url)
+    offer_hash = None
+    if domain:
+        stats_db = domain_stats or get_domain_stats()
+        hashes = [line_key(line) for line in kept]
+        offer_hash = hashlib.sha1("\n".join([url.split("#")[0], *hashes]).encode("utf-8")).hexdigest()
+        cleaned = stats_db.cleaned(offer_hash)
+        if cleaned is not None:
+            _count(text, cleaned, repeated, boilerplate)
+            return cleaned
+        frequent = stats_db.boilerplate(domain, hashes)
+        if learn:
+            stats_db.learn(domain, url.split("#")[0], hashes)
+        if frequent:
+            filtered = [line for line, key in zip(kept, hashes) if key not in frequent]
+            # Si tout est "fréquent" (même offre republiée), on garde le texte
+            if sum(len(line) for line in filtered) >= MIN_DESCRIPTION_CHARS:
+                boilerplate += len(kept) - len(filtered)
+                kept = filtered
+
+    cleaned = "\n".join(trim_to_description(kept))
+    if not cleaned.strip():
+        cleaned = text.strip()
+    if offer_hash and learn:
+        stats_db.keep_cleaned(offer_hash, cleaned)
+
+    _count(text, cleaned, repeated, boilerplate)
+    return cleaned
+
+
+def _count(text, cleaned, repeated, boilerplate):
+    with _stats_lock:
+        _totals["offers"] += 1
+        _totals["original_chars"] += len(text)
+        _totals["cleaned_chars"] += len(cleaned)
+        _totals["repeated_lines"] += repeated
+        _totals["boilerplate_lines"] += boilerplate
+
+
+def stats():
+    """Totaux depuis le démarrage du processus"""
+    with _stats_lock:
+        totals = dict(_totals)
+    if totals["original_chars"]:
+        totals["removed_ratio"] = round(1 - totals["cleaned_chars"] / totals["original_chars"], 3)
+    return totals
@@ -0,0 +1,589 @@
+"""
+Récupération du texte des offres à partir de leur URL.
+
+- requests d'abord, avec une session partagée : les connexions restent ouvertes
+  d'une offre à l'autre (keep-alive) et les erreurs passagères sont réessayées,
+- Selenium ensuite, pour les pages rendues en JavaScript, avec un petit pool de Chrome
+  headless gardés ouverts : le driver n'est installé qu'une fois, un navigateur sert
+  plusieurs offres et la page est lue dès qu'elle est prête (plus d'attente fixe),
+- jamais de saisie au clavier en mode serveur : l'échec est une OfferFetchError,
+- seules les URL http(s) avec un nom d'hôte sont acceptées (InvalidOfferURLError) : ni
+  file://, ni data:, ni chrome:// ne doivent atteindre requests ou le navigateur,
+- le nom d'hôte est résolu et les adresses internes (loopback, privées, link-local comme
+  169.254.169.254...) sont refusées, à chaque redirection comme pour l'URL de départ :
+  l'API ne doit pas servir à lire le réseau du serveur. Les sites internes autorisés
+  (jobboard d'intranet) sont listés dans OFFER_ALLOWED_HOSTS.
+
+Selenium et webdriver_manager ne sont importés qu'au premier navigateur démarré : le
+démarrage de l'API ne les paie pas, et ils restent facultatifs si les pages statiques suffisent.
+
+Les pages sont gardées sur disque (corps HTML compressé + texte extrait) : pendant
+OFFER_CACHE_TTL aucune requête n'est faite, ensuite la page est redemandée avec
+If-None-Match / If-Modified-Since et une réponse 304 réutilise le texte déjà extrait.
+fetch_offers() récupère une liste d'URL en parallèle en limitant les requêtes par site.
+
+En ligne de commande (le JSON produit sert d'entrée à batch.py) :
+    python offer_fetcher.py urls.txt -o offres.json -j 8
+
+Configuration :
+- OFFER_FETCH_TIMEOUT : timeout des requêtes HTTP (s), défaut 10
+- OFFER_HTTP_POOL_SIZE : connexions gardées ouvertes par hôte, défaut 8
+- OFFER_BROWSERS : nombre maximal de navigateurs ouverts, défaut 2 (0 = pas de Selenium)
+- OFFER_BROWSER_TIMEOUT : attente maximale du contenu de la page (s), défaut 10
+- OFFER_BROWSER_MAX_USES : pages chargées avant de relancer un navigateur, défaut 50
+- OFFER_CACHE_DIR : cache des pages, défaut offer_cache
+- OFFER_CACHE_TTL : durée (s) pendant laquelle une page en cache est servie sans requête, défaut 3600
+- OFFER_FETCH_PARALLELISM : offres récupérées en parallèle par fetch_offers, défaut 8
+- OFFER_HOST_CONCURRENCY : requêtes simultanées au plus vers un même site, défaut 2
+- OFFER_HOST_INTERVAL : délai minimal (s) entre deux requêtes vers un même site, défaut 1
+- OFFER_ALLOWED_HOSTS : hôtes acceptés même sur une adresse interne, séparés par des virgules
+  (leurs sous-domaines aussi), défaut aucun
+"""
+import argparse
+import atexit
+import gzip
+import hashlib
+import ipaddress
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from language_id import language_of
+from metrics import stage, timed
+from offer_cleaner import clean_offer
+
+OFFER_FETCH_TIMEOUT = float(os.environ.get("OFFER_FETCH_TIMEOUT", "10"))
+OFFER_HTTP_POOL_SIZE = int(os.environ.get("OFFER_HTTP_POOL_SIZE", "8"))
+OFFER_BROWSERS = int(os.environ.get("OFFER_BROWSERS", "2"))
+OFFER_BROWSER_TIMEOUT = float(os.environ.get("OFFER_BROWSER_TIMEOUT", "10"))
+OFFER_BROWSER_MAX_USES = int(os.environ.get("OFFER_BROWSER_MAX_USES", "50"))
+OFFER_CACHE_DIR = Path(os.environ.get("OFFER_CACHE_DIR", "offer_cache"))
+OFFER_CACHE_TTL = int(os.environ.get("OFFER_CACHE_TTL", "3600"))
+OFFER_FETCH_PARALLELISM = int(os.environ.get("OFFER_FETCH_PARALLELISM", "8"))
+OFFER_HOST_CONCURRENCY = int(os.environ.get("OFFER_HOST_CONCURRENCY", "2"))
+OFFER_HOST_INTERVAL = float(os.environ.get("OFFER_HOST_INTERVAL", "1"))
+OFFER_ALLOWED_HOSTS = [
+    host.strip().lower().rstrip(".") for host in os.environ.get("OFFER_ALLOWED_HOSTS", "").split(",") if host.strip()
+]
+
+# Texte minimal pour considérer l'offre comme récupérée (requests / Selenium)
+MIN_STATIC_CHARS = 100
+MIN_BROWSER_CHARS = 50
+
+# Redirections suivies au plus par requests (chacune vérifiée comme l'URL de départ)
+MAX_REDIRECTS = 5
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+_stats_lock = threading.Lock()
+_totals = {"requests": 0, "static": 0, "browser": 0, "failed": 0, "cache_hits": 0, "not_modified": 0, "seconds": 0.0}
+
+# Seuls le titre et les paragraphes sont construits par BeautifulSoup, pas tout l'arbre de la page
+PAGE_STRAINER = SoupStrainer(["title", "p"])
+
+
+class OfferFetchError(Exception):
+    """L'offre n'a pu être récupérée ni par requests ni par Selenium"""
+
+
+class InvalidOfferURLError(ValueError):
+    """URL refusée : schéma autre que http(s), nom d'hôte absent, introuvable ou interne"""
+
+
+def _allowed_host(hostname):
+    """Hôte listé dans OFFER_ALLOWED_HOSTS (ou sous-domaine d'un hôte listé)"""
+    return any(hostname == host or hostname.endswith("." + host) for host in OFFER_ALLOWED_HOSTS)
+
+
+def _internal_address(address):
+    """Adresse du réseau du serveur : loopback, privée, link-local, réservée, multicast..."""
+    address = ipaddress.ip_address(address.split("%")[0])
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return not address.is_global or address.is_multicast
+
+
+def check_offer_url(url):
+    """
+    Lève InvalidOfferURLError si l'URL n'est pas une page http(s) d'un site public :
+    le nom d'hôte est résolu et toutes ses adresses doivent être publiques
+    (sauf hôte listé dans OFFER_ALLOWED_HOSTS)
+    """
+    try:
+        parsed = urlparse(url)
+        hostname = parsed.hostname
+        port = parsed.port
+    except (TypeError, ValueError) as e:
+        raise InvalidOfferURLError(f"URL invalide: {url!r}") from e
+    if parsed.scheme.lower() not in ("http", "https") or not hostname:
+        raise InvalidOfferURLError(f"URL refusée (http ou https avec un nom d'hôte uniquement): {url!r}")
+    hostname = hostname.rstrip(".")
+    if _allowed_host(hostname):
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(hostname, port or 443, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise InvalidOfferURLError(f"Nom d'hôte introuvable: {hostname}") from e
+    if any(_internal_address(address) for address in addresses):
+        raise InvalidOfferURLError(f"URL refusée (adresse interne, voir OFFER_ALLOWED_HOSTS): {url!r}")
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Session HTTP partagée (pool de connexions, réessais sur les erreurs passagères)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            retries = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                            allowed_methods=("GET", "HEAD"))
+            adapter = HTTPAdapter(pool_connections=OFFER_HTTP_POOL_SIZE, pool_maxsize=OFFER_HTTP_POOL_SIZE,
+                                  max_retries=retries)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            _session = session
+        return _session
+
+
+def extract_page(html):
+    """(titre, texte brut des paragraphes) d'une page HTML"""
+    soup = BeautifulSoup(html, 'html.parser', parse_only=PAGE_STRAINER)
+    title = soup.find('title')
+    raw_text = '\n'.join(p.get_text() for p in soup.find_all('p'))
+    return (title.get_text().strip() if title else None), raw_text
+
+
+def fetch_static(url, timeout=OFFER_FETCH_TIMEOUT, cached=None):
+    """
+    Page lue avec requests : {"raw_text", "title", "etag", "last_modified", "body"},
+    {"not_modified": True} si la version en cache (cached) est toujours valable,
+    ou None s'il faut passer par un navigateur
+    """
+    headers = {}
+    if cached and cached.get("method") == "static":
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    session = get_session()
+    for _ in range(MAX_REDIRECTS + 1):
+        response = session.get(url, timeout=timeout, headers=headers, allow_redirects=False)
+        if not response.is_redirect:
+            break
+        # Une redirection ne doit pas mener au réseau interne : même contrôle que l'URL de départ
+        response.close()
+        url = urljoin(url, response.headers["Location"])
+        check_offer_url(url)
+    else:
+        return None
+    if response.status_code == 304 and headers:
+        return {"not_modified": True}
+    if response.status_code >= 400:
+        return None
+    title, raw_text = extract_page(response.text)
+    if "Enable JavaScript" in raw_text:
+        return None
+    return {
+        "raw_text": raw_text,
+        "title": title,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "body": response.content,
+    }
+
+
+class PageCache:
+    """
+    Pages déjà récupérées, une paire de fichiers par URL : <clé>.json (texte extrait,
+    titre, méthode, ETag, Last-Modified, date de vérification) et <clé>.html.gz (corps)
+    """
+
+    def __init__(self, directory=OFFER_CACHE_DIR, ttl=OFFER_CACHE_TTL):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.split("#")[0].encode("utf-8")).hexdigest()
+        return self.directory / f"{key}.json", self.directory / f"{key}.html.gz"
+
+    def get(self, url):
+        """Entrée en cache avec "fresh" (vérifiée il y a moins de ttl secondes), ou None"""
+        meta_path, _ = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        entry["fresh"] = time.time() - entry.get("checked_at", 0) < self.ttl
+        return entry
+
+    def put(self, url, entry, body=None):
+        meta_path, body_path = self._paths(url)
+        entry = {key: value for key, value in entry.items() if key not in ("fresh", "body", "not_modified")}
+        entry["url"] = url
+        entry["checked_at"] = time.time()
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        if body is not None:
+            body_tmp = body_path.with_suffix(suffix)
+            body_tmp.write_bytes(gzip.compress(body))
+            os.replace(body_tmp, body_path)
+        meta_tmp = meta_path.with_suffix(suffix)
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(meta_tmp, meta_path)
+        return entry
+
+
+class HostLimiter:
+    """Limite les requêtes vers un même site : `concurrency` à la fois, espacées d'`interval` secondes"""
+
+    def __init__(self, concurrency=OFFER_HOST_CONCURRENCY, interval=OFFER_HOST_INTERVAL):
+        self.concurrency = max(1, concurrency)
+        self.interval = interval
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, url):
+        host = urlparse(url).hostname or ""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = {"semaphore": threading.Semaphore(self.concurrency), "next": 0.0}
+        with state["semaphore"]:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, state["next"])
+                state["next"] = start + self.interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+def _browser_errors():
+    """Exceptions d'un navigateur qui font échouer la récupération (Selenium importé à la demande)"""
+    try:
+        from selenium.common.exceptions import WebDriverException
+    except ImportError:
+        return (ImportError, OSError, ValueError)
+    return (WebDriverException, ImportError, OSError, ValueError)
+
+
+def _body_text(driver):
+    """Condition d'attente : texte du body dès qu'il est assez long et la page chargée"""
+    from selenium.webdriver.common.by import By
+
+    if driver.execute_script("return document.readyState") != "complete":
+        return False
+    text = driver.find_element(By.TAG_NAME, "body").text
+    return text if len(text.strip()) >= MIN_STATIC_CHARS else False
+
+
+class BrowserPool:
+    """
+    Navigateurs Chrome headless réutilisés d'une offre à l'autre. Un navigateur est
+    créé à la demande (au plus `size`), rendu au pool après usage, et relancé après
+    max_uses pages ou une erreur.
+    """
+
+    def __init__(self, size=OFFER_BROWSERS, timeout=OFFER_BROWSER_TIMEOUT, max_uses=OFFER_BROWSER_MAX_USES):
+        self.size = size
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._driver_path = None
+        self.counters = {"started": 0, "reused": 0, "recycled": 0}
+
+    def _service(self):
+        from selenium.webdriver.chrome.service import Service
+        from webdriver_manager.chrome import ChromeDriverManager
+
+        # ChromeDriverManager vérifie la version en ligne : une seule fois par processus
+        with self._lock:
+            if self._driver_path is None:
+                self._driver_path = ChromeDriverManager().install()
+            return Service(self._driver_path)
+
+    def _start(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
+        options = Options()
+        options.add_argument("--headless")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--window-size=1920,1080")
+        # Ne pas attendre les images et scripts tiers : la lecture attend le contenu (_body_text)
+        options.page_load_strategy = "eager"
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        started = time.perf_counter()
+        driver = webdriver.Chrome(service=self._service(), options=options)
+        driver.set_page_load_timeout(self.timeout * 3)
+        print(f"🌍 Navigateur headless démarré en {time.perf_counter() - started:.1f} s")
+        with self._lock:
+            self.counters["started"] += 1
+        return {"driver": driver, "uses": 0}
+
+    def _quit(self, browser):
+        try:
+            browser["driver"].quit()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def browser(self):
+        """Réserve un navigateur ; attend qu'un navigateur se libère si le pool est plein"""
+        if self.size <= 0:
+            raise OfferFetchError("Selenium désactivé (OFFER_BROWSERS=0)")
+        browser = None
+        while browser is None:
+            with self._lock:
+                create = self._idle.empty() and self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    browser = self._start()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                break
+            try:
+                # Attente bornée : un navigateur fermé sur erreur libère une place sans repasser par la file
+                browser = self._idle.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self._lock:
+                self.counters["reused"] += 1
+
+        try:
+            yield browser["driver"]
+        except Exception:
+            # Navigateur dans un état inconnu (crash, page bloquée) : on le remplace
+            self._quit(browser)
+            raise
+        browser["uses"] += 1
+        if browser["uses"] >= self.max_uses:
+            with self._lock:
+                self.counters["recycled"] += 1
+            self._quit(browser)
+        else:
+            self._idle.put(browser)
+
+    def fetch(self, url):
+        """Texte de la page rendue, lu dès que le contenu est présent"""
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        with self.browser() as driver:
+            # Page précédente vidée pour ne pas lire son texte si la nouvelle tarde
+            driver.get("about:blank")
+            driver.get(url)
+            # Le navigateur suit les redirections lui-même : la page obtenue est vérifiée après coup
+            if urlparse(driver.current_url).scheme in ("http", "https"):
+                check_offer_url(driver.current_url)
+            try:
+                text = WebDriverWait(driver, self.timeout, poll_frequency=0.2).until(_body_text)
+            except TimeoutException:
+                # Page lente ou peu de texte : on prend ce qui est affiché
+                text = driver.find_element(By.TAG_NAME, "body").text or \
+                    BeautifulSoup(driver.page_source, 'html.parser').get_text()
+            return '\n'.join(line.strip() for line in text.split('\n') if line.strip())
+
+    def close(self):
+        """Ferme les navigateurs inoccupés (à l'arrêt du serveur)"""
+        while True:
+            try:
+                browser = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(browser)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "open": self._created, "idle": self._idle.qsize(), "size": self.size}
+
+
+browser_pool = BrowserPool()
+atexit.register(browser_pool.close)
+
+_page_cache = None
+_host_limiter = HostLimiter()
+_shared_lock = threading.Lock()
+
+
+def get_page_cache():
+    global _page_cache
+    with _shared_lock:
+        if _page_cache is None:
+            _page_cache = PageCache()
+        return _page_cache
+
+
+@timed("offer_fetch")
+def fetch_offer_page(url, pool=None, cache=None, limiter=None):
+    """
+    Retourne {"url", "title", "content" (texte nettoyé), "langue", "method", "cached"}
+    pour une URL d'offre, depuis le cache si possible.
+    Lève InvalidOfferURLError pour une URL autre que http(s) ou menant au réseau interne,
+    OfferFetchError si aucune méthode ne donne de contenu.
+    """
+    check_offer_url(url)
+    pool = pool or browser_pool
+    cache = cache or get_page_cache()
+    limiter = limiter or _host_limiter
+    started = time.perf_counter()
+    with _stats_lock:
+        _totals["requests"] += 1
+
+    entry = cache.get(url)
+    if entry is not None and entry["fresh"]:
+        return _done(url, entry, "cache_hits", started, cached=True)
+
+    try:
+        with limiter.slot(url):
+            try:
+                print("   🔄 Tentative avec requests...")
+                with stage("offer_http"):
+                    page = fetch_static(url, cached=entry)
+                if page is not None and page.get("not_modified"):
+                    print("   ✅ Page inchangée depuis la dernière visite (304)")
+                    entry = cache.put(url, entry)
+                    return _done(url, entry, "not_modified", started, cached=True)
+                if page is not None and len(clean_offer(page["raw_text"], url, learn=False).strip()) > MIN_STATIC_CHARS:
+                    print("   ✅ Contenu récupéré avec requests")
+                    entry = cache.put(url, {**page, "method": "static"}, page["body"])
+                    return _done(url, entry, "static", started)
+                print("   ⚠️  Contenu insuffisant ou JavaScript requis")
+            except requests.RequestException as e:
+                print(f"   ⚠️  Requests échoué: {str(e)}")
+
+            print("   🔄 Tentative avec Selenium (JavaScript)...")
+            try:
+                with stage("offer_browser"):
+                    raw_text = pool.fetch(url)
+            except _browser_errors() as e:
+                raise OfferFetchError(f"Selenium échoué: {e}") from e
+            if len(clean_offer(raw_text, url, learn=False).strip()) < MIN_BROWSER_CHARS:
+                raise OfferFetchError("Contenu insuffisant récupéré")
+            print("   ✅ Contenu récupéré avec Selenium")
+            entry = cache.put(url, {"raw_text": raw_text, "title": None, "method": "browser"})
+            return _done(url, entry, "browser", started)
+    except OfferFetchError:
+        with _stats_lock:
+            _totals["failed"] += 1
+        raise
+
+
+def fetch_offer(url, pool=None, cache=None):
+    """
+    Retourne (texte nettoyé, langue, méthode) pour une URL d'offre.
+    Lève OfferFetchError si aucune méthode ne donne de contenu.
+    """
+    result = fetch_offer_page(url, pool, cache)
+    return result["content"], result["langue"], result["method"]
+
+
+def _done(url, entry, counter, started, cached=False):
+    # Nettoyé à chaque fois : les statistiques du domaine évoluent d'une offre à l'autre
+    text = clean_offer(entry["raw_text"], url).strip()
+    with _stats_lock:
+        _totals[counter] += 1
+        _totals["seconds"] += time.perf_counter() - started
+    return {
+        "url": url,
+        "title": entry.get("title"),
+        "content": text,
+        "langue": language_of(text),
+        "method": entry["method"],
+        "cached": cached,
+    }
+
+
+def fetch_offers(urls, parallelism=OFFER_FETCH_PARALLELISM, pool=None, cache=None):
+    """
+    Récupère plusieurs offres en parallèle (au plus OFFER_HOST_CONCURRENCY requêtes par site).
+    Retourne un résultat par URL, dans l'ordre : le résultat de fetch_offer_page avec
+    "status": "ok", ou {"url", "status": "error", "error"}. Une URL en échec n'interrompt pas le lot ;
+    une URL refusée (InvalidOfferURLError) fait refuser tout le lot avant la première requête
+    (une redirection refusée n'est qu'une erreur pour son offre).
+    """
+    for url in urls:
+        check_offer_url(url)
+
+    def fetch_one(url):
+        try:
+            return {**fetch_offer_page(url, pool, cache), "status": "ok"}
+        except (OfferFetchError, InvalidOfferURLError, requests.RequestException) as e:
+            return {"url": url, "status": "error", "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix="fetch") as executor:
+        return list(executor.map(fetch_one, urls))
+
+
+def stats():
+    """Totaux depuis le démarrage du processus"""
+    with _stats_lock:
+        totals = dict(_totals)
+    totals["seconds"] = round(totals["seconds"], 3)
+    return {**totals, "browsers": browser_pool.stats()}
+
+
+def load_urls_file(path):
+    """URL depuis un fichier JSON (liste) ou texte (une URL par ligne, # pour les commentaires)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    if path.endswith('.json'):
+        return json.loads(content)
+    return [line.strip() for line in content.splitlines() if line.strip() and not line.strip().startswith('#')]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Récupère le texte de plusieurs offres à partir de leurs URL")
+    parser.add_argument("urls", help="URL : JSON (liste) ou texte, une par ligne")
+    parser.add_argument("-o", "--output", default="offres.json", help="Offres récupérées (entrée de batch.py)")
+    parser.add_argument("-j", "--parallelism", type=int, default=OFFER_FETCH_PARALLELISM)
+    args = parser.parse_args()
+
+    urls = load_urls_file(args.urls)
+    started = time.perf_counter()
+    try:
+        results = fetch_offers(urls, args.parallelism)
+    except InvalidOfferURLError as e:
+        raise SystemExit(f"❌ {e}")
+    offers = [
+        {"url": r["url"], "title": r["title"], "content": r["content"], "langue": r["langue"]}
+        for r in results if r["status"] == "ok"
+    ]
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(offers, f, ensure_ascii=False, indent=2)
+    for r in results:
+        if r["status"] == "error":
+            print(f"❌ {r['url']} : {r['error']}")
+    cached = sum(1 for r in results if r.get("cached"))
+    print(f"✅ {len(offers)}/{len(urls)} offre(s) dans {args.output} en {time.perf_counter() - started:.1f} s "
+          f"({cached} depuis le cache)")
@@ -1,8 +1,20 @@
 import fitz  # PyMuPDF
 
-def extract_cv_content(pdf_path):
-    doc = fitz.open(pdf_path)
-    text = ''
-    for page in doc:
-        text += page.get_text()
-    return text.strip()
\ No newline at end of file
+from metrics import timed
+
+@timed("cv_parse")
+def extract_cv_document(source):
+    """
+    Extrait le texte du CV et son nombre de pages
+    source : chemin du PDF ou son contenu (bytes, parsé en mémoire sans fichier)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        doc = fitz.open(stream=source, filetype="pdf")
+    else:
+        doc = fitz.open(source)
+    with doc:
+        text = ''.join(page.get_text() for page in doc)
+        return {"text": text.strip(), "pages": doc.page_count}
+
+def extract_cv_content(source):
+    return extract_cv_document(source)["text"]
\ No newline at end of file
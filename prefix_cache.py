@@ -0,0 +1,113 @@
+"""
+Réutilisation du contexte du modèle (cache KV) pour le préfixe des prompts.
+
+Le prompt est construit en deux parties : un préfixe stable (instructions + CV) et
+un suffixe variable (offre + langue). Quand le même CV sert pour plusieurs offres,
+le serveur du modèle peut garder l'état du préfixe et ne calculer que l'offre :
+- llama.cpp : `cache_prompt` et un slot dédié (`id_slot`) par préfixe,
+- Ollama : réutilisation automatique du préfixe commun dans le runner.
+
+Ce module associe chaque préfixe (donc chaque couple CV / modèle) à un slot dans un
+LRU borné, et mesure les tokens de prefill économisés.
+
+Configuration :
+- LLM_SLOTS : nombre de slots du serveur llama.cpp (`-np`), 0 = pas d'affectation
+- LLM_PREFIX_CACHE_SIZE : nombre de préfixes suivis quand LLM_SLOTS vaut 0, défaut 8
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+LLM_SLOTS = int(os.environ.get("LLM_SLOTS", "0"))
+LLM_PREFIX_CACHE_SIZE = int(os.environ.get("LLM_PREFIX_CACHE_SIZE", "8"))
+
+
+def prefix_key(model, prefix):
+    return hashlib.sha256(f"{model}\n{prefix}".encode("utf-8")).hexdigest()
+
+
+class PrefixCache:
+    """
+    LRU des préfixes dont le contexte est probablement encore chargé côté serveur.
+    Avec des slots, chaque préfixe garde le même slot tant qu'il n'est pas évincé.
+    """
+
+    def __init__(self, slots=LLM_SLOTS, max_entries=LLM_PREFIX_CACHE_SIZE):
+        self.slots = slots
+        # Un slot ne garde qu'un contexte : pas plus de préfixes suivis que de slots
+        self.max_entries = slots if slots else max_entries
+        self._entries = OrderedDict()
+        self._busy = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            "requests": 0, "hits": 0, "misses": 0, "evictions": 0,
+            "prompt_tokens": 0, "prefill_tokens": 0, "cached_tokens": 0,
+        }
+
+    def _assign(self, key):
+        """Entrée du préfixe (créée si besoin) ; retourne (entrée, hit)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry, True
+
+        free_slot = None
+        if len(self._entries) >= self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            free_slot = evicted["slot"]
+            self.counters["evictions"] += 1
+        if self.slots and free_slot is None:
+            used = {item["slot"] for item in self._entries.values()}
+            free_slot = next(slot for slot in range(self.slots) if slot not in used)
+        entry = self._entries[key] = {"slot": free_slot}
+        return entry, False
+
+    @contextmanager
+    def use(self, model, prefix):
+        """
+        Réserve le préfixe pour une génération ; produit (slot, hit).
+        Le slot vaut None si le slot du préfixe est déjà occupé (génération simultanée
+        pour le même CV) : le serveur en choisit alors un autre plutôt que d'attendre.
+        """
+        key = prefix_key(model, prefix)
+        with self._lock:
+            entry, hit = self._assign(key)
+            slot = entry["slot"]
+            if slot is not None and self._busy.get(slot):
+                slot = None
+            if slot is not None:
+                self._busy[slot] = self._busy.get(slot, 0) + 1
+            self.counters["requests"] += 1
+            self.counters["hits" if hit else "misses"] += 1
+        try:
+            yield slot, hit
+        finally:
+            if slot is not None:
+                with self._lock:
+                    self._busy[slot] -= 1
+
+    def record(self, prompt_tokens, prefill_tokens, cached_tokens):
+        """Tokens du prompt, tokens réellement calculés et tokens repris du cache"""
+        with self._lock:
+            self.counters["prompt_tokens"] += prompt_tokens
+            self.counters["prefill_tokens"] += prefill_tokens
+            self.counters["cached_tokens"] += cached_tokens
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            entries = len(self._entries)
+        return {
+            **counters,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "slots": self.slots,
+            "hit_rate": round(counters["hits"] / counters["requests"], 3) if counters["requests"] else None,
+            "prefill_saved_ratio": round(counters["cached_tokens"] / counters["prompt_tokens"], 3)
+            if counters["prompt_tokens"] else None,
+        }
+
+
+prefix_cache = PrefixCache()
@@ -0,0 +1,266 @@
+"""
+Réduction du CV et de l'offre avant construction du prompt.
+
+Le temps de prefill du modèle croît avec la longueur du prompt. Ce module :
+- découpe le CV en sections puis en blocs,
+- supprime les lignes dupliquées et le bruit (numéros de page, "Curriculum Vitae"...),
+- classe les blocs du CV par pertinence avec BM25 sur les mots-clés de l'offre,
+- remplit un budget de tokens par ordre de priorité (en gardant l'ordre d'origine),
+- et indique combien de tokens ont été économisés.
+
+Configuration :
+- PROMPT_TOKEN_BUDGET : budget pour CV + offre (0 = pas de réduction), défaut 1500
+- PROMPT_OFFER_SHARE : part du budget réservée à l'offre, défaut 0.45
+- PROMPT_STABLE_CV : "auto" (défaut), "1" ou "0" ; réduit le CV sans tenir compte de l'offre
+  (préfixe identique d'une offre à l'autre). En "auto", seulement si le backend garde le
+  contexte du préfixe (llama.cpp avec LLM_SLOTS)
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "1500"))
+PROMPT_OFFER_SHARE = float(os.environ.get("PROMPT_OFFER_SHARE", "0.45"))
+PROMPT_STABLE_CV = os.environ.get("PROMPT_STABLE_CV", "auto")
+
+# Caractères par token, en moyenne (estimation sans tokenizer)
+CHARS_PER_TOKEN = 4
+
+# Taille visée pour un bloc de CV (en caractères) avant découpage
+BLOCK_MAX_CHARS = 400
+
+SECTION_KEYWORDS = (
+    "expérience", "experience", "experiencia", "erfahrung", "esperienz",
+    "formation", "education", "éducation", "formación", "ausbildung", "istruzione",
+    "compétence", "competence", "skill", "habilidades", "kenntnisse", "competenze",
+    "langue", "language", "idioma", "sprache", "lingu",
+    "projet", "project", "proyecto", "projekt", "progett",
+    "certification", "intérêts", "interests", "loisirs", "hobbies", "profil", "profile",
+    "summary", "résumé", "about", "publications", "bénévolat", "volunteer",
+)
+
+BOILERPLATE_PATTERNS = [
+    re.compile(r"^\s*(page\s*)?\d+\s*(/|sur|of|von|di|de)\s*\d+\s*$", re.IGNORECASE),
+    re.compile(r"^\s*(curriculum\s+vitae|cv|resume|résumé|lebenslauf)\s*$", re.IGNORECASE),
+    re.compile(r"^\s*[\W_]+\s*$"),
+]
+
+STOPWORDS = set("""
+a an and are as at be by for from has have in is it its of on or that the to was were will with you your we our
+au aux avec ce ces dans de des du elle en et eux il je la le les leur lui ma mais me même mes moi mon ne nos notre
+nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi ton tu un une vos votre vous c d j l m n s t y été
+être avoir fait sont est plus
+el la los las un una unos unas y o de del al en con por para es son que se su sus lo como
+der die das ein eine und oder mit für von zu im in ist sind auf den dem des sie wir ihr
+il lo la i gli le un una e o di da con per che è sono del della nel
+""".split())
+
+_stats_lock = threading.Lock()
+_totals = {"prompts": 0, "original_tokens": 0, "final_tokens": 0, "saved_tokens": 0}
+
+
+def estimate_tokens(text):
+    """Estimation du nombre de tokens (≈ 1 token pour 4 caractères, au moins 1 par mot)"""
+    if not text:
+        return 0
+    return max(len(text.split()), math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def tokenize(text):
+    return [word for word in re.findall(r"\w+", text.lower()) if len(word) > 1 and word not in STOPWORDS]
+
+
+def _normalize_line(line):
+    return re.sub(r"\W+", " ", line.lower()).strip()
+
+
+def clean_lines(text):
+    """Lignes non vides, sans doublons ni lignes de bruit"""
+    seen = set()
+    lines = []
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            lines.append("")
+            continue
+        if any(pattern.match(line) for pattern in BOILERPLATE_PATTERNS):
+            continue
+        key = _normalize_line(line)
+        if key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return lines
+
+
+def is_heading(line):
+    """Titre de section : ligne courte en majuscules ou contenant un mot-clé de section"""
+    if not line or len(line) > 40:
+        return False
+    stripped = line.rstrip(':').strip()
+    if stripped.isupper() and len(stripped) > 2:
+        return True
+    lower = stripped.lower()
+    return len(lower.split()) <= 4 and any(lower.startswith(keyword) for keyword in SECTION_KEYWORDS)
+
+
+def segment_cv(cv_text):
+    """
+    Découpe le CV en blocs {"section", "text", "position"} : une section par titre,
+    elle-même coupée aux lignes vides ou quand elle dépasse BLOCK_MAX_CHARS
+    """
+    blocks = []
+    section = "profil"
+    current = []
+
+    def flush():
+        if current:
+            text = "\n".join(current).strip()
+            if text:
+                blocks.append({"section": section, "text": text, "position": len(blocks)})
+            current.clear()
+
+    for line in clean_lines(cv_text):
+        if not line:
+            flush()
+            continue
+        if is_heading(line):
+            flush()
+            section = line.rstrip(':').strip()
+            current.append(line)
+            continue
+        if current and sum(len(part) for part in current) + len(line) > BLOCK_MAX_CHARS:
+            flush()
+        current.append(line)
+    flush()
+    return blocks
+
+
+def bm25_scores(blocks, query_terms, k1=1.5, b=0.75):
+    """Score BM25 de chaque bloc pour les termes de la requête"""
+    documents = [tokenize(block["text"]) for block in blocks]
+    if not documents:
+        return []
+    avg_length = sum(len(doc) for doc in documents) / len(documents) or 1
+    document_frequency = Counter(term for doc in documents for term in set(doc))
+    n = len(documents)
+
+    scores = []
+    for doc in documents:
+        frequencies = Counter(doc)
+        score = 0.0
+        for term, weight in query_terms.items():
+            tf = frequencies.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += weight * idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_length))
+        scores.append(score)
+    return scores
+
+
+def offer_keywords(offre, limit=40):
+    """Mots-clés de l'offre pondérés par leur fréquence"""
+    return dict(Counter(tokenize(offre)).most_common(limit))
+
+
+def _truncate_to_budget(lines, budget):
+    """Garde les premières lignes qui tiennent dans le budget (la dernière est coupée au mot)"""
+    kept = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            words = []
+            for word in line.split():
+                if used + estimate_tokens(" ".join(words + [word])) > budget:
+                    break
+                words.append(word)
+            if words:
+                kept.append(" ".join(words))
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+
+def split_sentences(text):
+    """Découpe en phrases : le texte extrait d'une page tient souvent sur une seule ligne"""
+    sentences = []
+    for line in text.splitlines():
+        sentences.extend(part.strip() for part in re.split(r"(?<=[.!?;])\s+|\s{2,}|\s[•·|]\s", line))
+    return "\n".join(sentences)
+
+
+def trim_offer(offre, budget):
+    """Offre sans phrases dupliquées ni bruit, coupée au budget"""
+    lines = [line for line in clean_lines(split_sentences(offre)) if line]
+    if budget and estimate_tokens("\n".join(lines)) > budget:
+        return _truncate_to_budget(lines, budget)
+    return "\n".join(lines)
+
+
+def trim_cv(cv, offre, budget):
+    """Garde les blocs du CV les plus pertinents pour l'offre dans la limite du budget"""
+    blocks = segment_cv(cv)
+    if not budget or sum(estimate_tokens(block["text"]) for block in blocks) <= budget:
+        return "\n\n".join(block["text"] for block in blocks), len(blocks), 0
+
+    scores = bm25_scores(blocks, offer_keywords(offre))
+    # Le premier bloc (identité, titre du profil) passe en premier, puis les plus pertinents
+    ranked = sorted(blocks, key=lambda block: (block["position"] != 0, -scores[block["position"]], block["position"]))
+
+    kept = []
+    used = 0
+    for block in ranked:
+        cost = estimate_tokens(block["text"])
+        if used + cost <= budget:
+            kept.append(block)
+            used += cost
+    kept.sort(key=lambda block: block["position"])
+    return "\n\n".join(block["text"] for block in kept), len(kept), len(blocks) - len(kept)
+
+
+def build_prompt_inputs(cv, offre, budget=None, offer_share=PROMPT_OFFER_SHARE, stable_cv=False):
+    """
+    Retourne (cv réduit, offre réduite, statistiques) pour un budget de tokens.
+    L'offre prend au plus offer_share du budget, le CV le reste (et ce que l'offre n'utilise pas).
+    Avec stable_cv, le CV a une part fixe du budget et ses blocs sont gardés dans l'ordre,
+    sans tenir compte de l'offre : il est réduit de la même façon pour toutes les offres
+    (préfixe de prompt identique, voir prefix_cache.py).
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    original_tokens = estimate_tokens(cv) + estimate_tokens(offre)
+
+    offer_budget = int(budget * offer_share) if budget else 0
+    trimmed_offer = trim_offer(offre, offer_budget)
+    if stable_cv:
+        cv_budget = budget - offer_budget if budget else 0
+        trimmed_cv, kept_blocks, dropped_blocks = trim_cv(cv, "", cv_budget)
+    else:
+        cv_budget = budget - estimate_tokens(trimmed_offer) if budget else 0
+        trimmed_cv, kept_blocks, dropped_blocks = trim_cv(cv, trimmed_offer, max(cv_budget, 0))
+
+    final_tokens = estimate_tokens(trimmed_cv) + estimate_tokens(trimmed_offer)
+    stats = {
+        "budget": budget,
+        "original_tokens": original_tokens,
+        "final_tokens": final_tokens,
+        "saved_tokens": max(original_tokens - final_tokens, 0),
+        "cv_blocks_kept": kept_blocks,
+        "cv_blocks_dropped": dropped_blocks,
+    }
+    with _stats_lock:
+        _totals["prompts"] += 1
+        _totals["original_tokens"] += original_tokens
+        _totals["final_tokens"] += final_tokens
+        _totals["saved_tokens"] += stats["saved_tokens"]
+    return trimmed_cv, trimmed_offer, stats
+
+
+def stats():
+    """Totaux depuis le démarrage du processus"""
+    with _stats_lock:
+        return dict(_totals)
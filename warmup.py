@@ -0,0 +1,135 @@
+"""
+Préchauffage de l'API au démarrage : la première lettre d'un nouveau worker (ou d'une
+réplique ajoutée) doit être servie aussi vite que les suivantes.
+
+Pendant le démarrage, en tâche de fond :
+- les profils de langue sont chargés et une première détection est faite,
+- une lettre PDF est rendue (polices FPDF, largeurs des glyphes, gabarit) puis relue
+  avec PyMuPDF, dans chaque processus du pool si WORKER_PROCESSES > 0,
+- le modèle est chargé côté serveur (requête vide Ollama avec keep_alive).
+
+/health répond dès le lancement (avec "ready") ; /ready répond 503 tant que le
+préchauffage n'est pas terminé, pour que le répartiteur de charge attende.
+Une étape en échec (polices, processus...) est signalée mais ne bloque pas l'API ; seul
+le chargement du modèle (WARMUP_LLM) est requis : il est retenté toutes les
+WARMUP_RETRY_INTERVAL secondes et /ready reste à 503 tant qu'il échoue.
+
+Configuration :
+- WARMUP_LLM : "1" (défaut) pour charger le modèle au démarrage
+- WARMUP_RETRY_INTERVAL : délai (s) avant de retenter le chargement du modèle, défaut 5
+- LLM_KEEP_WARM_INTERVAL : intervalle (s) entre deux requêtes de maintien du modèle
+  en mémoire, 0 (défaut) = désactivé
+"""
+import asyncio
+import os
+import threading
+import time
+
+from generateur_lettre_pdf import generer_pdf_lettre
+from language_id import identify_language, preload as preload_languages
+from llm_backend import LLMError, preload_model
+from metrics import stage
+from parser_cv import extract_cv_document
+from worker_pool import WORKER_PROCESSES, get_process_pool, run_blocking
+
+WARMUP_LLM = os.environ.get("WARMUP_LLM", "1") == "1"
+WARMUP_RETRY_INTERVAL = float(os.environ.get("WARMUP_RETRY_INTERVAL", "5"))
+LLM_KEEP_WARM_INTERVAL = float(os.environ.get("LLM_KEEP_WARM_INTERVAL", "0"))
+
+SAMPLE_OFFER = "Nous recherchons un développeur Python pour rejoindre notre équipe à Lyon."
+SAMPLE_LETTER = (
+    "Je me permets de vous adresser ma candidature pour ce poste.\n\n"
+    "Mon expérience correspond aux compétences décrites dans votre offre."
+)
+SAMPLE_PROFILE = {"name": "Camille Martin", "phone": "+33 6 12 34 56 78", "email": "camille@example.com"}
+
+_lock = threading.Lock()
+_state = {"ready": False, "started": None, "duration": None, "steps": {}}
+
+
+def warm_languages():
+    preload_languages()
+    identify_language(SAMPLE_OFFER)
+
+
+def warm_documents():
+    """Rend une lettre puis la relit : polices et caches du PDF, PyMuPDF"""
+    pdf = generer_pdf_lettre(SAMPLE_LETTER, "fr", SAMPLE_PROFILE)
+    extract_cv_document(pdf)
+    return os.getpid()
+
+
+def warm_llm():
+    preload_model()
+
+
+def _run_step(name, fn):
+    """Exécute une étape et note sa durée ou son erreur"""
+    started = time.perf_counter()
+    error = None
+    try:
+        with stage(f"warmup_{name}"):
+            fn()
+    except Exception as e:
+        error = str(e)
+        print(f"⚠️  Préchauffage « {name} » échoué: {e}")
+    with _lock:
+        _state["steps"][name] = {"seconds": round(time.perf_counter() - started, 3), "error": error}
+    return error is None
+
+
+def warm_processes():
+    """Une tâche par processus du pool, soumises ensemble : tous démarrent et chargent leurs modules"""
+    futures = [get_process_pool().submit(warm_documents) for _ in range(WORKER_PROCESSES)]
+    pids = {future.result() for future in futures}
+    if len(pids) < WORKER_PROCESSES:
+        print(f"   ℹ️  {len(pids)}/{WORKER_PROCESSES} processus préchauffés")
+
+
+async def warm_up():
+    """Préchauffe tout en parallèle puis marque l'API prête"""
+    started = time.perf_counter()
+    with _lock:
+        _state.update(ready=False, started=time.time(), duration=None, steps={})
+
+    steps = [run_blocking(_run_step, "languages", warm_languages),
+             run_blocking(_run_step, "documents", warm_documents)]
+    if WORKER_PROCESSES > 0:
+        steps.append(run_blocking(_run_step, "processes", warm_processes))
+    if WARMUP_LLM:
+        steps.append(run_blocking(_run_step, "llm", warm_llm))
+    results = await asyncio.gather(*steps)
+
+    # Sans modèle chargé, la première lettre ne serait pas servie à pleine vitesse (ni
+    # servie du tout) : l'API n'est pas prête tant que le chargement échoue
+    llm_ok = results[-1] if WARMUP_LLM else True
+    while not llm_ok:
+        print(f"   ⏳ Modèle non chargé, nouvel essai dans {WARMUP_RETRY_INTERVAL:g} s")
+        await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+        llm_ok = await run_blocking(_run_step, "llm", warm_llm)
+
+    duration = time.perf_counter() - started
+    with _lock:
+        _state.update(ready=True, duration=round(duration, 3))
+    print(f"✅ API prête en {duration:.2f} s")
+
+
+async def keep_warm(interval=LLM_KEEP_WARM_INTERVAL):
+    """Renvoie régulièrement la requête de chargement pour que le modèle reste en mémoire"""
+    while interval > 0:
+        await asyncio.sleep(interval)
+        try:
+            await run_blocking(preload_model)
+        except LLMError as e:
+            print(f"⚠️  Maintien du modèle en mémoire échoué: {e}")
+
+
+def is_ready():
+    with _lock:
+        return _state["ready"]
+
+
+def status():
+    """État du préchauffage : prêt ou non, durée totale et durée (ou erreur) de chaque étape"""
+    with _lock:
+        return {**_state, "steps": {name: dict(step) for name, step in _state["steps"].items()}}
@@ -0,0 +1,271 @@
+"""
+Pools d'exécution pour les étapes bloquantes de la génération de lettre.
+
+Les endpoints FastAPI sont asynchrones : le parsing PyMuPDF, la détection de langue,
+l'appel au LLM et le rendu FPDF sont déportés dans des pools pour ne pas bloquer la
+boucle d'événements (et donc /health, /cv/list...).
+
+Configuration par variables d'environnement :
+- WORKER_THREADS : taille du pool de threads (I/O, appels LLM), défaut 8
+- WORKER_PROCESSES : taille du pool de processus pour le CPU (PDF), 0 = utiliser les threads
+
+Le limiteur partagé des générations LLM (llm_limiter) est construit dans llm_limits.py.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from metrics import llm_rejected, record_stage, stage
+
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "8"))
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "0"))
+
+# Éléments produits d'avance par iterate_blocking (morceaux de texte, de ZIP)
+ITERATE_BUFFER = 4
+
+
+class QueueFullError(Exception):
+    """File d'attente pleine : la requête doit être refusée immédiatement"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Serveur saturé, réessayer dans {retry_after} s")
+        self.retry_after = retry_after
+
+
+_thread_pool = None
+_process_pool = None
+_pools_lock = threading.Lock()
+
+
+def get_thread_pool():
+    global _thread_pool
+    with _pools_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="worker")
+        return _thread_pool
+
+
+def get_process_pool():
+    """Pool de processus pour le CPU, ou le pool de threads si WORKER_PROCESSES vaut 0"""
+    global _process_pool
+    if WORKER_PROCESSES <= 0:
+        return get_thread_pool()
+    with _pools_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=WORKER_PROCESSES)
+        return _process_pool
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Exécute une fonction bloquante (I/O, réseau) dans le pool de threads"""
+    loop = asyncio.get_running_loop()
+    # Le contexte suit la fonction : ses étapes comptent dans le Server-Timing de la requête
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_thread_pool(), functools.partial(context.run, fn, *args, **kwargs))
+
+
+def _parent_stage(fn):
+    """Les mesures prises dans un processus fils sont perdues : l'étape est chronométrée ici"""
+    name = getattr(fn, "stage_name", None)
+    return stage(name) if name else contextlib.nullcontext()
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Exécute une fonction coûteuse en CPU dans le pool de processus"""
+    if WORKER_PROCESSES <= 0:
+        return await run_blocking(fn, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    with _parent_stage(fn):
+        return await loop.run_in_executor(get_process_pool(), functools.partial(fn, *args, **kwargs))
+
+
+def call_cpu(fn, *args, **kwargs):
+    """
+    Équivalent synchrone de run_cpu pour le code déjà dans un thread (jobs, lots, cache) :
+    pool de processus s'il est configuré, sinon appel direct dans le thread courant
+    (attendre le pool de threads depuis l'un de ses threads pourrait le bloquer)
+    """
+    if WORKER_PROCESSES <= 0:
+        return fn(*args, **kwargs)
+    with _parent_stage(fn):
+        return get_process_pool().submit(fn, *args, **kwargs).result()
+
+
+async def iterate_blocking(fn, *args, executor=None, buffer=ITERATE_BUFFER, **kwargs):
+    """
+    Consomme un générateur bloquant dans le pool de threads (ou `executor`) et produit
+    ses éléments de façon asynchrone. Si le consommateur s'arrête, le générateur est fermé.
+    Au plus `buffer` éléments attendent d'être consommés : un client lent fait attendre
+    le générateur au lieu de tout accumuler en mémoire.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    credits = threading.Semaphore(buffer)
+    stop = threading.Event()
+    end = object()
+
+    def produce():
+        iterator = fn(*args, **kwargs)
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    break
+                credits.acquire()
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+            loop.call_soon_threadsafe(queue.put_nowait, (end, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (end, e))
+        finally:
+            iterator.close()
+
+    future = loop.run_in_executor(executor or get_thread_pool(), contextvars.copy_context().run, produce)
+    try:
+        while True:
+            item, error = await queue.get()
+            credits.release()
+            if error is not None:
+                raise error
+            if item is end:
+                break
+            yield item
+    finally:
+        stop.set()
+        # Débloque le générateur s'il attendait une place : il voit `stop` et s'arrête
+        credits.release()
+        await asyncio.shield(future)
+
+
+class SingleFlight:
+    """
+    Regroupe les appels simultanés portant sur la même clé : le premier exécute
+    le travail, les suivants attendent et reçoivent le même résultat.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    async def run(self, key, produce):
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await produce()
+        except BaseException as e:
+            future.set_exception(e)
+            # Évite l'avertissement "exception never retrieved" quand personne n'attendait
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+
+class ConcurrencyLimiter:
+    """
+    Limite le nombre de tâches simultanées avec une file d'attente bornée.
+    Au-delà de max_concurrent + max_queue, lève QueueFullError sans attendre.
+
+    slot() est l'admission des requêtes de l'API (asynchrone, refus rapide) ; generation()
+    est la place réelle prise dans le thread qui appelle le modèle, partagée par l'API,
+    les workers de jobs et les lots : au plus max_concurrent générations en tout.
+    """
+
+    def __init__(self, max_concurrent, max_queue):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.avg_duration = None
+        self._semaphore = None
+        self._loop = None
+        self._capacity = threading.BoundedSemaphore(max_concurrent)
+        self._counts_lock = threading.Lock()
+        self.generating = 0
+        self.blocked = 0
+
+    def _get_semaphore(self):
+        # Le sémaphore est lié à la boucle d'événements qui l'utilise
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+        return self._semaphore
+
+    def retry_after(self):
+        """Estimation du délai avant qu'une place se libère (secondes)"""
+        duration = self.avg_duration or 10.0
+        return max(1, math.ceil(duration * (self.waiting + 1) / self.max_concurrent))
+
+    def check(self):
+        """Refuse immédiatement si la file d'attente est déjà pleine (jobs et lots compris)"""
+        busy = max(self.in_flight, self.generating)
+        if busy >= self.max_concurrent and self.waiting + self.blocked >= self.max_queue:
+            self.rejected += 1
+            llm_rejected.inc()
+            raise QueueFullError(self.retry_after())
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Attend une place libre (ou lève QueueFullError si la file est pleine)"""
+        self.check()
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        waited = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            record_stage("llm_queue_wait", time.perf_counter() - waited)
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            self.avg_duration = duration if self.avg_duration is None else 0.8 * self.avg_duration + 0.2 * duration
+            self.in_flight -= 1
+            semaphore.release()
+
+    @contextlib.contextmanager
+    def generation(self):
+        """Place de génération côté thread : attend qu'un appel au modèle se termine si besoin"""
+        with self._counts_lock:
+            self.blocked += 1
+        waited = time.perf_counter()
+        try:
+            self._capacity.acquire()
+        finally:
+            with self._counts_lock:
+                self.blocked -= 1
+        record_stage("llm_capacity_wait", time.perf_counter() - waited)
+        with self._counts_lock:
+            self.generating += 1
+        try:
+            yield
+        finally:
+            with self._counts_lock:
+                self.generating -= 1
+            self._capacity.release()
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "generating": self.generating,
+            "blocked": self.blocked,
+            "rejected": self.rejected,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+        }